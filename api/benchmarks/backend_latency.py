@@ -0,0 +1,108 @@
+"""
+Compare query latency of the DuckDB mart snapshots against BigQuery.
+
+Runs a fixed set of LLM-style BigQuery queries through both execution
+backends and prints per-query p50/p95/mean latency. BigQuery is skipped
+unless --bigquery is passed (it needs GCP credentials and bills the project).
+
+Usage (from the api/ directory):
+    python benchmarks/backend_latency.py --marts-dir ../exports/marts --runs 20
+    python benchmarks/backend_latency.py --bigquery --runs 5
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from duckdb_backend import DuckDBBackend, DUCKDB_MARTS_DIR  # noqa: E402
+from sql_utils import referenced_tables  # noqa: E402
+
+DATASET = "semantic-layer-484020.retail_marts_dev"
+
+QUERIES = {
+    "daily_revenue_30d": f"""
+        SELECT order_date, total_revenue, total_orders
+        FROM `{DATASET}.fct_daily_revenue`
+        WHERE order_date >= DATE_SUB(CURRENT_DATE(), INTERVAL 30 DAY)
+        ORDER BY order_date
+    """,
+    "monthly_margin": f"""
+        SELECT DATE_TRUNC(order_date, MONTH) AS month,
+               SUM(total_revenue) AS revenue,
+               SAFE_DIVIDE(SUM(total_profit), SUM(total_revenue)) AS margin
+        FROM `{DATASET}.fct_daily_revenue`
+        GROUP BY 1
+        ORDER BY 1
+    """,
+    "rfm_segments": f"""
+        SELECT rfm_segment, COUNT(*) AS customers, AVG(monetary) AS avg_monetary,
+               COUNTIF(recency_days > 180) AS dormant
+        FROM `{DATASET}.fct_rfm_scores`
+        GROUP BY rfm_segment
+        ORDER BY customers DESC
+    """,
+    "top_products": f"""
+        SELECT product_name, category, total_revenue
+        FROM `{DATASET}.fct_product_performance`
+        ORDER BY total_revenue DESC
+        LIMIT 10
+    """,
+}
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def time_runs(run, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - started) * 1000)
+    return samples
+
+
+def report(backend, name, samples):
+    print(
+        f"{backend:<10} {name:<20} "
+        f"p50={percentile(samples, 50):8.1f}ms  p95={percentile(samples, 95):8.1f}ms  "
+        f"mean={statistics.mean(samples):8.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--marts-dir", default=DUCKDB_MARTS_DIR, help="Directory of mart Parquet snapshots")
+    parser.add_argument("--runs", type=int, default=20, help="Timed runs per query and backend")
+    parser.add_argument("--bigquery", action="store_true", help="Also run the queries on BigQuery")
+    args = parser.parse_args()
+
+    duck = DuckDBBackend(args.marts_dir)
+    bq = None
+    if args.bigquery:
+        from google.cloud import bigquery
+        bq = bigquery.Client(project=os.environ.get("GCP_PROJECT_ID", "semantic-layer-484020"))
+
+    for name, sql in QUERIES.items():
+        missing = [t for t in referenced_tables(sql) if t not in duck.tables]
+        if missing:
+            print(f"{'duckdb':<10} {name:<20} skipped (no snapshot for {', '.join(missing)})")
+        else:
+            duck.execute(sql)  # warm up file metadata and the Parquet footer cache
+            report("duckdb", name, time_runs(lambda: duck.execute(sql), args.runs))
+
+        if bq is not None:
+            config = {"use_query_cache": False}
+            run = lambda: list(bq.query(sql, job_config=bigquery.QueryJobConfig(**config)).result())  # noqa: E731
+            report("bigquery", name, time_runs(run, args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,468 @@
+"""
+Local stand-ins for Gemini, Cube and BigQuery used by the load test.
+
+Each fake draws its latency from a seeded log-normal distribution and fails
+a configurable fraction of calls, so runs are repeatable:
+
+- FakeGemini answers generate_content_async() with canned generate_sql
+  JSON, chosen from the question in the prompt.
+- CubeStub is a real HTTP server (stdlib, own thread) serving /readyz,
+  /cubejs-api/v1/meta (from the Cube YAML model) and /cubejs-api/v1/load
+  (synthetic rows shaped like the query).
+- FakeBigQuery implements the slice of google.cloud.bigquery.Client the API
+  uses (query, dry runs, job polling, paging) on top of DuckDBBackend, over
+  real mart snapshots or generated ones.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import logging
+import threading
+import datetime
+from dataclasses import dataclass
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, List, Dict, Any
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from duckdb_backend import DuckDBBackend, DUCKDB_AVAILABLE  # noqa: E402
+from sql_utils import referenced_tables  # noqa: E402
+from intent_matcher import CUBE_MODEL_DIR  # noqa: E402
+from cube_schema import load_model_meta  # noqa: E402
+
+if DUCKDB_AVAILABLE:
+    import duckdb
+
+logger = logging.getLogger(__name__)
+
+DATASET = "semantic-layer-484020.retail_marts_dev"
+
+
+@dataclass
+class Latency:
+    """Log-normal latency around a median plus an error rate; parsed from "median_ms[:sigma[:error_rate]]"."""
+    median_ms: float
+    sigma: float = 0.3
+    error_rate: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "Latency":
+        parts = [float(p) for p in spec.split(":")]
+        return cls(*parts)
+
+    def sample(self, rng: random.Random) -> float:
+        """Seconds for one call."""
+        return self.median_ms * math.exp(self.sigma * rng.gauss(0, 1)) / 1000
+
+    def fails(self, rng: random.Random) -> bool:
+        return rng.random() < self.error_rate
+
+
+class _Seeded:
+    """Thread-safe seeded draws shared by the calls of one fake."""
+
+    def __init__(self, latency: Latency, seed: int):
+        self.latency = latency
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> tuple:
+        with self._lock:
+            return self.latency.sample(self._rng), self.latency.fails(self._rng)
+
+
+# ============================================================================
+# Gemini
+# ============================================================================
+
+def _sql_answer(intent: str, table: str, sql: str) -> Dict[str, Any]:
+    return {
+        "intent": intent,
+        "route": "bigquery",
+        "cube_query": None,
+        "sql": sql.format(dataset=DATASET),
+        "table": table,
+        "explanation": "canned benchmark answer"
+    }
+
+
+def _cube_answer(
+    intent: str,
+    measures: List[str],
+    dimensions: List[str],
+    time_dimensions: List[dict],
+    table: Optional[str] = None,
+    sql: Optional[str] = None
+) -> Dict[str, Any]:
+    # sql is the equivalent query used when ROUTE_HEDGING falls back to or races BigQuery
+    return {
+        "intent": intent,
+        "route": "cube",
+        "cube_query": {"measures": measures, "dimensions": dimensions, "timeDimensions": time_dimensions, "filters": []},
+        "sql": sql.format(dataset=DATASET) if sql else None,
+        "table": table,
+        "explanation": "canned benchmark answer"
+    }
+
+
+# Questions the /ask workload sends, with the JSON Gemini would return for each
+CANNED_ANSWERS: Dict[str, Dict[str, Any]] = {
+    "Which products have the highest return rate?": _sql_answer(
+        "analyze_product_returns", "fct_product_performance",
+        "SELECT product_name, return_rate, total_units_sold FROM `{dataset}.fct_product_performance` "
+        "WHERE total_units_sold > 10 ORDER BY return_rate DESC LIMIT 10"
+    ),
+    "Which customers are in the Champions segment?": _sql_answer(
+        "segmentation_list", "fct_rfm_scores",
+        "SELECT user_id, recency_days, frequency, monetary, rfm_segment FROM `{dataset}.fct_rfm_scores` "
+        "WHERE rfm_segment = 'Champions' LIMIT 100"
+    ),
+    "Show me monthly revenue growth": _sql_answer(
+        "monthly_growth", "fct_monthly_revenue",
+        "SELECT order_month, total_revenue, mom_growth_pct, yoy_growth_pct FROM `{dataset}.fct_monthly_revenue` "
+        "ORDER BY order_month DESC LIMIT 12"
+    ),
+    "What was revenue per month from orders this year?": _sql_answer(
+        "monthly_revenue_from_orders", "fct_orders",
+        "SELECT DATE_TRUNC(order_date, MONTH) AS month, SUM(total_revenue) AS revenue, COUNT(*) AS orders "
+        "FROM `{dataset}.fct_orders` WHERE EXTRACT(YEAR FROM order_date) = EXTRACT(YEAR FROM CURRENT_DATE()) "
+        "GROUP BY 1 ORDER BY 1"
+    ),
+    "Which categories make the most profit?": _sql_answer(
+        "category_profit", "fct_product_performance",
+        "SELECT category, SUM(total_profit) AS profit FROM `{dataset}.fct_product_performance` "
+        "GROUP BY category ORDER BY profit DESC LIMIT 10"
+    ),
+    "Show revenue and orders for the last 90 days by day": _cube_answer(
+        "daily_revenue_90d", ["orders.total_revenue", "orders.count"], [],
+        [{"dimension": "orders.order_date", "granularity": "day", "dateRange": "last 90 days"}],
+        "fct_daily_revenue",
+        "SELECT order_date, total_revenue, total_orders FROM `{dataset}.fct_daily_revenue` "
+        "WHERE order_date >= DATE_SUB(CURRENT_DATE(), INTERVAL 90 DAY) ORDER BY order_date"
+    ),
+    "Average order value by country and status": _cube_answer(
+        "aov_by_country_status", ["orders.avg_order_value"], ["orders.country", "orders.status"], []
+    ),
+}
+
+
+class _Usage:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+
+
+class _GeminiResponse:
+    def __init__(self, text: str, prompt: str):
+        self.text = text
+        self.usage_metadata = _Usage(len(prompt) // 4, len(text) // 4)
+
+
+class _GeminiChunk:
+    def __init__(self, text: str, usage: Optional[_Usage] = None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class FakeGemini:
+    """Deterministic stand-in for vertexai GenerativeModel."""
+
+    FIRST_TOKEN_SHARE = 0.33
+    CHUNK_CHARS = 48
+
+    def __init__(self, latency: Latency, seed: int = 0, answers: Dict[str, Dict[str, Any]] = CANNED_ANSWERS):
+        self.answers = answers
+        self._draws = _Seeded(latency, seed)
+        self.calls = 0
+
+    def _answer(self, prompt: str) -> Dict[str, Any]:
+        marker = "User question:"
+        question = prompt[prompt.rfind(marker) + len(marker):].strip().splitlines()[0].strip() if marker in prompt else ""
+        if question in self.answers:
+            return self.answers[question]
+        return {"intent": "error", "route": "bigquery", "sql": "", "explanation": f"no canned answer for {question!r}"}
+
+    async def generate_content_async(self, prompt: str, generation_config=None, stream: bool = False):
+        self.calls += 1
+        delay, fail = self._draws.draw()
+        text = json.dumps(self._answer(prompt), indent=2)
+        if stream:
+            return self._stream(text, prompt, delay, fail)
+        await asyncio.sleep(delay)
+        if fail:
+            raise RuntimeError("simulated Gemini error (503 UNAVAILABLE)")
+        return _GeminiResponse(text, prompt)
+
+    async def _stream(self, text: str, prompt: str, delay: float, fail: bool):
+        # the first token arrives after a third of the latency, the rest is decoded evenly
+        await asyncio.sleep(delay * self.FIRST_TOKEN_SHARE)
+        if fail:
+            raise RuntimeError("simulated Gemini error (503 UNAVAILABLE)")
+        pieces = [text[i:i + self.CHUNK_CHARS] for i in range(0, len(text), self.CHUNK_CHARS)]
+        for piece in pieces:
+            yield _GeminiChunk(piece)
+            await asyncio.sleep(delay * (1 - self.FIRST_TOKEN_SHARE) / len(pieces))
+        yield _GeminiChunk("", _GeminiResponse(text, prompt).usage_metadata)
+
+
+# ============================================================================
+# Cube
+# ============================================================================
+
+def synthetic_cube_rows(query: Dict[str, Any], rng: random.Random) -> List[Dict[str, Any]]:
+    """Rows shaped like Cube's /load response for a query: one per time bucket x dimension value."""
+    buckets = [None]
+    time_keys = []
+    for td in query.get("timeDimensions") or []:
+        granularity = td.get("granularity")
+        if not granularity:
+            continue
+        days = {"day": 1, "week": 7, "month": 30, "quarter": 91, "year": 365}.get(granularity, 1)
+        date_range = str(td.get("dateRange", "last 30 days"))
+        span = int("".join(c for c in date_range if c.isdigit()) or 30)
+        count = max(1, min(366, span // days if "day" in date_range else span))
+        today = datetime.date.today()
+        buckets = [(today - datetime.timedelta(days=i * days)).isoformat() + "T00:00:00.000" for i in range(count)]
+        time_keys = [f"{td['dimension']}.{granularity}", td["dimension"]]
+        break
+
+    dimension_values = [[]]
+    for dimension in query.get("dimensions") or []:
+        values = [f"{dimension.split('.')[-1]}_{i}" for i in range(5)]
+        dimension_values = [combo + [(dimension, v)] for combo in dimension_values for v in values]
+
+    rows = []
+    for bucket in buckets:
+        for combo in dimension_values:
+            row = {key: bucket for key in time_keys} if bucket else {}
+            row.update(dict(combo))
+            for measure in query.get("measures", []):
+                row[measure] = str(round(rng.uniform(100, 100000), 2))
+            rows.append(row)
+    return rows[:int(query.get("limit") or 10000)]
+
+
+class CubeStub:
+    """Cube REST API stand-in on 127.0.0.1; run() starts it in a daemon thread."""
+
+    def __init__(self, latency: Latency, seed: int = 0, port: int = 0, model_dir: str = CUBE_MODEL_DIR):
+        self.meta = load_model_meta(model_dir)
+        self._draws = _Seeded(latency, seed)
+        self._rows_rng = random.Random(seed)
+        self._rows_lock = threading.Lock()
+        self.requests = {"readyz": 0, "meta": 0, "load": 0, "errors": 0}
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, payload: Dict[str, Any]):
+                body = json.dumps(payload).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the API cancelled the request, e.g. a hedged Cube attempt that lost
+
+            def _simulate(self, kind: str) -> bool:
+                stub.requests[kind] += 1
+                delay, fail = stub._draws.draw()
+                time.sleep(delay)
+                if fail:
+                    stub.requests["errors"] += 1
+                    self._send(503, {"error": "simulated Cube error"})
+                return not fail
+
+            def do_GET(self):
+                if self.path.startswith("/readyz"):
+                    stub.requests["readyz"] += 1
+                    self._send(200, {"health": "HEALTH"})
+                elif self.path.startswith("/cubejs-api/v1/meta"):
+                    if self._simulate("meta"):
+                        self._send(200, stub.meta)
+                else:
+                    self._send(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.startswith("/cubejs-api/v1/load"):
+                    self._send(404, {"error": "not found"})
+                elif self._simulate("load"):
+                    query = body.get("query", {})
+                    with stub._rows_lock:
+                        rows = synthetic_cube_rows(query, stub._rows_rng)
+                    self._send(200, {"query": query, "data": rows, "annotation": {"measures": {}, "dimensions": {}}})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.api_url = f"http://127.0.0.1:{self.port}/cubejs-api/v1"
+
+    def run(self) -> "CubeStub":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        logger.info(f"Cube stub listening on {self.api_url}")
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# ============================================================================
+# BigQuery
+# ============================================================================
+
+def write_synthetic_marts(marts_dir: str, days: int = 730, orders_per_day: int = 200,
+                          products: int = 2000, users: int = 20000) -> str:
+    """Generate deterministic Parquet stand-ins for the marts the canned SQL reads."""
+    os.makedirs(marts_dir, exist_ok=True)
+    conn = duckdb.connect(":memory:")
+    tables = {
+        "fct_orders": f"""
+            select i as order_id, hash(i, 'u') % {users} as user_id,
+                   current_date - cast(i // {orders_per_day} as integer) as order_date,
+                   ['Complete', 'Shipped', 'Processing', 'Returned', 'Cancelled'][1 + (hash(i, 's') % 5)::integer] as order_status,
+                   round(20 + hash(i, 'r') % 30000 / 100.0, 2) as total_revenue,
+                   round(5 + hash(i, 'p') % 10000 / 100.0, 2) as total_profit,
+                   1 + hash(i, 'n') % 4 as item_count
+            from range({days * orders_per_day}) t(i)
+        """,
+        "fct_daily_revenue": """
+            select order_date, count(*) as total_orders, sum(item_count) as total_items,
+                   sum(total_revenue) as total_revenue, sum(total_profit) as total_profit,
+                   count(distinct user_id) as unique_customers, count(distinct user_id) // 10 as new_customers,
+                   sum(total_revenue) / count(*) as avg_order_value,
+                   count(*) filter (where order_status = 'Returned') as orders_returned,
+                   count(*) filter (where order_status = 'Cancelled') as orders_cancelled,
+                   count(*) filter (where order_status = 'Returned') / count(*) as return_rate
+            from fct_orders group by 1
+        """,
+        "fct_monthly_revenue": """
+            select date_trunc('month', order_date)::date as order_month, sum(total_orders) as total_orders,
+                   sum(total_revenue) as total_revenue, sum(total_profit) as total_profit,
+                   sum(new_customers) as new_customers, count(*) as active_days,
+                   0.05 as mom_growth_pct, 0.12 as yoy_growth_pct
+            from fct_daily_revenue group by 1
+        """,
+        "fct_product_performance": f"""
+            select i as product_id, 'Product ' || i as product_name,
+                   'Category ' || (hash(i, 'c') % 25) as category, 'Brand ' || (hash(i, 'b') % 300) as brand,
+                   ['Men', 'Women'][1 + (hash(i, 'd') % 2)::integer] as department,
+                   hash(i, 'u') % 500 as total_units_sold, round(hash(i, 'r') % 5000000 / 100.0, 2) as total_revenue,
+                   round(hash(i, 'p') % 2000000 / 100.0, 2) as total_profit, hash(i, 'x') % 100 / 1000.0 as return_rate
+            from range({products}) t(i)
+        """,
+        "fct_category_performance": """
+            select category, department, date_trunc('month', current_date)::date as order_month,
+                   sum(total_units_sold) as total_units_sold, sum(total_revenue) as total_revenue,
+                   sum(total_profit) as total_profit, sum(total_units_sold * return_rate)::bigint as items_returned,
+                   avg(return_rate) as return_rate
+            from fct_product_performance group by 1, 2, 3
+        """,
+        "fct_rfm_scores": f"""
+            select i as user_id, hash(i, 'r') % 720 as recency_days, 1 + hash(i, 'f') % 12 as frequency,
+                   round(hash(i, 'm') % 500000 / 100.0, 2) as monetary,
+                   ['Champions', 'Loyal Customers', 'At Risk', 'Lost', 'Promising'][1 + (hash(i, 's') % 5)::integer] as rfm_segment
+            from range({users}) t(i)
+        """,
+    }
+    for name, sql in tables.items():
+        conn.execute(f"create table {name} as {sql}")
+        conn.execute(f"copy {name} to '{os.path.join(marts_dir, name + '.parquet')}' (format parquet)")
+    conn.close()
+    return marts_dir
+
+
+class _TableRef:
+    def __init__(self, table: str):
+        self.project, self.dataset_id = DATASET.split(".")
+        self.table_id = table
+
+
+class _RowIterator:
+    def __init__(self, rows: List[dict], page_size: Optional[int], start: int = 0, max_results: Optional[int] = None):
+        end = len(rows) if max_results is None else start + max_results
+        self._rows = rows[start:end]
+        self.total_rows = len(rows)
+        self._page_size = page_size or len(self._rows) or 1
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    @property
+    def pages(self):
+        for offset in range(0, len(self._rows), self._page_size):
+            yield self._rows[offset:offset + self._page_size]
+
+
+class FakeJob:
+    def __init__(self, client: "FakeBigQuery", sql: str, delay: float, fail: bool, dry_run: bool):
+        self.job_id = f"bench_{uuid.uuid4().hex}"
+        self.location = "US"
+        self.destination = self.job_id
+        self._client = client
+        self._sql = sql
+        self._ready_at = time.monotonic() + (0 if dry_run else delay)
+        self._fail = fail
+        self._rows: Optional[List[dict]] = None
+        self.total_bytes_processed = client.backend.estimate_bytes(sql) if dry_run else None
+        self.referenced_tables = [_TableRef(t) for t in referenced_tables(sql)]
+
+    def done(self) -> bool:
+        return time.monotonic() >= self._ready_at
+
+    def cancel(self) -> bool:
+        self._client.cancelled += 1
+        self._fail = True
+        self._ready_at = time.monotonic()
+        return True
+
+    def rows(self) -> List[dict]:
+        if self._fail:
+            raise RuntimeError("simulated BigQuery error (backendError)")
+        if self._rows is None:
+            self._rows = self._client.backend.execute(self._sql).rows
+        return self._rows
+
+    def result(self, page_size: Optional[int] = None) -> _RowIterator:
+        while not self.done():
+            time.sleep(0.005)
+        return _RowIterator(self.rows(), page_size)
+
+
+class FakeBigQuery:
+    """google.cloud.bigquery.Client stand-in running queries on DuckDB after a simulated job latency."""
+
+    def __init__(self, marts_dir: str, latency: Latency, seed: int = 0):
+        self.backend = DuckDBBackend(marts_dir, mmap_snapshots=False)
+        self._draws = _Seeded(latency, seed)
+        self._jobs: Dict[str, FakeJob] = {}
+        self.cancelled = 0
+        self.project = DATASET.split(".")[0]
+
+    def query(self, sql: str, job_config=None) -> FakeJob:
+        dry_run = bool(getattr(job_config, "dry_run", False))
+        delay, fail = (0.0, False) if dry_run else self._draws.draw()
+        job = FakeJob(self, sql, delay, fail, dry_run)
+        if not dry_run:
+            self._jobs[job.job_id] = job
+        return job
+
+    def get_job(self, job_id: str, location: Optional[str] = None) -> FakeJob:
+        return self._jobs[job_id]
+
+    def list_rows(self, destination: str, start_index: int = 0, max_results: Optional[int] = None) -> _RowIterator:
+        return _RowIterator(self._jobs[destination].rows(), None, start_index, max_results)
@@ -0,0 +1,212 @@
+"""
+Offline load test of the API against fake Gemini, Cube and BigQuery backends.
+
+Starts a Cube HTTP stub, swaps the Gemini and BigQuery clients for the
+fakes in fakes.py (BigQuery runs on DuckDB over generated or real mart
+snapshots) and drives /ask, /cube/query and /cube/metrics/* in-process at
+the requested concurrency. Prints throughput, error rate and p50/p95/p99
+per scenario, then the per-stage breakdown from /stats. No GCP access is
+needed.
+
+Backend latency is "median_ms[:sigma[:error_rate]]" (log-normal).
+--save writes the results as JSON; --baseline compares p95 against a saved
+run and exits non-zero when a scenario regressed by more than --tolerance.
+
+Usage (from the api/ directory):
+    python benchmarks/load_test.py --concurrency 32 --requests 500
+    python benchmarks/load_test.py --scenarios ask --llm-latency 1500:0.4:0.02 --bq-latency 800
+    python benchmarks/load_test.py --scenarios ask --route-hedging parallel --cube-latency 200:1.0:0.1
+    python benchmarks/load_test.py --save bench.json
+    python benchmarks/load_test.py --baseline bench.json --tolerance 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import statistics
+from typing import List, Dict, Any, Callable
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from backend_latency import percentile  # noqa: E402
+from fakes import Latency, FakeGemini, FakeBigQuery, CubeStub, CANNED_ANSWERS, write_synthetic_marts  # noqa: E402
+
+SCENARIOS = ("ask", "cube_query", "cube_metrics")
+
+CUBE_QUERIES = [
+    {"measures": ["orders.total_revenue", "orders.count"], "dimensions": ["orders.country"]},
+    {"measures": ["orders.total_revenue"],
+     "time_dimensions": [{"dimension": "orders.order_date", "granularity": "day", "dateRange": "last 30 days"}]},
+    {"measures": ["orders.avg_order_value"], "dimensions": ["orders.status"]},
+    {"measures": ["users.count"], "dimensions": ["users.country"], "limit": 50},
+]
+
+CUBE_METRIC_PATHS = [
+    "/cube/metrics/revenue/daily?days=30",
+    "/cube/metrics/revenue/by-country",
+    "/cube/metrics/orders",
+    "/cube/metrics/orders/by-status",
+    "/cube/metrics/users",
+]
+
+
+def scenario_requests(name: str, rng: random.Random) -> Callable[[], tuple]:
+    """A factory of (method, path, json body) for one scenario."""
+    questions = list(CANNED_ANSWERS)
+    if name == "ask":
+        return lambda: ("POST", "/ask", {"query": rng.choice(questions)})
+    if name == "cube_query":
+        return lambda: ("POST", "/cube/query", rng.choice(CUBE_QUERIES))
+    return lambda: ("GET", rng.choice(CUBE_METRIC_PATHS), None)
+
+
+async def drive(client, name: str, total: int, concurrency: int, seed: int) -> Dict[str, Any]:
+    """Send `total` requests from `concurrency` workers; return latency and error statistics."""
+    make_request = scenario_requests(name, random.Random(seed))
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            method, path, body = make_request()
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                failed = response.status_code >= 400 or (path == "/ask" and response.json().get("error"))
+                key = str(response.status_code) if response.status_code >= 400 else "answer_error"
+            except Exception as e:
+                failed, key = True, type(e).__name__
+            latencies.append((time.perf_counter() - started) * 1000)
+            if failed:
+                errors[key] = errors.get(key, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "error_rate": round(sum(errors.values()) / len(latencies), 4) if latencies else 0.0,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "mean_ms": round(statistics.mean(latencies), 1),
+    }
+
+
+def report(results: Dict[str, Dict[str, Any]], stages: Dict[str, Any]):
+    print(f"\n{'scenario':<14} {'requests':>8} {'rps':>8} {'errors':>7} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, r in results.items():
+        print(
+            f"{name:<14} {r['requests']:>8} {r['throughput_rps']:>8.1f} {r['error_rate']:>7.1%} "
+            f"{r['p50_ms']:>7.1f}ms {r['p95_ms']:>7.1f}ms {r['p99_ms']:>7.1f}ms"
+        )
+    if stages:
+        print(f"\n{'stage':<18} {'count':>7} {'mean':>10} {'max':>10}")
+        for name, s in stages.items():
+            print(f"{name:<18} {s['count']:>7} {s['mean_ms']:>8.1f}ms {s['max_ms']:>8.1f}ms")
+
+
+def regressions(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    failed = []
+    for name, r in results.items():
+        before = baseline.get(name)
+        if before and r["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            failed.append(f"{name}: p95 {before['p95_ms']}ms -> {r['p95_ms']}ms")
+    return failed
+
+
+async def run(args) -> Dict[str, Dict[str, Any]]:
+    import httpx
+    import main
+
+    marts_dir = args.marts_dir or write_synthetic_marts(tempfile.mkdtemp(prefix="bench_marts_"))
+    llm = FakeGemini(Latency.parse(args.llm_latency), seed=args.seed)
+    bq = FakeBigQuery(marts_dir, Latency.parse(args.bq_latency), seed=args.seed)
+    main.get_clients = lambda: (llm, bq)
+
+    await main.startup_event()
+    results = {}
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            for index, name in enumerate(args.scenarios):
+                if args.warmup:
+                    await drive(client, name, args.warmup, min(args.concurrency, args.warmup), args.seed + index)
+                results[name] = await drive(client, name, args.requests, args.concurrency, args.seed + index)
+            stages = (await client.get("/stats")).json().get("latency", {}).get("stages", {})
+    finally:
+        await main.shutdown_event()
+    report(results, stages)
+    if bq.cancelled:
+        print(f"\nBigQuery jobs cancelled after losing a race: {bq.cancelled}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent in-flight requests")
+    parser.add_argument("--requests", type=int, default=300, help="Timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed requests per scenario before measuring")
+    parser.add_argument("--llm-latency", default="900:0.35:0", help="Fake Gemini latency")
+    parser.add_argument("--cube-latency", default="60:0.5:0", help="Cube stub latency")
+    parser.add_argument("--bq-latency", default="1200:0.5:0", help="Fake BigQuery job latency")
+    parser.add_argument("--marts-dir", help="Serve fake BigQuery from these mart snapshots instead of generated ones")
+    parser.add_argument("--route-hedging", choices=("off", "fallback", "hedge", "parallel"),
+                        help="ROUTE_HEDGING mode for Cube-routed questions (default: the API's)")
+    parser.add_argument("--with-caches", action="store_true", help="Keep the translation and result caches enabled")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--save", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare p95 against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 increase over the baseline")
+    parser.add_argument("--verbose", action="store_true", help="Keep the API's INFO logging")
+    args = parser.parse_args()
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # main.py and cube_client.py read their configuration at import time
+    cube = CubeStub(Latency.parse(args.cube_latency), seed=args.seed).run()
+    os.environ["CUBE_API_URL"] = cube.api_url
+    os.environ.setdefault("QUERY_BACKEND", "bigquery")
+    if args.route_hedging:
+        os.environ["ROUTE_HEDGING"] = args.route_hedging
+    if not args.with_caches:
+        os.environ["NLQ_CACHE_ENABLED"] = "false"
+        os.environ["RESULT_CACHE_ENABLED"] = "false"
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        cube.close()
+    print(f"\nCube stub: {cube.requests}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            failed = regressions(results, json.load(f), args.tolerance)
+        if failed:
+            print("\nRegressions:\n  " + "\n  ".join(failed))
+            sys.exit(1)
+        print(f"\nNo p95 regression beyond {args.tolerance:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""
+Caching primitives for the Retail Semantic Layer API.
+
+Provides an in-process LRU/TTL cache with an optional on-disk tier. The
+translation cache built on top of them lets repeated natural language
+questions skip the Gemini round-trip entirely, and the result cache lets
+repeated SQL reuse BigQuery results until the underlying dbt model is rebuilt.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable
+
+from sql_utils import canonicalize_sql, referenced_tables
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache with LRU eviction and per-entry TTL.
+
+    Bounded by entry count and, when ``max_bytes`` is set, by the total size
+    reported by ``sizeof`` for each value.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data: "OrderedDict[str, tuple[float, Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value, _ = entry
+            if expires_at < time.time():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        size = self.sizeof(value) if self.sizeof else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.time() + self.ttl_seconds, value, size)
+            self._bytes += size
+            while len(self._data) > self.max_entries or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class DiskCache:
+    """
+    JSON-file cache tier that survives process restarts.
+
+    Bounded like LRUCache: by entry count and, when ``max_bytes`` is set, by
+    total file size. An in-memory index ordered by last use (rebuilt from
+    file mtimes on start) picks the files to evict; expired files are
+    dropped first.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        ttl_seconds: float = 3600,
+        max_entries: int = 10000,
+        max_bytes: Optional[int] = None
+    ):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._index: "OrderedDict[str, tuple[float, int]]" = OrderedDict()  # key -> (expires_at, bytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_index(self) -> None:
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            # files carry their expiry inside; mtime + ttl is close enough for eviction order
+            files.append((st.st_mtime, name[:-len(".json")], st.st_size))
+        with self._lock:
+            for mtime, key, size in sorted(files):
+                self._index[key] = (mtime + self.ttl_seconds, size)
+                self._bytes += size
+            self._evict()
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            with self._lock:
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+        try:
+            os.utime(path)  # keep the LRU order across restarts
+        except OSError:
+            pass
+        self.hits += 1
+        return entry.get("value")
+
+    def set(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        expires_at = time.time() + self.ttl_seconds
+        try:
+            payload = json.dumps({"expires_at": expires_at, "value": value})
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Disk cache write failed: {e}")
+            return
+        size = len(payload.encode("utf-8"))
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            try:
+                with open(tmp_path, "w") as f:
+                    f.write(payload)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Disk cache write failed: {e}")
+                return
+            if key in self._index:
+                self._bytes -= self._index.pop(key)[1]
+            self._index[key] = (expires_at, size)
+            self._bytes += size
+            self.writes += 1
+            self._evict()
+
+    def _evict(self) -> None:
+        # caller holds the lock
+        now = time.time()
+        for key in [k for k, (expires_at, _) in self._index.items() if expires_at < now]:
+            self._remove(key)
+            self.expirations += 1
+        while len(self._index) > self.max_entries or (
+            self.max_bytes is not None and self._bytes > self.max_bytes
+        ):
+            self._remove(next(iter(self._index)))
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        # caller holds the lock
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def clear(self) -> None:
+        with self._lock:
+            for name in os.listdir(self.directory):
+                if name.endswith(".json"):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+            self._index.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "directory": self.directory,
+            "size": len(self._index),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a question so trivially different phrasings share a cache entry."""
+    text = question.strip().lower()
+    text = re.sub(r"\s+", " ", text)
+    return text.rstrip("?.! ")
+
+
+def fingerprint(text: str) -> str:
+    """Short stable hash used to version cache keys."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class TranslationCache:
+    """
+    Two-tier cache for LLM translations (question -> routing/SQL JSON).
+
+    Keys combine the normalized question, a hash of the system prompt and the
+    model name, so editing prompts.py or switching models invalidates every
+    cached translation automatically.
+    """
+
+    def __init__(self, memory: LRUCache, disk: Optional[DiskCache] = None):
+        self.memory = memory
+        self.disk = disk
+
+    @staticmethod
+    def make_key(question: str, prompt: str, model: str) -> str:
+        raw = "\x1f".join([normalize_question(question), fingerprint(prompt), model])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self.memory.set(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk is not None else None,
+        }
+
+
+def build_translation_cache() -> Optional[TranslationCache]:
+    """Create the translation cache from environment configuration."""
+    if os.environ.get("NLQ_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        logger.info("NLQ translation cache disabled")
+        return None
+
+    ttl = float(os.environ.get("NLQ_CACHE_TTL_SECONDS", "21600"))
+    memory = LRUCache(
+        max_entries=int(os.environ.get("NLQ_CACHE_MAX_ENTRIES", "1024")),
+        ttl_seconds=ttl
+    )
+    disk = None
+    cache_dir = os.environ.get("NLQ_CACHE_DIR")
+    if cache_dir:
+        try:
+            disk_max_bytes = int(os.environ.get("NLQ_CACHE_DIR_MAX_BYTES", str(256 * 1024 * 1024)))
+            disk = DiskCache(
+                cache_dir,
+                ttl_seconds=ttl,
+                max_entries=int(os.environ.get("NLQ_CACHE_DIR_MAX_ENTRIES", "10000")),
+                max_bytes=disk_max_bytes or None
+            )
+        except OSError as e:
+            logger.warning(f"Disk cache unavailable at {cache_dir}: {e}")
+    logger.info(f"NLQ translation cache enabled (disk tier: {cache_dir or 'off'})")
+    return TranslationCache(memory, disk)
+
+
+class ResultCache:
+    """
+    Byte-bounded cache of BigQuery result sets keyed on canonicalized SQL.
+
+    An entry is served only while it is younger than the TTL *and* none of the
+    tables it reads have been rebuilt by dbt since it was stored. Mart tables
+    change once per dbt run, so most repeated questions never touch BigQuery.
+    """
+
+    def __init__(self, memory: LRUCache, last_built: Optional[Callable[[str], Optional[float]]] = None):
+        self.memory = memory
+        self.last_built = last_built
+        self.stale = 0
+
+    @staticmethod
+    def make_key(sql: str, max_rows: Optional[int] = None) -> str:
+        raw = f"{canonicalize_sql(sql)}\x1f{max_rows}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, sql: str, max_rows: Optional[int] = None) -> Optional[Any]:
+        key = self.make_key(sql, max_rows)
+        entry = self.memory.get(key)
+        if entry is None:
+            return None
+        if self._is_stale(entry):
+            self.memory.delete(key)
+            self.stale += 1
+            return None
+        return entry["result"]
+
+    def set(self, sql: str, result: Any, max_rows: Optional[int] = None) -> None:
+        self.memory.set(self.make_key(sql, max_rows), {
+            "result": result,
+            "tables": referenced_tables(sql),
+            "stored_at": time.time(),
+        })
+
+    def _is_stale(self, entry: Dict[str, Any]) -> bool:
+        if not self.last_built:
+            return False
+        for table in entry["tables"]:
+            built_at = self.last_built(table)
+            if built_at is not None and built_at > entry["stored_at"]:
+                return True
+        return False
+
+    def clear(self) -> None:
+        self.memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"memory": self.memory.stats(), "stale_invalidations": self.stale}
+
+
+def estimate_result_bytes(entry: Dict[str, Any]) -> int:
+    """Approximate the in-memory footprint of a cached result set."""
+    rows = getattr(entry["result"], "rows", entry["result"])
+    return len(json.dumps(rows, default=str)) + 256
+
+
+def build_result_cache(last_built: Optional[Callable[[str], Optional[float]]] = None) -> Optional[ResultCache]:
+    """Create the BigQuery result cache from environment configuration."""
+    if os.environ.get("RESULT_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        logger.info("BigQuery result cache disabled")
+        return None
+
+    memory = LRUCache(
+        max_entries=int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "10000")),
+        ttl_seconds=float(os.environ.get("RESULT_CACHE_TTL_SECONDS", "900")),
+        max_bytes=int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        sizeof=estimate_result_bytes
+    )
+    logger.info(f"BigQuery result cache enabled ({memory.max_bytes} bytes)")
+    return ResultCache(memory, last_built)
@@ -0,0 +1,148 @@
+"""
+Columnar (Apache Arrow / Parquet) response encoding.
+
+Clients that send ``Accept: application/vnd.apache.arrow.stream`` (or
+``application/vnd.apache.parquet``) get typed columnar bodies instead of JSON
+lists of dicts, so they can build DataFrames without per-row decoding. The
+non-data fields of the JSON response travel in the Arrow schema metadata
+under the ``semantic_layer`` key.
+"""
+
+import io
+import json
+import logging
+from typing import Optional, List, Dict, Any
+
+from fastapi.responses import Response
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+METADATA_KEY = b"semantic_layer"
+
+_MEDIA_TYPES = {
+    ARROW_STREAM_MEDIA_TYPE: "arrow",
+    "application/vnd.apache.arrow.file": "arrow",
+    PARQUET_MEDIA_TYPE: "parquet",
+    "application/x-parquet": "parquet",
+}
+
+
+def negotiate_format(accept: Optional[str]) -> str:
+    """
+    Pick the response format from an Accept header.
+
+    Returns "arrow", "parquet" or "json". Media ranges are ranked by their
+    q-value; JSON is used whenever pyarrow is missing or nothing columnar is
+    acceptable.
+    """
+    if not accept or not ARROW_AVAILABLE:
+        return "json"
+    candidates = []
+    for position, part in enumerate(accept.split(",")):
+        fields = [f.strip() for f in part.split(";")]
+        media_type = fields[0].lower()
+        quality = 1.0
+        for param in fields[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        candidates.append((-quality, position, media_type))
+    for neg_quality, _, media_type in sorted(candidates):
+        if neg_quality == 0:
+            break
+        if media_type in _MEDIA_TYPES:
+            return _MEDIA_TYPES[media_type]
+        if media_type in ("application/json", "*/*", "application/*"):
+            return "json"
+    return "json"
+
+
+def _cube_arrow_type(member_type: str):
+    if member_type == "number":
+        return pa.float64()
+    if member_type == "time":
+        return pa.timestamp("ms")
+    if member_type == "boolean":
+        return pa.bool_()
+    return pa.string()
+
+
+def rows_to_table(rows: List[dict], annotation: Optional[Dict[str, Any]] = None):
+    """
+    Build an Arrow table from result rows.
+
+    BigQuery rows already carry typed Python values. Cube returns numbers as
+    strings, so its ``annotation`` block is used to cast measures and time
+    dimensions to proper Arrow types.
+    """
+    table = pa.Table.from_pylist(rows)
+    if not annotation:
+        return table
+
+    member_types = {}
+    for section in ("measures", "dimensions", "timeDimensions"):
+        for name, info in (annotation.get(section) or {}).items():
+            member_types[name] = info.get("type", "string")
+
+    for i, field in enumerate(table.schema):
+        member_type = member_types.get(field.name)
+        if member_type is None:
+            continue
+        target = _cube_arrow_type(member_type)
+        if field.type == target:
+            continue
+        try:
+            column = table.column(i)
+            if member_type == "time" and pa.types.is_string(field.type):
+                column = pc.strptime(
+                    pc.utf8_slice_codeunits(column, 0, 19), format="%Y-%m-%dT%H:%M:%S", unit="ms"
+                )
+            else:
+                column = column.cast(target)
+            table = table.set_column(i, field.name, column)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            logger.warning(f"Could not cast {field.name} to {target}: {e}")
+    return table
+
+
+def table_to_ipc(table) -> bytes:
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def table_to_parquet(table) -> bytes:
+    sink = io.BytesIO()
+    pq.write_table(table, sink)
+    return sink.getvalue()
+
+
+def columnar_response(
+    fmt: str,
+    rows: List[dict],
+    metadata: Dict[str, Any],
+    annotation: Optional[Dict[str, Any]] = None
+) -> Response:
+    """Encode rows (plus response metadata) as an Arrow IPC or Parquet response."""
+    table = rows_to_table(rows or [], annotation)
+    existing = table.schema.metadata or {}
+    table = table.replace_schema_metadata({
+        **existing,
+        METADATA_KEY: json.dumps(metadata, default=str).encode("utf-8")
+    })
+    if fmt == "parquet":
+        return Response(content=table_to_parquet(table), media_type=PARQUET_MEDIA_TYPE)
+    return Response(content=table_to_ipc(table), media_type=ARROW_STREAM_MEDIA_TYPE)
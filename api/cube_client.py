@@ -3,14 +3,24 @@ Cube REST API Client for the Retail Semantic Layer.
 
 This module provides a Python client for interacting with the Cube REST API,
 enabling standardized metric queries with caching and governance.
+
+All calls go through a shared CubeClient that keeps pooled keep-alive
+connections, retries transient failures with backoff, reuses its JWT until
+shortly before it expires and caches health checks for a few seconds. The
+module-level functions below are thin wrappers around the default client.
 """
 
 import os
+import asyncio
+import threading
 import requests
+import httpx
 import jwt
 import time
 import logging
-from typing import Optional, List, Dict, Any
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Optional, List, Dict, Any, Callable
 
 logger = logging.getLogger(__name__)
 
@@ -20,54 +30,339 @@ logger = logging.getLogger(__name__)
 CUBE_API_URL = os.environ.get("CUBE_API_URL", "http://localhost:4000/cubejs-api/v1")
 CUBE_API_SECRET = os.environ.get("CUBEJS_API_SECRET", "retail-semantic-layer-secret-key-change-me")
 
+# Connection tuning
+CUBE_POOL_SIZE = int(os.environ.get("CUBE_POOL_SIZE", "20"))
+CUBE_MAX_RETRIES = int(os.environ.get("CUBE_MAX_RETRIES", "3"))
+CUBE_RETRY_BACKOFF = float(os.environ.get("CUBE_RETRY_BACKOFF", "0.3"))
+CUBE_HEALTH_TTL_SECONDS = float(os.environ.get("CUBE_HEALTH_TTL_SECONDS", "15"))
+
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
 # Log Cube configuration on import
 logger.info(f"Cube API URL: {CUBE_API_URL}")
 logger.info(f"Cube API Secret configured: {'Yes' if CUBE_API_SECRET != 'retail-semantic-layer-secret-key-change-me' else 'Using default (dev only)'}")
 
 
-def generate_cube_token(expiry_seconds: int = 3600) -> str:
+def generate_cube_token(expiry_seconds: int = 3600, secret: str = CUBE_API_SECRET) -> str:
     """Generate a JWT token for Cube API authentication."""
     payload = {
         "iat": int(time.time()),
         "exp": int(time.time()) + expiry_seconds
     }
-    return jwt.encode(payload, CUBE_API_SECRET, algorithm="HS256")
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+def build_cube_query(
+    measures: List[str],
+    dimensions: Optional[List[str]] = None,
+    filters: Optional[List[Dict]] = None,
+    time_dimensions: Optional[List[Dict]] = None,
+    order: Optional[Dict[str, str]] = None,
+    limit: int = 100
+) -> Dict[str, Any]:
+    """Build a Cube REST API query object, omitting empty clauses."""
+    query = {
+        "measures": measures,
+        "limit": limit
+    }
+    
+    if dimensions:
+        query["dimensions"] = dimensions
+    if filters:
+        query["filters"] = filters
+    if time_dimensions:
+        query["timeDimensions"] = time_dimensions
+    if order:
+        query["order"] = order
+    return query
+
+
+class CubeClient:
+    """
+    Cube REST API client with connection pooling, retries and token reuse.
+
+    A single instance owns one requests.Session (sync callers) and one
+    httpx.AsyncClient (async callers), so repeated queries reuse warm TCP/TLS
+    connections to the Cube service instead of reconnecting every time.
+    """
+
+    def __init__(
+        self,
+        api_url: str = CUBE_API_URL,
+        api_secret: str = CUBE_API_SECRET,
+        token_ttl: int = 3600,
+        token_refresh_margin: int = 300,
+        health_ttl: float = CUBE_HEALTH_TTL_SECONDS,
+        pool_size: int = CUBE_POOL_SIZE,
+        max_retries: int = CUBE_MAX_RETRIES,
+        backoff_factor: float = CUBE_RETRY_BACKOFF
+    ):
+        self.api_url = api_url
+        self.base_url = api_url.replace("/cubejs-api/v1", "")
+        self.api_secret = api_secret
+        self.token_ttl = token_ttl
+        self.token_refresh_margin = token_refresh_margin
+        self.health_ttl = health_ttl
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+        self._health: Optional[bool] = None
+        self._health_checked_at = 0.0
+
+        self._session: Optional[requests.Session] = None
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing: set = set()  # close tasks of clients left behind by a finished event loop
+
+    # ------------------------------------------------------------------
+    # Auth
+    # ------------------------------------------------------------------
+
+    def token(self) -> str:
+        """Return a cached JWT, signing a new one shortly before expiry."""
+        with self._token_lock:
+            now = time.time()
+            if self._token is None or now >= self._token_expires_at - self.token_refresh_margin:
+                self._token = generate_cube_token(self.token_ttl, self.api_secret)
+                self._token_expires_at = now + self.token_ttl
+            return self._token
+
+    def headers(self) -> Dict[str, str]:
+        """Get headers for Cube API requests."""
+        return {
+            "Authorization": self.token(),
+            "Content-Type": "application/json"
+        }
+
+    # ------------------------------------------------------------------
+    # Connections
+    # ------------------------------------------------------------------
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            retry = Retry(
+                total=self.max_retries,
+                backoff_factor=self.backoff_factor,
+                status_forcelist=RETRY_STATUS_CODES,
+                allowed_methods=frozenset({"GET", "POST"}),
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        # pooled connections are bound to the event loop that opened them
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client.is_closed or self._async_loop is not loop:
+            self._close_stale_async_client(loop)
+            self._async_loop = loop
+            self._async_client = httpx.AsyncClient(
+                timeout=30,
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size
+                )
+            )
+        return self._async_client
+
+    def _close_stale_async_client(self, loop: asyncio.AbstractEventLoop) -> None:
+        stale, stale_loop = self._async_client, self._async_loop
+        self._async_client = None
+        if stale is None or stale.is_closed:
+            return
+        if stale_loop is not None and stale_loop.is_running() and not stale_loop.is_closed():
+            # the loop that owns the connections still runs in another thread
+            asyncio.run_coroutine_threadsafe(_aclose_quietly(stale), stale_loop)
+            return
+        task = loop.create_task(_aclose_quietly(stale))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _send_async(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request, retrying retryable statuses with exponential backoff."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.async_client.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    return response
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+        raise RuntimeError("unreachable")
+
+    def close(self) -> None:
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self.close()
+
+    # ------------------------------------------------------------------
+    # Health
+    # ------------------------------------------------------------------
+
+    def _cached_health(self) -> Optional[bool]:
+        if self._health is not None and time.time() - self._health_checked_at < self.health_ttl:
+            return self._health
+        return None
+
+    def _store_health(self, healthy: bool) -> bool:
+        self._health = healthy
+        self._health_checked_at = time.time()
+        return healthy
+
+    def check_health(self, force: bool = False) -> bool:
+        """Check if Cube server is healthy (cached for health_ttl seconds)."""
+        cached = None if force else self._cached_health()
+        if cached is not None:
+            return cached
+        try:
+            response = self.session.get(f"{self.base_url}/readyz", timeout=5)
+            return self._store_health(response.status_code == 200)
+        except Exception as e:
+            logger.warning(f"Cube health check failed: {e}")
+            return self._store_health(False)
+
+    async def check_health_async(self, force: bool = False) -> bool:
+        """Async variant of check_health sharing the same cached status."""
+        cached = None if force else self._cached_health()
+        if cached is not None:
+            return cached
+        try:
+            response = await self.async_client.get(f"{self.base_url}/readyz", timeout=5)
+            return self._store_health(response.status_code == 200)
+        except Exception as e:
+            logger.warning(f"Cube health check failed: {e}")
+            return self._store_health(False)
+
+    # ------------------------------------------------------------------
+    # Metadata & queries
+    # ------------------------------------------------------------------
+
+    def get_meta(self) -> Optional[Dict[str, Any]]:
+        """Get Cube metadata (available cubes, measures, dimensions)."""
+        try:
+            response = self.session.get(f"{self.api_url}/meta", headers=self.headers(), timeout=10)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logger.error(f"Failed to get Cube metadata: {e}")
+            return None
+
+    async def get_meta_async(self) -> Optional[Dict[str, Any]]:
+        """Get Cube metadata without blocking the event loop."""
+        try:
+            response = await self._send_async("GET", f"{self.api_url}/meta", headers=self.headers(), timeout=10)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logger.error(f"Failed to get Cube metadata: {e}")
+            return None
+
+    def load(self, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """POST a query object to /load and return the parsed response."""
+        try:
+            logger.info(f"Cube query: {query}")
+            response = self.session.post(
+                f"{self.api_url}/load",
+                headers=self.headers(),
+                json={"query": query},
+                timeout=30
+            )
+            response.raise_for_status()
+            result = response.json()
+            logger.info(f"Cube response: {len(result.get('data', []))} rows")
+            return result
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Cube query failed: {e}")
+            return None
+
+    async def load_async(self, query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Async variant of load()."""
+        try:
+            logger.info(f"Cube query: {query}")
+            response = await self._send_async(
+                "POST",
+                f"{self.api_url}/load",
+                headers=self.headers(),
+                json={"query": query},
+                timeout=30
+            )
+            response.raise_for_status()
+            result = response.json()
+            logger.info(f"Cube response: {len(result.get('data', []))} rows")
+            return result
+        except (httpx.HTTPError, ValueError) as e:
+            # ValueError: a truncated or non-JSON body
+            logger.error(f"Cube query failed: {e}")
+            return None
+
+
+async def _aclose_quietly(client: httpx.AsyncClient) -> None:
+    try:
+        await client.aclose()
+    except Exception as e:
+        # connections opened on a loop that has since closed cannot shut down cleanly
+        logger.debug(f"Closing stale Cube client: {e}")
+
+
+# Shared client used by the module-level helpers
+_default_client: Optional[CubeClient] = None
+
+
+def get_cube_client() -> CubeClient:
+    """Return the process-wide CubeClient."""
+    global _default_client
+    if _default_client is None:
+        _default_client = CubeClient()
+    return _default_client
+
+
+async def close_async_client() -> None:
+    """Close pooled connections held by the shared client (called on API shutdown)."""
+    if _default_client is not None:
+        await _default_client.aclose()
 
 
 def get_cube_headers() -> Dict[str, str]:
     """Get headers for Cube API requests."""
-    return {
-        "Authorization": generate_cube_token(),
-        "Content-Type": "application/json"
-    }
+    return get_cube_client().headers()
 
 
 def check_cube_health() -> bool:
     """Check if Cube server is healthy."""
-    try:
-        response = requests.get(
-            f"{CUBE_API_URL.replace('/cubejs-api/v1', '')}/readyz",
-            timeout=5
-        )
-        return response.status_code == 200
-    except Exception as e:
-        logger.warning(f"Cube health check failed: {e}")
-        return False
+    return get_cube_client().check_health()
+
+
+async def check_cube_health_async() -> bool:
+    """Check if Cube server is healthy without blocking the event loop."""
+    return await get_cube_client().check_health_async()
 
 
 def get_cube_meta() -> Optional[Dict[str, Any]]:
     """Get Cube metadata (available cubes, measures, dimensions)."""
-    try:
-        response = requests.get(
-            f"{CUBE_API_URL}/meta",
-            headers=get_cube_headers(),
-            timeout=10
-        )
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        logger.error(f"Failed to get Cube metadata: {e}")
-        return None
+    return get_cube_client().get_meta()
+
+
+async def get_cube_meta_async() -> Optional[Dict[str, Any]]:
+    """Get Cube metadata without blocking the event loop."""
+    return await get_cube_client().get_meta_async()
 
 
 def query_cube(
@@ -92,41 +387,31 @@ def query_cube(
     Returns:
         Query result with data array or None on error
     """
-    query = {
-        "measures": measures,
-        "limit": limit
-    }
-    
-    if dimensions:
-        query["dimensions"] = dimensions
-    if filters:
-        query["filters"] = filters
-    if time_dimensions:
-        query["timeDimensions"] = time_dimensions
-    if order:
-        query["order"] = order
-    
-    try:
-        logger.info(f"Cube query: {query}")
-        response = requests.post(
-            f"{CUBE_API_URL}/load",
-            headers=get_cube_headers(),
-            json={"query": query},
-            timeout=30
-        )
-        response.raise_for_status()
-        result = response.json()
-        logger.info(f"Cube response: {len(result.get('data', []))} rows")
-        return result
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Cube query failed: {e}")
-        return None
+    query = build_cube_query(measures, dimensions, filters, time_dimensions, order, limit)
+    return get_cube_client().load(query)
 
 
-# Pre-defined queries for common metrics
-def get_total_revenue_by_date(days: int = 30) -> Optional[Dict[str, Any]]:
-    """Get daily revenue for the last N days using Cube."""
-    return query_cube(
+async def query_cube_async(
+    measures: List[str],
+    dimensions: Optional[List[str]] = None,
+    filters: Optional[List[Dict]] = None,
+    time_dimensions: Optional[List[Dict]] = None,
+    order: Optional[Dict[str, str]] = None,
+    limit: int = 100
+) -> Optional[Dict[str, Any]]:
+    """Execute a query against Cube REST API without blocking the event loop."""
+    query = build_cube_query(measures, dimensions, filters, time_dimensions, order, limit)
+    return await load_cube_query_async(query)
+
+
+async def load_cube_query_async(query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Execute an already built query object (e.g. one normalized by cube_schema.py)."""
+    return await get_cube_client().load_async(query)
+
+
+# Pre-defined queries for common metrics (keyword arguments for query_cube)
+METRIC_QUERIES: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "revenue_daily": lambda days=30: dict(
         measures=["revenue_daily.total_revenue", "revenue_daily.total_orders"],
         dimensions=[],
         time_dimensions=[{
@@ -135,58 +420,84 @@ def get_total_revenue_by_date(days: int = 30) -> Optional[Dict[str, Any]]:
             "granularity": "day"
         }],
         order={"revenue_daily.date": "asc"}
-    )
-
-
-def get_revenue_by_country() -> Optional[Dict[str, Any]]:
-    """Get total revenue grouped by country using Cube."""
-    return query_cube(
+    ),
+    "revenue_by_country": lambda: dict(
         measures=["orders.total_revenue", "orders.count"],
         dimensions=["orders.country"],
         order={"orders.total_revenue": "desc"},
         limit=20
-    )
+    ),
+    "order_metrics": lambda: dict(
+        measures=["orders.count", "orders.total_revenue", "orders.avg_order_value"],
+        dimensions=[]
+    ),
+    "user_metrics": lambda: dict(
+        measures=["users.count", "users.total_orders_placed"],
+        dimensions=[]
+    ),
+    "orders_by_status": lambda: dict(
+        measures=["orders.count", "orders.total_revenue"],
+        dimensions=["orders.status"],
+        order={"orders.count": "desc"}
+    ),
+    # Served from the revenue_by_day rollup: Cube Store merges the daily HLL
+    # sketches, so any date range costs the same
+    "unique_customers": lambda start_date=None, end_date=None, granularity=None: dict(
+        measures=["orders.unique_customers"],
+        dimensions=[],
+        time_dimensions=[{
+            "dimension": "orders.order_date",
+            "dateRange": [start_date, end_date] if start_date and end_date else "last 30 days",
+            **({"granularity": granularity} if granularity else {})
+        }]
+    ),
+}
+
+
+def get_total_revenue_by_date(days: int = 30) -> Optional[Dict[str, Any]]:
+    """Get daily revenue for the last N days using Cube."""
+    return query_cube(**METRIC_QUERIES["revenue_daily"](days))
+
+
+def get_revenue_by_country() -> Optional[Dict[str, Any]]:
+    """Get total revenue grouped by country using Cube."""
+    return query_cube(**METRIC_QUERIES["revenue_by_country"]())
 
 
 def get_order_metrics() -> Optional[Dict[str, Any]]:
     """Get high-level order metrics using Cube."""
-    return query_cube(
-        measures=["orders.count", "orders.total_revenue", "orders.avg_order_value"],
-        dimensions=[]
-    )
+    return query_cube(**METRIC_QUERIES["order_metrics"]())
 
 
 def get_user_metrics() -> Optional[Dict[str, Any]]:
     """Get user count and activity metrics using Cube."""
-    return query_cube(
-        measures=["users.count", "users.total_orders_placed"],
-        dimensions=[]
-    )
+    return query_cube(**METRIC_QUERIES["user_metrics"]())
 
 
 def get_orders_by_status() -> Optional[Dict[str, Any]]:
     """Get order count by status using Cube."""
-    return query_cube(
-        measures=["orders.count", "orders.total_revenue"],
-        dimensions=["orders.status"],
-        order={"orders.count": "desc"}
-    )
+    return query_cube(**METRIC_QUERIES["orders_by_status"]())
+
 
 
-# Mapping from natural language intents to Cube queries
-INTENT_TO_CUBE_QUERY = {
-    "total_revenue": lambda: query_cube(
+# Mapping from natural language intents to Cube queries (keyword arguments for query_cube)
+INTENT_TO_CUBE_QUERY: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "total_revenue": lambda: dict(
         measures=["orders.total_revenue"],
         dimensions=[]
     ),
-    "total_orders": lambda: query_cube(
+    "total_orders": lambda: dict(
         measures=["orders.count"],
         dimensions=[]
     ),
-    "revenue_by_country": get_revenue_by_country,
-    "orders_by_status": get_orders_by_status,
-    "daily_revenue": lambda: get_total_revenue_by_date(30),
-    "user_count": get_user_metrics,
+    "average_order_value": lambda: dict(
+        measures=["orders.avg_order_value"],
+        dimensions=[]
+    ),
+    "revenue_by_country": METRIC_QUERIES["revenue_by_country"],
+    "orders_by_status": METRIC_QUERIES["orders_by_status"],
+    "daily_revenue": lambda: METRIC_QUERIES["revenue_daily"](30),
+    "user_count": METRIC_QUERIES["user_metrics"],
 }
 
 
@@ -194,9 +505,9 @@ def execute_cube_intent(intent: str) -> Optional[Dict[str, Any]]:
     """
     Execute a pre-defined Cube query based on intent.
     
-    This allows the Gemini NLQ to identify the intent, then we execute
-    the corresponding optimized Cube query.
+    The intent comes from Gemini or from the local intent matcher
+    (intent_matcher.py), which resolves common questions without the LLM.
     """
     if intent in INTENT_TO_CUBE_QUERY:
-        return INTENT_TO_CUBE_QUERY[intent]()
+        return query_cube(**INTENT_TO_CUBE_QUERY[intent]())
     return None
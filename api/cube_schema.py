@@ -0,0 +1,348 @@
+"""
+Local index of the Cube data model for validating queries before they are sent.
+
+The index is built from the Cube YAML model (cube/model/cubes) at startup and
+replaced by Cube's own /meta response once one has been fetched, so it
+describes what the running Cube deployment actually serves. A background
+refresh re-reads the YAML when the files change and re-fetches /meta
+periodically; the cached /meta response is also what GET /cube/meta returns.
+
+CubeSchema.validate() checks a query against the index in microseconds:
+
+- every member exists and is used in the right place (measures, dimensions,
+  segments, time dimensions), with a close match suggested for typos,
+- time dimensions have a valid granularity; `orders.order_date.month` in
+  `dimensions` is moved to `timeDimensions`,
+- filters use a known operator with the values it needs,
+- all cubes in the query can be joined (same connected component).
+
+Invalid queries raise CubeQueryInvalid instead of costing a Cube round trip.
+"""
+
+import os
+import glob
+import time
+import difflib
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Any, Tuple
+
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    YAML_AVAILABLE = False
+
+from intent_matcher import CUBE_MODEL_DIR
+
+logger = logging.getLogger(__name__)
+
+CUBE_SCHEMA_VALIDATION = os.environ.get("CUBE_SCHEMA_VALIDATION", "true").lower() == "true"
+CUBE_SCHEMA_REFRESH_SECONDS = float(os.environ.get("CUBE_SCHEMA_REFRESH_SECONDS", "60"))
+
+GRANULARITIES = ("second", "minute", "hour", "day", "week", "month", "quarter", "year")
+VALUELESS_OPERATORS = {"set", "notSet"}
+FILTER_OPERATORS = VALUELESS_OPERATORS | {
+    "equals", "notEquals", "contains", "notContains", "startsWith", "notStartsWith", "endsWith", "notEndsWith",
+    "gt", "gte", "lt", "lte", "inDateRange", "notInDateRange", "beforeDate", "beforeOrOnDate", "afterDate",
+    "afterOrOnDate",
+}
+MAX_LIMIT = 50000  # Cube's default maximum row limit
+
+
+class CubeQueryInvalid(ValueError):
+    """The query cannot be answered by the Cube model; `problems` lists why."""
+
+    def __init__(self, problems: List[str]):
+        super().__init__("; ".join(problems))
+        self.problems = problems
+
+
+@dataclass
+class Member:
+    name: str  # "cube.member"
+    cube: str
+    kind: str  # "measure", "dimension" or "segment"
+    type: str  # measure/dimension type from the model ("time" for time dimensions)
+
+
+# ============================================================================
+# Sources
+# ============================================================================
+
+def _join_components(joins: Dict[str, List[str]]) -> Dict[str, int]:
+    """Number the connected components of the (undirected) join graph."""
+    neighbours: Dict[str, set] = {cube: set() for cube in joins}
+    for cube, targets in joins.items():
+        for target in targets:
+            neighbours[cube].add(target)
+            neighbours.setdefault(target, set()).add(cube)
+    components: Dict[str, int] = {}
+    for start in sorted(neighbours):
+        if start in components:
+            continue
+        component = len(set(components.values()))
+        stack = [start]
+        while stack:
+            cube = stack.pop()
+            if cube not in components:
+                components[cube] = component
+                stack.extend(neighbours[cube] - components.keys())
+    return components
+
+
+def model_signature(model_dir: str = CUBE_MODEL_DIR) -> Tuple:
+    """Changes whenever a model file is added, removed or modified."""
+    paths = sorted(glob.glob(os.path.join(model_dir, "*.y*ml")))
+    return tuple((path, os.path.getmtime(path), os.path.getsize(path)) for path in paths if os.path.isfile(path))
+
+
+def load_model_meta(model_dir: str = CUBE_MODEL_DIR) -> Dict[str, Any]:
+    """A /meta-shaped payload built from the Cube YAML model (no cubes if unavailable)."""
+    cubes: List[Dict[str, Any]] = []
+    joins: Dict[str, List[str]] = {}
+    if not YAML_AVAILABLE or not os.path.isdir(model_dir):
+        return {"cubes": cubes}
+    for path in sorted(glob.glob(os.path.join(model_dir, "*.y*ml"))):
+        try:
+            with open(path) as f:
+                model = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as e:
+            logger.warning(f"Could not read Cube model {path}: {e}")
+            continue
+        for cube in model.get("cubes", []):
+            name = cube["name"]
+            joins[name] = [join["name"] for join in cube.get("joins", []) or []]
+
+            def member(m: Dict[str, Any], **fields) -> Dict[str, Any]:
+                return {"name": f"{name}.{m['name']}", "title": m.get("title", m["name"].replace("_", " ").title()), **fields}
+
+            # same shape as Cube's /meta: measures are numbers with the YAML type as aggType
+            cubes.append({
+                "name": name,
+                "title": cube.get("title", name.replace("_", " ").title()),
+                "measures": [member(m, type="number", aggType=m.get("type")) for m in cube.get("measures", []) or []],
+                "dimensions": [member(d, type=d.get("type", "string")) for d in cube.get("dimensions", []) or []],
+                "segments": [member(s) for s in cube.get("segments", []) or []],
+            })
+    components = _join_components(joins)
+    for cube in cubes:
+        cube["connectedComponent"] = components[cube["name"]]
+    return {"cubes": cubes}
+
+
+# ============================================================================
+# Index
+# ============================================================================
+
+class CubeSchemaIndex:
+    """Members of one version of the Cube model, keyed by full name."""
+
+    def __init__(self, meta: Dict[str, Any], source: str):
+        self.source = source
+        self.version = hashlib.sha256(repr(meta.get("cubes", [])).encode()).hexdigest()[:12]
+        self.members: Dict[str, Member] = {}
+        self.components: Dict[str, Optional[int]] = {}
+        for cube in meta.get("cubes", []):
+            name = cube["name"]
+            self.components[name] = cube.get("connectedComponent")
+            for kind, key in (("measure", "measures"), ("dimension", "dimensions"), ("segment", "segments")):
+                for m in cube.get(key, []) or []:
+                    self.members[m["name"]] = Member(m["name"], name, kind, m.get("type", ""))
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def _lookup(self, name: Any, kind: str, where: str, problems: List[str]) -> Optional[Member]:
+        if not isinstance(name, str):
+            problems.append(f"{where}: member names must be strings, got {name!r}")
+            return None
+        member = self.members.get(name)
+        if member is None:
+            close = difflib.get_close_matches(name, [m.name for m in self.members.values() if m.kind == kind], n=1)
+            hint = f" (did you mean {close[0]}?)" if close else ""
+            problems.append(f"{where}: unknown {kind} {name!r}{hint}")
+            return None
+        if member.kind != kind:
+            problems.append(f"{where}: {name!r} is a {member.kind}, not a {kind}")
+            return None
+        return member
+
+    def _check_filters(self, filters: List[Any], problems: List[str], cubes: set):
+        for f in filters:
+            if not isinstance(f, dict):
+                problems.append(f"filters: expected an object, got {f!r}")
+                continue
+            if "and" in f or "or" in f:
+                self._check_filters(f.get("and", []) + f.get("or", []), problems, cubes)
+                continue
+            name = f.get("member", f.get("dimension"))
+            member = self.members.get(name) if isinstance(name, str) else None
+            if member is None or member.kind == "segment":
+                self._lookup(name, "dimension", "filters", problems)
+            else:
+                cubes.add(member.cube)
+            operator = f.get("operator")
+            if operator not in FILTER_OPERATORS:
+                problems.append(f"filters: unknown operator {operator!r} on {name!r}")
+            elif operator not in VALUELESS_OPERATORS and not f.get("values"):
+                problems.append(f"filters: operator {operator!r} on {name!r} needs values")
+
+    def validate(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the normalized query; raises CubeQueryInvalid listing every problem found."""
+        problems: List[str] = []
+        cubes: set = set()
+        normalized = dict(query)
+
+        measures = list(dict.fromkeys(query.get("measures") or []))
+        for name in measures:
+            member = self._lookup(name, "measure", "measures", problems)
+            if member:
+                cubes.add(member.cube)
+
+        dimensions, time_dimensions = [], list(query.get("timeDimensions") or [])
+        for name in dict.fromkeys(query.get("dimensions") or []):
+            base, _, granularity = name.rpartition(".") if isinstance(name, str) else ("", "", "")
+            if granularity in GRANULARITIES and base in self.members and name not in self.members:
+                # "orders.order_date.month" is a time dimension at a granularity
+                time_dimensions.append({"dimension": base, "granularity": granularity})
+                continue
+            member = self._lookup(name, "dimension", "dimensions", problems)
+            if member:
+                cubes.add(member.cube)
+            dimensions.append(name)
+
+        for td in time_dimensions:
+            if not isinstance(td, dict):
+                problems.append(f"timeDimensions: expected an object, got {td!r}")
+                continue
+            member = self._lookup(td.get("dimension"), "dimension", "timeDimensions", problems)
+            if member is None:
+                continue
+            cubes.add(member.cube)
+            if member.type != "time":
+                problems.append(f"timeDimensions: {member.name!r} is a {member.type} dimension, not a time dimension")
+            granularity = td.get("granularity")
+            if granularity is not None and granularity not in GRANULARITIES:
+                problems.append(f"timeDimensions: unknown granularity {granularity!r} for {member.name!r}")
+
+        for name in query.get("segments") or []:
+            member = self._lookup(name, "segment", "segments", problems)
+            if member:
+                cubes.add(member.cube)
+
+        self._check_filters(list(query.get("filters") or []), problems, cubes)
+
+        for name, direction in (query.get("order") or {}).items():
+            if name not in self.members:
+                self._lookup(name, "measure" if name in measures else "dimension", "order", problems)
+            if direction not in ("asc", "desc"):
+                problems.append(f"order: direction for {name!r} must be 'asc' or 'desc'")
+
+        limit = query.get("limit")
+        if limit is not None and not (isinstance(limit, int) and 0 < limit <= MAX_LIMIT):
+            problems.append(f"limit must be between 1 and {MAX_LIMIT}, got {limit!r}")
+        if not measures and not dimensions and not time_dimensions:
+            problems.append("query needs at least one measure, dimension or time dimension")
+
+        components = {self.components.get(cube) for cube in cubes}
+        if len(cubes) > 1 and None not in components and len(components) > 1:
+            problems.append(f"cubes {', '.join(sorted(cubes))} have no join path between them")
+
+        if problems:
+            raise CubeQueryInvalid(problems)
+        normalized["measures"] = measures
+        if dimensions or "dimensions" in query:
+            normalized["dimensions"] = dimensions
+        if time_dimensions:
+            normalized["timeDimensions"] = time_dimensions
+        return normalized
+
+
+class CubeSchema:
+    """The current CubeSchemaIndex plus validation counters; swapped atomically on refresh."""
+
+    def __init__(self, model_dir: str = CUBE_MODEL_DIR):
+        self.model_dir = model_dir
+        self.meta: Optional[Dict[str, Any]] = None  # last /meta response from Cube
+        self.meta_fetched_at: Optional[float] = None
+        self.index = CubeSchemaIndex({"cubes": []}, "empty")
+        self._signature: Optional[Tuple] = None
+        self._lock = threading.Lock()
+        self.refreshes = 0
+        self.validated = 0
+        self.rejected = 0
+        self.normalized = 0
+        self._validate_seconds = 0.0
+
+    def _swap(self, index: CubeSchemaIndex) -> bool:
+        if index.version == self.index.version and index.source == self.index.source:
+            return False
+        logger.info(f"Cube schema index {index.version} from {index.source}: {len(index)} members")
+        self.index = index
+        self.refreshes += 1
+        return True
+
+    def refresh_model(self) -> bool:
+        """Re-read the YAML model if its files changed; returns whether the index was rebuilt."""
+        signature = model_signature(self.model_dir) if os.path.isdir(self.model_dir) else ()
+        with self._lock:
+            if signature == self._signature:
+                return False
+            self._signature = signature
+            if self.meta is not None:
+                return False  # the deployment's /meta takes precedence over local files
+            index = CubeSchemaIndex(load_model_meta(self.model_dir), "model")
+            return bool(len(index)) and self._swap(index)
+
+    def update_meta(self, meta: Dict[str, Any]) -> bool:
+        """Cache a /meta response from Cube and index it; returns whether the index changed."""
+        with self._lock:
+            self.meta = meta
+            self.meta_fetched_at = time.time()
+            index = CubeSchemaIndex(meta, "cube")
+            return bool(len(index)) and self._swap(index)
+
+    def validate(self, query: Dict[str, Any]) -> Dict[str, Any]:
+        """Validate and normalize a query against the current index (a no-op while it is empty)."""
+        index = self.index
+        if not len(index):
+            return query
+        started = time.perf_counter()
+        try:
+            normalized = index.validate(query)
+        except CubeQueryInvalid:
+            self.rejected += 1
+            raise
+        finally:
+            self.validated += 1
+            self._validate_seconds += time.perf_counter() - started
+        if normalized != query:
+            self.normalized += 1
+        return normalized
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "source": self.index.source,
+            "version": self.index.version,
+            "members": len(self.index),
+            "meta_age_seconds": round(time.time() - self.meta_fetched_at, 1) if self.meta_fetched_at else None,
+            "refreshes": self.refreshes,
+            "validated": self.validated,
+            "rejected": self.rejected,
+            "normalized": self.normalized,
+            "mean_validate_us": round(self._validate_seconds / self.validated * 1e6, 1) if self.validated else 0.0,
+        }
+
+
+def build_cube_schema() -> Optional[CubeSchema]:
+    """Schema index seeded from the YAML model, or None when validation is disabled."""
+    if not CUBE_SCHEMA_VALIDATION:
+        return None
+    schema = CubeSchema()
+    schema.refresh_model()
+    if not len(schema.index):
+        logger.info(f"No Cube model in {schema.model_dir}; validating once Cube's /meta is fetched")
+    return schema
@@ -0,0 +1,102 @@
+"""
+Readers for dbt build artifacts (target/run_results.json, target/manifest.json).
+
+Used to find out when each mart was last rebuilt, so cached query results can
+be invalidated exactly when the data behind them changes.
+"""
+
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import Optional, Dict
+
+logger = logging.getLogger(__name__)
+
+DBT_TARGET_DIR = os.environ.get(
+    "DBT_TARGET_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "target")
+)
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+class ModelFreshness:
+    """
+    Tracks the last successful build time of each dbt model.
+
+    run_results.json gives per-model completion times; manifest.json is used as
+    a coarser fallback (its generation time applies to every model it lists).
+    Artifacts are re-read only when their modification time changes.
+    """
+
+    def __init__(self, target_dir: str = DBT_TARGET_DIR):
+        self.target_dir = target_dir
+        self._built_at: Dict[str, float] = {}
+        self._mtimes: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _artifact_mtimes(self) -> Dict[str, float]:
+        mtimes = {}
+        for name in ("run_results.json", "manifest.json"):
+            try:
+                mtimes[name] = os.path.getmtime(os.path.join(self.target_dir, name))
+            except OSError:
+                pass
+        return mtimes
+
+    def _load(self, name: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.target_dir, name)) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read dbt artifact {name}: {e}")
+            return None
+
+    def _refresh(self) -> None:
+        mtimes = self._artifact_mtimes()
+        if mtimes == self._mtimes:
+            return
+
+        built_at: Dict[str, float] = {}
+
+        manifest = self._load("manifest.json") if "manifest.json" in mtimes else None
+        if manifest:
+            generated_at = _parse_timestamp(manifest.get("metadata", {}).get("generated_at"))
+            if generated_at:
+                for node in manifest.get("nodes", {}).values():
+                    if node.get("resource_type") == "model":
+                        built_at[node["name"].lower()] = generated_at
+
+        run_results = self._load("run_results.json") if "run_results.json" in mtimes else None
+        if run_results:
+            for result in run_results.get("results", []):
+                unique_id = result.get("unique_id", "")
+                if not unique_id.startswith("model.") or result.get("status") != "success":
+                    continue
+                completed = [
+                    _parse_timestamp(t.get("completed_at"))
+                    for t in result.get("timing", [])
+                    if t.get("name") == "execute"
+                ]
+                completed = [c for c in completed if c]
+                if completed:
+                    built_at[unique_id.split(".")[-1].lower()] = max(completed)
+
+        self._built_at = built_at
+        self._mtimes = mtimes
+        logger.info(f"Loaded dbt build times for {len(built_at)} models from {self.target_dir}")
+
+    def last_built(self, model_name: str) -> Optional[float]:
+        """Return the last build time (epoch seconds) for a model, if known."""
+        with self._lock:
+            self._refresh()
+            return self._built_at.get(model_name.lower())
@@ -0,0 +1,329 @@
+"""
+In-process DuckDB execution backend for the marts.
+
+Serves the semantic API from exported Parquet snapshots of the dbt marts
+instead of BigQuery: on a laptop, in CI, or as a low-latency serving tier.
+Each ``<table>.parquet`` file (or ``<table>/`` directory of Parquet files)
+under DUCKDB_MARTS_DIR becomes a view named after the table, and the
+BigQuery dialect emitted by the LLM is translated to DuckDB before running.
+When the directory was written by mart_snapshots.py, tables listed in its
+manifest are served from memory-mapped Arrow tables instead of re-reading
+the Parquet files on every query.
+"""
+
+import os
+import re
+import glob
+import logging
+import threading
+from typing import Optional, List, Dict, Callable
+
+from sql_utils import tokenize_sql, referenced_tables
+from streaming import QueryResult
+from mart_snapshots import SnapshotReader, SNAPSHOT_DIR, MANIFEST_NAME, ARROW_AVAILABLE
+
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    DUCKDB_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DUCKDB_MARTS_DIR = SNAPSHOT_DIR
+DUCKDB_THREADS = int(os.environ.get("DUCKDB_THREADS", "4"))
+
+# Serve manifest tables from memory-mapped Arrow tables kept in memory
+DUCKDB_MMAP_SNAPSHOTS = os.environ.get("DUCKDB_MMAP_SNAPSHOTS", "true").lower() == "true"
+
+# BigQuery functions with no DuckDB equivalent; queries using them stay on BigQuery
+_UNSUPPORTED_RE = re.compile(r"\b(HLL_COUNT|ML|NET|KEYS|AEAD)\.\w+\s*\(|\bAPPROX_TOP_(COUNT|SUM)\s*\(", re.IGNORECASE)
+
+
+# ============================================================================
+# BigQuery -> DuckDB dialect translation
+# ============================================================================
+
+_DATE_PARTS = {
+    "isoweek": "week",
+    "isoyear": "year",
+    "dayofweek": "dow",
+    "dayofyear": "doy",
+}
+
+_TYPE_NAMES = {
+    "INT64": "BIGINT",
+    "FLOAT64": "DOUBLE",
+    "STRING": "VARCHAR",
+    "BYTES": "BLOB",
+    "BIGNUMERIC": "DECIMAL(38, 9)",
+    "NUMERIC": "DECIMAL(38, 9)",
+    "BOOL": "BOOLEAN",
+}
+
+# BigQuery WEEK starts on Sunday, WEEK(<day>) on the given day; DuckDB's 'week' starts on Monday
+_WEEKDAYS = {"sunday": 0, "monday": 1, "tuesday": 2, "wednesday": 3, "thursday": 4, "friday": 5, "saturday": 6}
+_WEEK_RE = re.compile(r"^\s*WEEK\s*(?:\(\s*([A-Za-z]+)\s*\))?\s*$", re.IGNORECASE)
+
+_PLACEHOLDER_RE = re.compile(r"\x00(\d+)\x00")
+_PART_RE = re.compile(r"^\s*([A-Za-z]+)(\s*\(\s*\w+\s*\))?\s*$")
+_TYPE_RE = re.compile(r"\bAS\s+(" + "|".join(_TYPE_NAMES) + r")\b", re.IGNORECASE)
+
+
+def _date_part(arg: str) -> Optional[str]:
+    """Turn a BigQuery date part (MONTH, WEEK(MONDAY), ISOWEEK) into a DuckDB string literal."""
+    match = _PART_RE.match(arg)
+    if not match:
+        return None
+    part = match.group(1).lower()
+    return f"'{_DATE_PARTS.get(part, part)}'"
+
+
+def _week_start(arg: str) -> Optional[int]:
+    """Day (0 = Sunday, as DuckDB's dayofweek) a BigQuery WEEK / WEEK(<day>) part starts on, else None."""
+    match = _WEEK_RE.match(arg)
+    if not match:
+        return None
+    return _WEEKDAYS.get((match.group(1) or "sunday").lower())
+
+
+def _split_args(text: str, start: int) -> Optional[tuple]:
+    """Split the argument list opening at text[start] ('('); return (args, end index)."""
+    depth = 0
+    args = []
+    current = start + 1
+    for i in range(start, len(text)):
+        char = text[i]
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth == 0:
+                args.append(text[current:i].strip())
+                return args, i + 1
+        elif char == "," and depth == 1:
+            args.append(text[current:i].strip())
+            current = i + 1
+    return None
+
+
+def _rewrite_calls(sql: str, name: str, rewrite: Callable[[List[str]], Optional[str]]) -> str:
+    """
+    Replace every call NAME(args...) with rewrite(args).
+
+    Nested calls inside the arguments are rewritten first, and scanning
+    continues after each replacement, so translated output (which may
+    contain a DuckDB function of the same name) is never rewritten again.
+    """
+    pattern = re.compile(r"\b" + name + r"\s*\(", re.IGNORECASE)
+    out = []
+    position = 0
+    while True:
+        match = pattern.search(sql, position)
+        parsed = _split_args(sql, match.end() - 1) if match else None
+        if parsed is None:
+            out.append(sql[position:])
+            return "".join(out)
+        args, end = parsed
+        args = [_rewrite_calls(arg, name, rewrite) for arg in args]
+        replacement = rewrite(args)
+        if replacement is None:
+            replacement = sql[match.start():match.end()] + ", ".join(args) + ")"
+        out.append(sql[position:match.start()])
+        out.append(replacement)
+        position = end
+
+
+def _interval_arithmetic(operator: str, cast: Optional[str]) -> Callable[[List[str]], Optional[str]]:
+    def rewrite(args: List[str]) -> Optional[str]:
+        if len(args) != 2:
+            return None
+        expression = f"({args[0]} {operator} {args[1]})"
+        return f"CAST({expression} AS {cast})" if cast else expression
+    return rewrite
+
+
+def _truncate(cast: Optional[str]) -> Callable[[List[str]], Optional[str]]:
+    def rewrite(args: List[str]) -> Optional[str]:
+        if len(args) != 2:
+            return None
+        week_start = _week_start(args[1])
+        if week_start is not None:
+            # step back to the most recent week_start day
+            expression = (
+                f"(date_trunc('day', {args[0]}) - "
+                f"to_days(CAST((dayofweek({args[0]}) + 7 - {week_start}) % 7 AS INTEGER)))"
+            )
+        elif _date_part(args[1]) is None:
+            return None
+        else:
+            expression = f"date_trunc({_date_part(args[1])}, {args[0]})"
+        return f"CAST({expression} AS {cast})" if cast else expression
+    return rewrite
+
+
+def _date_diff(args: List[str]) -> Optional[str]:
+    if len(args) != 3 or _date_part(args[2]) is None:
+        return None
+    return f"date_diff({_date_part(args[2])}, {args[1]}, {args[0]})"
+
+
+_CALL_REWRITES = [
+    ("SAFE_DIVIDE", lambda a: f"(CASE WHEN ({a[1]}) = 0 THEN NULL ELSE ({a[0]}) / ({a[1]}) END)" if len(a) == 2 else None),
+    ("COUNTIF", lambda a: f"count_if({a[0]})" if len(a) == 1 else None),
+    ("SAFE_CAST", lambda a: f"TRY_CAST({a[0]})" if len(a) == 1 else None),
+    ("DATE_TRUNC", _truncate("DATE")),
+    ("DATETIME_TRUNC", _truncate(None)),
+    ("TIMESTAMP_TRUNC", _truncate(None)),
+    ("DATE_SUB", _interval_arithmetic("-", "DATE")),
+    ("DATE_ADD", _interval_arithmetic("+", "DATE")),
+    ("DATETIME_SUB", _interval_arithmetic("-", None)),
+    ("DATETIME_ADD", _interval_arithmetic("+", None)),
+    ("TIMESTAMP_SUB", _interval_arithmetic("-", None)),
+    ("TIMESTAMP_ADD", _interval_arithmetic("+", None)),
+    ("DATE_DIFF", _date_diff),
+    ("DATETIME_DIFF", _date_diff),
+    ("TIMESTAMP_DIFF", _date_diff),
+    ("FORMAT_DATE", lambda a: f"strftime({a[1]}, {a[0]})" if len(a) == 2 else None),
+    ("FORMAT_TIMESTAMP", lambda a: f"strftime({a[1]}, {a[0]})" if len(a) == 2 else None),
+]
+
+
+def translate_bigquery_sql(sql: str) -> str:
+    """
+    Translate the BigQuery SQL the LLM emits into DuckDB SQL.
+
+    Covers what the prompt's examples use: backtick-quoted
+    ``project.dataset.table`` references, DATE_TRUNC/DATE_SUB/DATE_DIFF and
+    friends (BigQuery puts the date part last), SAFE_DIVIDE, COUNTIF,
+    SAFE_CAST, FORMAT_DATE and BigQuery type names. String literals are
+    never touched.
+    """
+    literals: List[str] = []
+    parts = []
+    for kind, token in tokenize_sql(sql):
+        if kind == "string":
+            literals.append(token)
+            parts.append(f"\x00{len(literals) - 1}\x00")
+        elif kind == "ident":
+            # `project.dataset.table` -> table; `col` -> "col"
+            name = token.strip("`").split(".")[-1]
+            parts.append(name if "." in token else f'"{name}"')
+        elif kind == "comment":
+            parts.append(" ")
+        else:
+            parts.append(token)
+    masked = "".join(parts)
+
+    # unquoted [project.]dataset.table references
+    masked = re.sub(
+        r"\b(from|join)\s+(?:[A-Za-z_][\w\-]*\.)?[A-Za-z_]\w*\.([A-Za-z_]\w*)",
+        r"\1 \2",
+        masked,
+        flags=re.IGNORECASE
+    )
+    for name, rewrite in _CALL_REWRITES:
+        masked = _rewrite_calls(masked, name, rewrite)
+    masked = _TYPE_RE.sub(lambda m: "AS " + _TYPE_NAMES[m.group(1).upper()], masked)
+
+    return _PLACEHOLDER_RE.sub(lambda m: literals[int(m.group(1))], masked)
+
+
+# ============================================================================
+# Backend
+# ============================================================================
+
+class DuckDBBackend:
+    """
+    Runs translated mart queries against Parquet snapshots in-process.
+
+    One in-memory database holds a view per exported table; every query runs
+    on its own cursor so worker threads can execute concurrently. Snapshot
+    tables are registered on each cursor as zero-copy Arrow scans, which
+    take precedence over the Parquet views.
+    """
+
+    def __init__(self, marts_dir: str = DUCKDB_MARTS_DIR, threads: int = DUCKDB_THREADS,
+                 mmap_snapshots: bool = DUCKDB_MMAP_SNAPSHOTS):
+        if not DUCKDB_AVAILABLE:
+            raise RuntimeError("duckdb is not installed")
+        self.marts_dir = marts_dir
+        self._conn = duckdb.connect(":memory:", config={"threads": threads})
+        self._lock = threading.Lock()
+        self.tables: Dict[str, str] = {}
+        self.snapshot: Optional[SnapshotReader] = None
+        if mmap_snapshots and ARROW_AVAILABLE and os.path.exists(os.path.join(marts_dir, MANIFEST_NAME)):
+            self.snapshot = SnapshotReader(marts_dir)
+        self.refresh()
+
+    def refresh(self) -> List[str]:
+        """(Re)create one view per Parquet table found in marts_dir."""
+        found = {}
+        for path in sorted(glob.glob(os.path.join(self.marts_dir, "*"))):
+            name, ext = os.path.splitext(os.path.basename(path))
+            if os.path.isdir(path):
+                source = os.path.join(path, "**", "*.parquet")
+                if not glob.glob(source, recursive=True):
+                    continue
+            elif ext == ".parquet":
+                source = path
+            else:
+                continue
+            found[name] = source
+
+        with self._lock:
+            for name, source in found.items():
+                escaped = source.replace("'", "''")
+                self._conn.execute(
+                    f'CREATE OR REPLACE VIEW "{name}" AS '
+                    f"SELECT * FROM read_parquet('{escaped}', hive_partitioning = true)"
+                )
+            self.tables = found
+        logger.info(f"DuckDB backend serving {len(found)} tables from {self.marts_dir}")
+        return list(found)
+
+    def can_serve(self, sql: str) -> bool:
+        """True if every table the query reads has a snapshot and its functions translate."""
+        tables = referenced_tables(sql)
+        return bool(tables) and all(t in self.tables for t in tables) and not _UNSUPPORTED_RE.search(sql)
+
+    def estimate_bytes(self, sql: str) -> int:
+        """Upper-bound bytes a query reads: the on-disk size of every snapshot it references."""
+        total = 0
+        for name in referenced_tables(sql):
+            source = self.tables.get(name)
+            if source:
+                total += sum(os.path.getsize(path) for path in glob.glob(source, recursive=True))
+        return total
+
+    def execute(self, sql: str, max_rows: Optional[int] = None) -> QueryResult:
+        """Translate and run a BigQuery SQL statement; blocking, call from a worker thread."""
+        if self.snapshot and self.snapshot.reload_if_changed():
+            self.refresh()
+        translated = translate_bigquery_sql(sql)
+        logger.info(f"Executing DuckDB SQL: {translated}")
+        cursor = self._conn.cursor()
+        try:
+            if self.snapshot:
+                snapshot_tables = set(self.snapshot.tables)
+                for name in referenced_tables(sql):
+                    if name in snapshot_tables:
+                        cursor.register(name, self.snapshot.table(name))
+            cursor.execute(translated)
+            columns = [d[0] for d in cursor.description]
+            if max_rows is None:
+                rows = [dict(zip(columns, values)) for values in cursor.fetchall()]
+                return QueryResult(rows=rows, row_count=len(rows))
+            # results stream, so only the first page (plus one probe row) is materialized
+            fetched = cursor.fetchmany(max_rows + 1)
+            row_count = len(fetched)
+            if row_count > max_rows:
+                cursor.execute(f"SELECT COUNT(*) FROM ({translated}) AS _counted")
+                row_count = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+        rows = [dict(zip(columns, values)) for values in fetched[:max_rows]]
+        return QueryResult(rows=rows, row_count=row_count)
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,122 @@
+"""
+First-success execution of alternative routes for one answer.
+
+A question routed to Cube can usually also be answered by an equivalent
+SQL query. RouteHedger runs the alternatives as staggered attempts: each
+starts after its own delay (0 = immediately) or, with no delay, only once
+every running attempt has failed. The first attempt to succeed wins and
+the others are cancelled; the caller only sees an error when all of them
+failed.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (name, coroutine factory, seconds to wait before starting, or None to start only as a fallback)
+Attempt = Tuple[str, Callable[[], Awaitable[Any]], Optional[float]]
+
+
+class AllAttemptsFailed(Exception):
+    def __init__(self, errors: Dict[str, str]):
+        super().__init__("; ".join(f"{name}: {error}" for name, error in errors.items()))
+        self.errors = errors
+
+
+@dataclass
+class HedgeOutcome:
+    winner: str
+    result: Any
+    started: List[str] = field(default_factory=list)
+    errors: Dict[str, str] = field(default_factory=dict)
+    cancelled: List[str] = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "winner": self.winner,
+            "started": self.started,
+            "errors": self.errors,
+            "cancelled": self.cancelled,
+            "elapsed_ms": self.elapsed_ms,
+        }
+
+
+def _retrieve(task: asyncio.Future) -> None:
+    # losers may fail after being abandoned; mark their exceptions as seen
+    if not task.cancelled():
+        task.exception()
+
+
+class RouteHedger:
+    """Runs staggered attempts and keeps win/fallback counters for /stats."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.runs = 0
+        self.wins: Dict[str, int] = {}
+        self.secondary_started = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    async def run(self, attempts: List[Attempt]) -> HedgeOutcome:
+        """Return the first successful attempt; raise AllAttemptsFailed if none succeeds."""
+        self.runs += 1
+        loop = asyncio.get_running_loop()
+        started_at = loop.time()
+        pending = list(attempts)
+        running: Dict[asyncio.Future, str] = {}
+        started: List[str] = []
+        errors: Dict[str, str] = {}
+        try:
+            while pending or running:
+                now = loop.time() - started_at
+                for attempt in list(pending):
+                    name, factory, delay = attempt
+                    if (delay is not None and delay <= now) or not running:
+                        pending.remove(attempt)
+                        task = asyncio.ensure_future(factory())
+                        task.add_done_callback(_retrieve)
+                        running[task] = name
+                        started.append(name)
+                        if len(started) > 1:
+                            self.secondary_started += 1
+                            logger.info(f"{self.name}: starting {name} after {now * 1000:.0f}ms ({', '.join(errors) or 'no answer yet'})")
+                timers = [delay - now for _, _, delay in pending if delay is not None]
+                done, _ = await asyncio.wait(
+                    running, timeout=max(0.0, min(timers)) if timers else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    name = running.pop(task)
+                    if task.exception() is not None:
+                        errors[name] = str(task.exception()) or type(task.exception()).__name__
+                        logger.warning(f"{self.name}: {name} failed: {errors[name]}")
+                        continue
+                    cancelled = list(running.values())
+                    self.wins[name] = self.wins.get(name, 0) + 1
+                    self.cancelled += len(cancelled)
+                    return HedgeOutcome(
+                        winner=name,
+                        result=task.result(),
+                        started=started,
+                        errors=errors,
+                        cancelled=cancelled,
+                        elapsed_ms=round((loop.time() - started_at) * 1000, 1)
+                    )
+            self.failed += 1
+            raise AllAttemptsFailed(errors)
+        finally:
+            for task in running:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "wins": dict(self.wins),
+            "secondary_started": self.secondary_started,
+            "cancelled": self.cancelled,
+            "all_failed": self.failed,
+        }
@@ -0,0 +1,315 @@
+"""
+Deterministic intent matching for common metric questions.
+
+Questions like "What is our total revenue?" map one-to-one onto the
+pre-built Cube queries in cube_client.INTENT_TO_CUBE_QUERY, so they do not
+need a Gemini round-trip. The matcher combines a few anchored regex rules
+with a small TF-IDF index over canonical phrasings, built from the measure
+and dimension titles in the Cube YAML model plus hand-written aliases.
+
+A match is only accepted when every meaningful word of the question is part
+of the intent's vocabulary. Anything the pre-built query cannot honour
+(a filter value, another time window, a product category, ...) therefore
+falls through to the LLM.
+"""
+
+import os
+import re
+import math
+import glob
+import logging
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Any, Callable, Tuple
+
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    YAML_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+CUBE_MODEL_DIR = os.environ.get(
+    "CUBE_MODEL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cube", "model", "cubes")
+)
+
+# Hand-written aliases; the Cube YAML adds phrasings built from member titles
+INTENT_PHRASINGS: Dict[str, List[str]] = {
+    "total_revenue": [
+        "what is our total revenue",
+        "how much revenue have we made",
+        "how much money did we make",
+        "total sales",
+        "overall revenue",
+    ],
+    "total_orders": [
+        "how many orders do we have",
+        "total number of orders",
+        "order count",
+    ],
+    "average_order_value": [
+        "what is the average order value",
+        "aov",
+        "average order size",
+        "average revenue per order",
+    ],
+    "revenue_by_country": [
+        "revenue by country",
+        "which countries generate the most revenue",
+        "sales per country",
+        "revenue breakdown by country",
+    ],
+    "orders_by_status": [
+        "orders by status",
+        "order status breakdown",
+        "how many orders per status",
+        "orders grouped by status",
+    ],
+    "daily_revenue": [
+        "daily revenue",
+        "revenue per day for the last 30 days",
+        "daily revenue trend",
+    ],
+    "user_count": [
+        "how many users do we have",
+        "total number of users",
+        "how many customers do we have",
+        "user count",
+    ],
+}
+
+# Anchored patterns that are unambiguous enough to skip scoring entirely. They match
+# the _normalize()d question: lowercase words, apostrophes removed ("whats")
+INTENT_RULES: List[Tuple[str, str]] = [
+    ("total_revenue", r"^(what is|whats|show( me)?)? ?(our|the)? ?total (revenue|sales)$"),
+    ("total_orders", r"^how many orders( (do|did) we have)?$"),
+    ("average_order_value", r"^(what is|whats)? ?(our|the)? ?(average order value|aov)$"),
+    ("revenue_by_country", r"^(show( me)? )?(total )?(revenue|sales) (by|per) country$"),
+    ("orders_by_status", r"^(show( me)? )?orders (by|per) status$"),
+    ("user_count", r"^how many (users|customers)( (do|did) we have)?$"),
+]
+
+# Words that carry no meaning for intent selection
+STOPWORDS = {
+    "a", "an", "the", "our", "we", "i", "is", "are", "was", "were", "be",
+    "what", "whats", "which", "how", "show", "me", "give", "tell", "get", "list",
+    "of", "by", "per", "for", "to", "in", "do", "did", "does", "have", "has", "so", "far",
+    "please", "current", "currently", "can", "you", "all", "there", "and", "with",
+}
+
+SYNONYMS = {
+    "sales": "revenue",
+    "customer": "user",
+    "money": "revenue",
+    "made": "make",
+    "countrie": "country",
+    "day": "daily",
+}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, split into words, drop stopwords and fold plurals/synonyms."""
+    tokens = []
+    for word in _WORD_RE.findall(text.lower().replace("'", "")):
+        if word in STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        tokens.append(SYNONYMS.get(word, word))
+    return tokens
+
+
+def _normalize(text: str) -> str:
+    return " ".join(_WORD_RE.findall(text.lower().replace("'", "")))
+
+
+def load_member_titles(model_dir: str = CUBE_MODEL_DIR) -> Dict[str, str]:
+    """Read "cube.member" -> title from the Cube YAML model (empty if unavailable)."""
+    titles: Dict[str, str] = {}
+    if not YAML_AVAILABLE or not os.path.isdir(model_dir):
+        return titles
+    for path in sorted(glob.glob(os.path.join(model_dir, "*.y*ml"))):
+        try:
+            with open(path) as f:
+                model = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as e:
+            logger.warning(f"Could not read Cube model {path}: {e}")
+            continue
+        for cube in model.get("cubes", []):
+            for section in ("measures", "dimensions"):
+                for member in cube.get(section, []):
+                    name = f"{cube['name']}.{member['name']}"
+                    titles[name] = member.get("title") or member["name"].replace("_", " ")
+    return titles
+
+
+def _member_phrase(member: str, titles: Dict[str, str]) -> str:
+    if member in titles:
+        return titles[member]
+    cube, name = member.split(".", 1)
+    return f"{cube} {name}".replace("_", " ")
+
+
+def phrasings_from_query(query_kwargs: Dict[str, Any], titles: Dict[str, str]) -> List[str]:
+    """Canonical phrasings for a pre-built query, e.g. "Total Revenue by country"."""
+    dimensions = [_member_phrase(d, titles) for d in query_kwargs.get("dimensions") or []]
+    granularities = [td.get("granularity") for td in query_kwargs.get("time_dimensions") or []]
+    phrasings = []
+    for measure in query_kwargs.get("measures", []):
+        phrase = _member_phrase(measure, titles)
+        if dimensions:
+            phrase += " by " + " and ".join(d.split()[-1] for d in dimensions)
+        for granularity in granularities:
+            if granularity:
+                phrase += f" per {granularity}"
+        phrasings.append(phrase)
+    return phrasings
+
+
+@dataclass
+class IntentMatch:
+    intent: str
+    confidence: float
+    method: str  # "rule" or "tfidf"
+    query_kwargs: Dict[str, Any]
+
+
+class IntentMatcher:
+    """
+    Maps questions onto pre-built Cube queries without calling the LLM.
+
+    Rules are tried first; otherwise the question is scored against every
+    phrasing with TF-IDF cosine similarity. The best intent must clear
+    ``threshold``, beat the runner-up by ``margin`` and cover every
+    meaningful word of the question.
+    """
+
+    def __init__(
+        self,
+        intent_queries: Dict[str, Callable[..., Dict[str, Any]]],
+        phrasings: Dict[str, List[str]],
+        threshold: float = 0.75,
+        margin: float = 0.1
+    ):
+        self.intent_queries = intent_queries
+        self.threshold = threshold
+        self.margin = margin
+        self.rules = [
+            (intent, re.compile(pattern))
+            for intent, pattern in INTENT_RULES
+            if intent in intent_queries
+        ]
+
+        self._docs: List[Tuple[str, Dict[str, float]]] = []
+        self.vocabulary: Dict[str, set] = {}
+        tokenized = [
+            (intent, tokenize(text))
+            for intent, texts in phrasings.items() if intent in intent_queries
+            for text in texts
+        ]
+        doc_freq: Dict[str, int] = {}
+        for intent, tokens in tokenized:
+            self.vocabulary.setdefault(intent, set()).update(tokens)
+            for token in set(tokens):
+                doc_freq[token] = doc_freq.get(token, 0) + 1
+        self._idf = {
+            token: math.log((1 + len(tokenized)) / (1 + df)) + 1
+            for token, df in doc_freq.items()
+        }
+        for intent, tokens in tokenized:
+            if tokens:
+                self._docs.append((intent, self._vector(tokens)))
+
+        self.checked = 0
+        self.matched = 0
+        self.rule_matches = 0
+
+    def _vector(self, tokens: List[str]) -> Dict[str, float]:
+        weights: Dict[str, float] = {}
+        for token in tokens:
+            weights[token] = weights.get(token, 0.0) + self._idf.get(token, 0.0)
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        return {t: w / norm for t, w in weights.items()} if norm else {}
+
+    def _scores(self, tokens: List[str]) -> Dict[str, float]:
+        vector = self._vector(tokens)
+        scores: Dict[str, float] = {}
+        for intent, doc in self._docs:
+            score = sum(w * doc.get(t, 0.0) for t, w in vector.items())
+            if score > scores.get(intent, 0.0):
+                scores[intent] = score
+        return scores
+
+    def _accept(self, question: str, intent: str, confidence: float, method: str) -> IntentMatch:
+        self.matched += 1
+        logger.info(f"Intent fast-path: '{question}' -> {intent} ({method}, {confidence:.2f})")
+        return IntentMatch(
+            intent=intent,
+            confidence=round(confidence, 4),
+            method=method,
+            query_kwargs=self.intent_queries[intent]()
+        )
+
+    def match(self, question: str) -> Optional[IntentMatch]:
+        """Return the pre-built query for a question, or None to use the LLM."""
+        self.checked += 1
+        normalized = _normalize(question)
+        for intent, pattern in self.rules:
+            if pattern.match(normalized):
+                self.rule_matches += 1
+                return self._accept(question, intent, 1.0, "rule")
+
+        tokens = tokenize(question)
+        if not tokens:
+            return None
+        ranked = sorted(self._scores(tokens).items(), key=lambda item: item[1], reverse=True)
+        if not ranked:
+            return None
+        intent, best = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if best < self.threshold or best - runner_up < self.margin:
+            return None
+        if not set(tokens) <= self.vocabulary.get(intent, set()):
+            return None
+        return self._accept(question, intent, best, "tfidf")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "intents": len(self.intent_queries),
+            "phrasings": len(self._docs),
+            "checked": self.checked,
+            "matched": self.matched,
+            "rule_matches": self.rule_matches,
+            "match_rate": round(self.matched / self.checked, 4) if self.checked else 0.0,
+        }
+
+
+def build_intent_matcher(
+    intent_queries: Dict[str, Callable[..., Dict[str, Any]]]
+) -> Optional[IntentMatcher]:
+    """Build the matcher from env configuration, or None when disabled."""
+    if os.environ.get("INTENT_FASTPATH_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        logger.info("Intent fast-path disabled")
+        return None
+
+    titles = load_member_titles()
+    phrasings = {intent: list(texts) for intent, texts in INTENT_PHRASINGS.items()}
+    for intent, factory in intent_queries.items():
+        phrasings.setdefault(intent, []).extend(phrasings_from_query(factory(), titles))
+
+    matcher = IntentMatcher(
+        intent_queries,
+        phrasings,
+        threshold=float(os.environ.get("INTENT_MATCH_THRESHOLD", "0.75")),
+        margin=float(os.environ.get("INTENT_MATCH_MARGIN", "0.1"))
+    )
+    logger.info(
+        f"Intent fast-path ready: {len(intent_queries)} intents, "
+        f"{'Cube YAML titles loaded' if titles else 'built-in phrasings only'}"
+    )
+    return matcher
@@ -0,0 +1,125 @@
+"""
+Incremental parsing of the JSON object Gemini streams back.
+
+IncrementalJSONObject is fed text chunks as they arrive and reports each
+top-level field the moment its value is complete, so routing can act on
+`route` and `cube_query` while `explanation` is still being generated.
+The value of the field currently being written is available as a partial
+string for streaming it on to the client. Text around the object (e.g.
+Markdown fences) is ignored, as in the non-streaming extraction.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class IncrementalJSONObject:
+    """Scans a streamed JSON object one chunk at a time."""
+
+    def __init__(self):
+        self.text = ""
+        self.fields: Dict[str, Any] = {}
+        self.complete = False
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._start: Optional[int] = None  # index of the object's opening brace
+        self._token_start = 0  # start of the current key or value at depth 1
+        self._key: Optional[str] = None  # key whose value is being read
+        self._value_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk; return the top-level (key, value) pairs it completed."""
+        self.text += chunk
+        completed = []
+        text = self.text
+        while self._pos < len(text) and not self.complete:
+            ch = text[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1 and self._value_start is None:
+                        self._key = json.loads(text[self._token_start:self._pos + 1])
+            elif self._start is None:
+                if ch == "{":
+                    self._start = self._pos
+                    self._stack.append("}")
+            elif ch == '"':
+                self._in_string = True
+                if len(self._stack) == 1:
+                    if self._key is None:
+                        self._token_start = self._pos
+                    elif self._value_start is None:
+                        self._value_start = self._pos
+            elif ch in _CLOSERS:
+                if len(self._stack) == 1 and self._value_start is None:
+                    self._value_start = self._pos
+                self._stack.append(_CLOSERS[ch])
+            elif ch in "}]":
+                if not self._stack or ch != self._stack[-1]:
+                    raise ValueError(f"unbalanced {ch!r} at offset {self._pos}")
+                self._stack.pop()
+                if not self._stack:
+                    completed += self._finish_value(self._pos)
+                    self.complete = True
+            elif len(self._stack) == 1:
+                if ch == ",":
+                    completed += self._finish_value(self._pos)
+                elif ch == ":" or ch.isspace():
+                    pass
+                elif self._key is not None and self._value_start is None:
+                    self._value_start = self._pos  # number, true, false or null
+            self._pos += 1
+        return completed
+
+    def _finish_value(self, end: int) -> List[Tuple[str, Any]]:
+        if self._key is None or self._value_start is None:
+            return []
+        key, value = self._key, json.loads(self.text[self._value_start:end])
+        self._key, self._value_start = None, None
+        self.fields[key] = value
+        return [(key, value)]
+
+    def partial_string(self, key: str) -> Optional[str]:
+        """The decoded text received so far of a string field, or None if it is not being read."""
+        if key in self.fields:
+            value = self.fields[key]
+            return value if isinstance(value, str) else None
+        if self._key != key or self._value_start is None or self.text[self._value_start] != '"':
+            return None
+        raw = self.text[self._value_start + 1:self._pos]
+        # drop a trailing escape sequence that has not fully arrived yet
+        cut = raw.rfind("\\")
+        if cut != -1 and not _complete_escape(raw[cut:]) and not _escaped_backslash(raw, cut):
+            raw = raw[:cut]
+        try:
+            return json.loads(f'"{raw}"')
+        except json.JSONDecodeError:
+            return None
+
+    def value(self) -> Dict[str, Any]:
+        """The whole object; raises json.JSONDecodeError if it did not arrive complete."""
+        if not self.complete:
+            raise json.JSONDecodeError("Unterminated JSON object", self.text, len(self.text))
+        return json.loads(self.text[self._start:self._pos])
+
+
+def _escaped_backslash(raw: str, index: int) -> bool:
+    # the backslash at index is itself escaped by an odd run of backslashes before it
+    run = 0
+    while index - run - 1 >= 0 and raw[index - run - 1] == "\\":
+        run += 1
+    return run % 2 == 1
+
+
+def _complete_escape(tail: str) -> bool:
+    if len(tail) < 2:
+        return False
+    return tail[1] != "u" or len(tail) >= 6
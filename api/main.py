@@ -1,26 +1,78 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional, List, Any, Dict
+from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from pydantic import BaseModel, Field
+from typing import Optional, List, Any, Dict, Tuple, Callable
 from google.cloud import bigquery
 import vertexai
 from vertexai.generative_models import GenerativeModel, GenerationConfig
 import os
+import copy
+import datetime
 import json
+import time
+import asyncio
 import logging
-from prompts import SYSTEM_PROMPT, SCHEMA_SUMMARY
+from prompts import SYSTEM_PROMPT, SCHEMA_SUMMARY, DUAL_ROUTE_RULE
+from hedging import RouteHedger, AllAttemptsFailed
+from schema_retrieval import build_schema_retriever
+from json_stream import IncrementalJSONObject
+from telemetry import (
+    stage,
+    span,
+    configure_tracing,
+    record_request,
+    record_answer,
+    metrics_payload,
+    stats as telemetry_stats,
+    PROMETHEUS_AVAILABLE
+)
+from cache import build_translation_cache, build_result_cache, TranslationCache
+from dbt_artifacts import ModelFreshness
+from singleflight import SingleFlight, cube_query_key
+from sql_utils import canonicalize_sql
+from columnar import negotiate_format, columnar_response
+from duckdb_backend import DuckDBBackend, DUCKDB_AVAILABLE
+from mart_snapshots import discover_models
+from query_planner import build_query_planner
+from sql_guard import (
+    SQLGuard,
+    SQLRejected,
+    GuardResult,
+    check_read_only,
+    PartitionSpec,
+    SQL_GUARD_ENABLED,
+    SQL_JOB_TIMEOUT_SECONDS
+)
+from streaming import (
+    QueryResult,
+    first_page,
+    read_page,
+    CursorExpired,
+    QUERY_MAX_PAGE_SIZE,
+    ndjson_stream,
+    ndjson_rows,
+    sse_event,
+    arrow_stream,
+    arrow_rows,
+    NDJSON_MEDIA_TYPE,
+    SSE_MEDIA_TYPE,
+    ARROW_STREAM_MEDIA_TYPE,
+    ARROW_AVAILABLE
+)
 
 # Import Cube client
 try:
     from cube_client import (
-        check_cube_health,
-        get_cube_meta,
-        query_cube,
-        get_total_revenue_by_date,
-        get_revenue_by_country,
-        get_order_metrics,
-        get_user_metrics,
-        get_orders_by_status
+        check_cube_health_async,
+        get_cube_meta_async,
+        build_cube_query,
+        load_cube_query_async,
+        close_async_client,
+        METRIC_QUERIES,
+        INTENT_TO_CUBE_QUERY
     )
+    from intent_matcher import build_intent_matcher
+    from cube_schema import build_cube_schema, CubeQueryInvalid, CUBE_SCHEMA_REFRESH_SECONDS, GRANULARITIES
     CUBE_AVAILABLE = True
 except ImportError:
     CUBE_AVAILABLE = False
@@ -35,15 +87,31 @@ app = FastAPI(
     version="2.0.0"
 )
 
+MODEL_NAME = os.environ.get("GEMINI_MODEL", "gemini-2.5-flash")
+
+# Stream Gemini's answer and act on each JSON field as soon as it is complete
+LLM_STREAMING = os.environ.get("LLM_STREAMING", "true").lower() == "true"
+
+# "bigquery" (default), "duckdb" to serve all SQL from local Parquet snapshots of the
+# marts, or "snapshot" to serve queries from the snapshots whenever every table they
+# read was exported (mart_snapshots.py) and fall back to BigQuery otherwise
+QUERY_BACKEND = os.environ.get("QUERY_BACKEND", "bigquery").lower()
+
+# How a Cube-routed question uses the equivalent SQL Gemini writes alongside it:
+# "fallback" (default) runs it only when Cube fails or returns nothing, "hedge"
+# also starts it when Cube has not answered after ROUTE_HEDGE_DELAY_MS, "parallel"
+# races both from the start and "off" never asks for it. First success wins.
+ROUTE_HEDGING = os.environ.get("ROUTE_HEDGING", "fallback").lower()
+ROUTE_HEDGE_DELAY_MS = int(os.environ.get("ROUTE_HEDGE_DELAY_MS", "1500"))
+
 # Initialize clients at startup
 def get_clients():
     project_id = os.environ.get("GCP_PROJECT_ID", "semantic-layer-484020")
     logger.info(f"Initializing Vertex AI with project: {project_id}")
     try:
         vertexai.init(project=project_id, location="us-central1")
-        model_name = "gemini-2.5-flash"
-        logger.info(f"Using model: {model_name}")
-        llm = GenerativeModel(model_name) 
+        logger.info(f"Using model: {MODEL_NAME}")
+        llm = GenerativeModel(MODEL_NAME)
         bq = bigquery.Client(project=project_id)
         return llm, bq
     except Exception as e:
@@ -51,17 +119,151 @@ def get_clients():
         return None, None
 
 llm_client, bq_client = None, None
+duckdb_backend = None
 cube_healthy = False
+translation_cache = build_translation_cache()
+model_freshness = ModelFreshness()
+result_cache = build_result_cache(model_freshness.last_built)
+
+# Per-question prompts with only the relevant cubes, tables and examples
+schema_retriever = build_schema_retriever()
+
+# Common metric questions are answered from pre-built Cube queries without Gemini
+intent_matcher = build_intent_matcher(INTENT_TO_CUBE_QUERY) if CUBE_AVAILABLE else None
+
+# Cube queries are validated against a local index of the model before they are sent
+cube_schema = build_cube_schema() if CUBE_AVAILABLE else None
+cube_schema_task: Optional[asyncio.Task] = None
+
+# Per-backend concurrency limits so a burst of ad-hoc NLQ traffic cannot
+# exhaust the capacity needed by the fast Cube metric endpoints
+BACKEND_LIMITS = {
+    "llm": int(os.environ.get("LLM_MAX_CONCURRENCY", "8")),
+    "bigquery": int(os.environ.get("BQ_MAX_CONCURRENCY", "8")),
+    "cube": int(os.environ.get("CUBE_MAX_CONCURRENCY", "32")),
+    "duckdb": int(os.environ.get("DUCKDB_MAX_CONCURRENCY", "4")),
+}
+backend_semaphores = {name: asyncio.Semaphore(limit) for name, limit in BACKEND_LIMITS.items()}
+
+# Identical concurrent queries share one in-flight backend call
+cube_flights = SingleFlight("cube")
+bq_flights = SingleFlight("bigquery")
+
+# Cube vs. equivalent SQL for Cube-routed questions
+route_hedger = RouteHedger("ask")
+
+async def refresh_cube_schema():
+    """Keep the Cube schema index and the cached /meta response current."""
+    while True:
+        try:
+            await asyncio.to_thread(cube_schema.refresh_model)
+            async with backend_semaphores["cube"]:
+                meta = await get_cube_meta_async()
+            if meta is not None:
+                cube_schema.update_meta(meta)
+        except Exception as e:
+            logger.warning(f"Cube schema refresh failed: {e}")
+        await asyncio.sleep(CUBE_SCHEMA_REFRESH_SECONDS)
+
+def check_prebuilt_cube_queries():
+    """Log pre-built metric queries that no longer match the Cube model."""
+    for name, factory in {**METRIC_QUERIES, **INTENT_TO_CUBE_QUERY}.items():
+        try:
+            cube_schema.validate(build_cube_query(**factory()))
+        except CubeQueryInvalid as e:
+            logger.warning(f"Pre-built Cube query {name} is invalid: {e}")
 
 @app.on_event("startup")
 async def startup_event():
-    global llm_client, bq_client, cube_healthy
-    llm_client, bq_client = get_clients()
+    global llm_client, bq_client, cube_healthy, duckdb_backend, cube_schema_task
+    configure_tracing()
+    llm_client, bq_client = await asyncio.to_thread(get_clients)
+    if QUERY_BACKEND in ("duckdb", "snapshot"):
+        if DUCKDB_AVAILABLE:
+            duckdb_backend = await asyncio.to_thread(DuckDBBackend)
+        else:
+            logger.error(f"QUERY_BACKEND={QUERY_BACKEND} but duckdb is not installed; using BigQuery")
     if CUBE_AVAILABLE:
-        cube_healthy = check_cube_health()
+        cube_healthy = await check_cube_health_async()
         logger.info(f"Cube health: {'✅ Connected' if cube_healthy else '❌ Not available'}")
+    if cube_schema:
+        check_prebuilt_cube_queries()
+        cube_schema_task = asyncio.ensure_future(refresh_cube_schema())
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Wrap each request in a span and record its latency by route template."""
+    started = time.perf_counter()
+    status = 500
+    with span(f"{request.method} {request.url.path}", **{"http.method": request.method}) as current:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            route = request.scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            if current is not None:
+                current.update_name(f"{request.method} {path}")
+                current.set_attribute("http.route", path)
+                current.set_attribute("http.status_code", status)
+            record_request(request.method, path, status, time.perf_counter() - started)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if cube_schema_task:
+        cube_schema_task.cancel()
+    if CUBE_AVAILABLE:
+        await close_async_client()
+    if duckdb_backend:
+        duckdb_backend.close()
 
 BQ_DATASET = os.environ.get("BQ_DATASET", "retail_marts_dev")
+GCP_PROJECT_ID = os.environ.get("GCP_PROJECT_ID", "semantic-layer-484020")
+
+# Grains /metrics/unique-customers can group the merged sketches by
+SKETCH_GRAINS = ("day", "week", "month", "quarter", "year")
+
+def estimate_query_bytes(sql: str) -> tuple:
+    """Bytes a query will process and the tables it resolves to; blocking (dry run)."""
+    if runs_locally(sql):
+        return duckdb_backend.estimate_bytes(sql), None
+    if not bq_client:
+        return None, None
+    config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+    try:
+        job = bq_client.query(sql, job_config=config)
+    except Exception as e:
+        raise SQLRejected(f"Dry run failed: {e}")
+    tables = [f"{t.project}.{t.dataset_id}.{t.table_id}" for t in (job.referenced_tables or [])]
+    return job.total_bytes_processed, tables
+
+def build_sql_guard() -> Optional[SQLGuard]:
+    """Allow-list the marts in SCHEMA_SUMMARY; partition filters come from the dbt configs."""
+    if not SQL_GUARD_ENABLED:
+        return None
+    try:
+        partitions = {
+            m.name: PartitionSpec(m.partition_field, m.partition_type)
+            for m in discover_models() if m.partition_field
+        }
+    except Exception as e:
+        logger.warning(f"SQL guard running without partition pushdown: {e}")
+        partitions = {}
+    allowed = [table for tables in SCHEMA_SUMMARY.values() for table in tables]
+    return SQLGuard(allowed, GCP_PROJECT_ID, BQ_DATASET, estimate_query_bytes, partitions)
+
+sql_guard = build_sql_guard()
+
+# Aggregate queries are moved onto the coarsest pre-aggregated mart that answers them
+query_planner = build_query_planner()
+
+# Rows returned inline by /ask; the rest are reachable through next_cursor
+ASK_PAGE_SIZE = int(os.environ.get("ASK_PAGE_SIZE", "100"))
+
+# /batch limits
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "20"))
+BATCH_ITEM_TIMEOUT_SECONDS = float(os.environ.get("BATCH_ITEM_TIMEOUT_SECONDS", "30"))
 
 # ============================================================================
 # Pydantic Models
@@ -83,6 +285,16 @@ class NLQResponse(BaseModel):
     row_count: Optional[int] = None
     error: Optional[str] = None
     source: str = "bigquery"  # actual execution source
+    next_cursor: Optional[str] = None  # pass to /query/page for more rows
+    guard: Optional[dict] = None  # bytes estimate and rewrites applied by the SQL guard
+    rewrite: Optional[dict] = None  # set when the query planner moved the query to a coarser mart
+    hedge: Optional[dict] = None  # which of Cube / equivalent SQL answered a Cube-routed question
+
+class NLQStreamRequest(BaseModel):
+    query: str
+    format: str = "ndjson"  # "ndjson" or "arrow"
+    page_size: int = Field(1000, ge=1, le=QUERY_MAX_PAGE_SIZE)
+    max_rows: Optional[int] = None
 
 class CubeQueryRequest(BaseModel):
     measures: List[str]
@@ -98,17 +310,105 @@ class CubeQueryResponse(BaseModel):
     query: dict
     error: Optional[str] = None
 
+class BatchItem(BaseModel):
+    id: str
+    type: str  # "metric", "cube", "sql" or "ask"
+    metric: Optional[str] = None  # METRIC_QUERIES name, e.g. "revenue_daily"
+    params: Optional[Dict[str, Any]] = None  # arguments for the named metric
+    cube_query: Optional[CubeQueryRequest] = None
+    sql: Optional[str] = None
+    query: Optional[str] = None  # natural language question
+    max_rows: Optional[int] = None
+    timeout_seconds: Optional[float] = None
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem]
+    stream: bool = True  # NDJSON in completion order, else one JSON body in request order
+
 # ============================================================================
 # Helper Functions
 # ============================================================================
 
-def generate_sql(user_query: str) -> dict:
-    """Use Gemini to translate natural language to SQL."""
+def report_fields(llm_result: dict, on_event: Callable[[str, Any], None]) -> None:
+    """Report a whole translation the way a streamed one is reported."""
+    for item in llm_result.items():
+        on_event("field", item)
+    if llm_result.get("explanation"):
+        on_event("explanation", llm_result["explanation"])
+
+async def stream_llm(prompt: str, on_event: Callable[[str, Any], None]) -> Tuple[str, Any, Optional[IncrementalJSONObject]]:
+    """
+    Stream a Gemini answer, reporting each top-level JSON field as soon as it
+    is complete and the explanation text as it is written.
+
+    Returns the full text, the usage metadata and the parser (None if the
+    text stopped looking like a JSON object, in which case the caller falls
+    back to extracting it from the full text).
+    """
+    parser = IncrementalJSONObject()
+    text, usage, explained = "", None, ""
+    chunks = await llm_client.generate_content_async(
+        prompt,
+        generation_config=GenerationConfig(
+            temperature=0.1,
+            max_output_tokens=2048
+        ),
+        stream=True
+    )
+    async for chunk in chunks:
+        usage = getattr(chunk, "usage_metadata", None) or usage
+        try:
+            piece = chunk.text
+        except ValueError:
+            continue  # e.g. a final chunk carrying only the finish reason
+        text += piece
+        if parser is None:
+            continue
+        try:
+            completed = parser.feed(piece)
+        except (ValueError, json.JSONDecodeError) as e:
+            logger.warning(f"Incremental JSON parse failed, waiting for the full response: {e}")
+            parser = None
+            continue
+        for item in completed:
+            on_event("field", item)
+        explanation = parser.partial_string("explanation")
+        if explanation and len(explanation) > len(explained):
+            on_event("explanation", explanation[len(explained):])
+            explained = explanation
+    return text, usage, parser
+
+async def generate_sql(user_query: str, on_event: Optional[Callable[[str, Any], None]] = None) -> dict:
+    """
+    Use Gemini to translate natural language to SQL.
+
+    on_event(kind, payload) is called while the answer arrives: ("field",
+    (key, value)) for each top-level field once complete and ("explanation",
+    text) for each new piece of the explanation. Cached and non-streamed
+    answers report all their fields at once.
+    """
+    notify = on_event or (lambda kind, payload: None)
+    if schema_retriever:
+        with stage("prompt_retrieval"):
+            system_prompt = schema_retriever.select(user_query).prompt
+    else:
+        system_prompt = SYSTEM_PROMPT
+    if ROUTE_HEDGING != "off":
+        system_prompt += DUAL_ROUTE_RULE
+    cache_key = None
+    if translation_cache:
+        cache_key = TranslationCache.make_key(user_query, system_prompt, MODEL_NAME)
+        cached = translation_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Translation cache hit for: {user_query}")
+            report_fields(cached, notify)
+            return copy.deepcopy(cached)
+
     if not llm_client:
         raise Exception("LLM client not initialized")
-        
+
     prompt = f"""
-    {SYSTEM_PROMPT}
+    {system_prompt}
     
     User question: {user_query}
     
@@ -125,31 +425,55 @@ def generate_sql(user_query: str) -> dict:
     """
     
     try:
-        response = llm_client.generate_content(
-            prompt,
-            generation_config=GenerationConfig(
-                temperature=0.1,
-                max_output_tokens=2048
-            )
-        )
-        
-        result_text = response.text.strip()
-        
-        if "{" in result_text and "}" in result_text:
-            start_index = result_text.find("{")
-            end_index = result_text.rfind("}") + 1
-            result_text = result_text[start_index:end_index]
+        parser = None
+        with stage("llm_generate", model=MODEL_NAME, streaming=LLM_STREAMING):
+            async with backend_semaphores["llm"]:
+                if LLM_STREAMING:
+                    result_text, usage, parser = await stream_llm(prompt, notify)
+                else:
+                    response = await llm_client.generate_content_async(
+                        prompt,
+                        generation_config=GenerationConfig(
+                            temperature=0.1,
+                            max_output_tokens=2048
+                        )
+                    )
+                    result_text, usage = response.text, getattr(response, "usage_metadata", None)
         
-        try:
-            return json.loads(result_text)
-        except json.JSONDecodeError as je:
-            logger.error(f"JSON Parse Error: {je}. Raw text: {result_text}")
-            return {
-                "intent": "error",
-                "table": "unknown",
-                "sql": "",
-                "explanation": f"Failed to parse LLM response: {str(je)}"
-            }
+        if usage is not None and getattr(usage, "prompt_token_count", None):
+            logger.info(f"Gemini usage: {usage.prompt_token_count} prompt tokens, {getattr(usage, 'candidates_token_count', 0)} output tokens")
+            if schema_retriever:
+                schema_retriever.record_usage(usage.prompt_token_count)
+
+        streamed = parser is not None and parser.complete
+        with stage("json_extract"):
+            if streamed:
+                llm_result = parser.value()
+            else:
+                result_text = result_text.strip()
+
+                if "{" in result_text and "}" in result_text:
+                    start_index = result_text.find("{")
+                    end_index = result_text.rfind("}") + 1
+                    result_text = result_text[start_index:end_index]
+
+                try:
+                    llm_result = json.loads(result_text)
+                except json.JSONDecodeError as je:
+                    logger.error(f"JSON Parse Error: {je}. Raw text: {result_text}")
+                    return {
+                        "intent": "error",
+                        "table": "unknown",
+                        "sql": "",
+                        "explanation": f"Failed to parse LLM response: {str(je)}"
+                    }
+
+        if cache_key and llm_result.get("intent") != "error":
+            translation_cache.set(cache_key, copy.deepcopy(llm_result))
+        if not streamed:
+            # fields could not be reported as they arrived
+            report_fields(llm_result, notify)
+        return llm_result
 
     except Exception as e:
         logger.error(f"LLM Generation failed: {e}")
@@ -160,25 +484,348 @@ def generate_sql(user_query: str) -> dict:
             "explanation": f"Failed to generate SQL: {str(e)}"
         }
 
-def execute_query(sql: str) -> tuple[List[dict], int]:
-    """Execute SQL against BigQuery and return results."""
-    if not bq_client:
+async def wait_for_job(query_job, max_interval: float = 1.0) -> None:
+    """Poll a BigQuery job until it finishes, yielding to the event loop between polls."""
+    interval = 0.05
+    while not await asyncio.to_thread(query_job.done):
+        await asyncio.sleep(interval)
+        interval = min(interval * 2, max_interval)
+
+async def run_bigquery_job(sql: str):
+    """Submit a query job and wait for it to finish (call under the BigQuery semaphore)."""
+    with stage("bigquery_submit"):
+        query_job = await asyncio.to_thread(bq_client.query, sql, job_config=bq_job_config())
+    with stage("bigquery_wait"):
+        try:
+            await wait_for_job(query_job)
+        except asyncio.CancelledError:
+            # nobody wants the result any more (e.g. Cube won the race): stop paying for the scan
+            try:
+                await asyncio.to_thread(query_job.cancel)
+                logger.info(f"Cancelled BigQuery job {query_job.job_id}")
+            except Exception as e:
+                logger.warning(f"Failed to cancel BigQuery job: {e}")
+            raise
+    return query_job
+
+def runs_locally(sql: str) -> bool:
+    """Whether a query runs on the DuckDB snapshots rather than BigQuery."""
+    if not duckdb_backend:
+        return False
+    if QUERY_BACKEND == "duckdb" or not bq_client:
+        return True
+    return duckdb_backend.can_serve(sql)
+
+def plan_sql(sql: str) -> Tuple[str, Optional[dict]]:
+    """Rewrite aggregates onto a pre-aggregated mart; returns (sql, rewrite summary or None)."""
+    if not query_planner:
+        return sql, None
+    with stage("sql_plan"):
+        rewrite = query_planner.plan(sql)
+    if rewrite is None:
+        return sql, None
+    logger.info(f"Query planner moved query from {rewrite.from_table} to {rewrite.to_table}")
+    return rewrite.sql, rewrite.summary()
+
+async def guard_sql(sql: str) -> GuardResult:
+    """Validate, cost and possibly rewrite SQL before it runs; raises SQLRejected."""
+    if not sql_guard:
+        # the full guard is off, but LLM output must still be a single read-only query
+        check_read_only(sql)
+        return GuardResult(sql=sql, original_sql=sql)
+    with stage("sql_guard"):
+        result = await asyncio.to_thread(sql_guard.check, sql)
+    if result.actions:
+        logger.info(f"SQL guard rewrote query: {', '.join(result.actions)}")
+    return result
+
+def apply_guard(response: NLQResponse, guarded: GuardResult) -> None:
+    """Record the guarded SQL on the response and flag answers computed from a sample."""
+    response.sql = guarded.sql
+    response.guard = guarded.summary()
+    if guarded.note:
+        response.explanation = f"{response.explanation} ({guarded.note})".strip() if response.explanation else guarded.note
+
+def bq_job_config() -> Optional[bigquery.QueryJobConfig]:
+    """Hard per-job limits backing up the guard's estimate."""
+    if not sql_guard:
+        return None
+    config = bigquery.QueryJobConfig(maximum_bytes_billed=sql_guard.max_bytes)
+    if hasattr(config, "job_timeout_ms"):
+        config.job_timeout_ms = int(SQL_JOB_TIMEOUT_SECONDS * 1000)
+    return config
+
+async def execute_query(sql: str, max_rows: Optional[int] = None) -> QueryResult:
+    """
+    Execute SQL against the configured backend and return results.
+
+    On BigQuery with max_rows set, only the first page is downloaded;
+    row_count still reports the full result size and next_cursor points at
+    the next page. The DuckDB backend runs in-process against the mart
+    snapshots and returns no cursor.
+    """
+    if result_cache:
+        cached = result_cache.get(sql, max_rows)
+        if cached is not None:
+            logger.info("Result cache hit")
+            return cached
+
+    if not bq_client and not duckdb_backend:
         raise Exception("BigQuery client not initialized")
 
-    logger.info(f"Executing SQL: {sql}")
-    query_job = bq_client.query(sql)
-    results = query_job.result()
-    rows = [dict(row) for row in results]
-    return rows, len(rows)
+    async def run() -> QueryResult:
+        if runs_locally(sql):
+            async with backend_semaphores["duckdb"]:
+                with stage("duckdb_execute"):
+                    result = await asyncio.to_thread(duckdb_backend.execute, sql, max_rows)
+            if result_cache:
+                result_cache.set(sql, result, max_rows)
+            return result
+
+        logger.info(f"Executing SQL: {sql}")
+        async with backend_semaphores["bigquery"]:
+            query_job = await run_bigquery_job(sql)
+            with stage("materialize"):
+                if max_rows is None:
+                    rows = await asyncio.to_thread(lambda: [dict(row) for row in query_job.result()])
+                    result = QueryResult(rows=rows, row_count=len(rows))
+                else:
+                    result = await asyncio.to_thread(first_page, query_job, max_rows)
+        if result_cache:
+            result_cache.set(sql, result, max_rows)
+        return result
+
+    return await bq_flights.do(f"bq:{max_rows}:{canonicalize_sql(sql)}", run)
+
+def cube_query_kwargs(cube_q: dict, limit: int) -> Dict[str, Any]:
+    """run_cube_query arguments for a cube_query written by Gemini."""
+    return dict(
+        measures=cube_q.get("measures", []),
+        dimensions=cube_q.get("dimensions", []),
+        filters=cube_q.get("filters", []),
+        time_dimensions=cube_q.get("timeDimensions", []),
+        limit=limit
+    )
+
+async def run_cube_query(**query_kwargs) -> Optional[Dict[str, Any]]:
+    """
+    Execute a Cube query, coalescing identical concurrent requests.
+
+    The query is validated and normalized against the local model index
+    first; raises CubeQueryInvalid without contacting Cube if it is malformed.
+    """
+    query = build_cube_query(**query_kwargs)
+    if cube_schema:
+        query = cube_schema.validate(query)
+
+    async def run() -> Optional[Dict[str, Any]]:
+        with stage("cube_query"):
+            async with backend_semaphores["cube"]:
+                return await load_cube_query_async(query)
+
+    return await cube_flights.do(cube_query_key(query), run)
+
+def hedge_delay() -> Optional[float]:
+    """Seconds after Cube starts before the equivalent SQL starts; None = only if Cube fails."""
+    if ROUTE_HEDGING == "parallel":
+        return 0.0
+    if ROUTE_HEDGING == "hedge":
+        return ROUTE_HEDGE_DELAY_MS / 1000
+    return None
+
+async def answer_from_cube_route(response: NLQResponse, started: Optional[asyncio.Future] = None) -> Optional[dict]:
+    """
+    Answer a Cube-routed question, racing or falling back to the equivalent SQL.
+
+    `started` is the Cube query if it was already launched while Gemini was
+    still writing the answer. Fills in data, source and (when SQL won)
+    sql/guard/rewrite on the response; returns Cube's annotation when Cube
+    answered.
+    """
+    async def via_cube():
+        if started is not None:
+            result = await started
+        else:
+            result = await run_cube_query(**cube_query_kwargs(response.cube_query, ASK_PAGE_SIZE))
+        if not result or not result.get("data"):
+            raise Exception("Cube query returned no data")
+        return result
+
+    async def via_sql():
+        sql, rewrite = plan_sql(response.sql)
+        guarded = await guard_sql(sql)
+        return guarded, rewrite, await execute_query(guarded.sql, max_rows=ASK_PAGE_SIZE)
+
+    attempts = [("cube", via_cube, 0.0)]
+    if response.sql and ROUTE_HEDGING != "off":
+        attempts.append(("bigquery", via_sql, hedge_delay()))
+
+    try:
+        outcome = await route_hedger.run(attempts)
+    except AllAttemptsFailed as e:
+        logger.error(f"Cube route failed: {e}")
+        response.error = f"Cube failed: {e}"
+        response.source = "cube_failed"
+        return None
+
+    if len(attempts) > 1:
+        response.hedge = outcome.summary()
+    if outcome.winner == "cube":
+        result = outcome.result
+        response.data = result["data"][:ASK_PAGE_SIZE]
+        response.row_count = len(result["data"])
+        response.source = "cube"
+        logger.info(f"✅ Cube query successful: {response.row_count} rows")
+        return result.get("annotation")
+
+    guarded, response.rewrite, result = outcome.result
+    apply_guard(response, guarded)
+    response.data = result.rows
+    response.row_count = result.row_count
+    response.next_cursor = result.next_cursor
+    response.source = "bigquery"
+    logger.info(f"✅ Equivalent SQL answered for Cube ({', '.join(outcome.errors) or 'faster'}): {result.row_count} rows")
+    return None
+
+async def answer_from_intent(request: NLQRequest) -> Optional[tuple]:
+    """
+    Try to answer a question through the local intent matcher and Cube.
+
+    Returns (response, annotation) on success, or None when the question is
+    not a confident match or Cube cannot serve it, so the caller falls back
+    to Gemini.
+    """
+    if not intent_matcher:
+        return None
+    with stage("intent_match"):
+        match = intent_matcher.match(request.query)
+    if match is None or not await check_cube_health_async():
+        return None
+
+    response = NLQResponse(
+        original_query=request.query,
+        intent=match.intent,
+        route="cube",
+        cube_query=build_cube_query(**match.query_kwargs),
+        explanation=(
+            f"Matched the pre-built '{match.intent}' Cube metric locally "
+            f"({match.method}, confidence {match.confidence:.2f}) without calling Gemini."
+        ),
+        source="intent_matcher"
+    )
+    if not request.execute:
+        return response, None
+
+    try:
+        result = await run_cube_query(**match.query_kwargs)
+    except Exception as e:
+        logger.warning(f"Intent fast-path failed: {e}, falling back to Gemini")
+        return None
+    if not result or not result.get("data"):
+        logger.warning("Intent fast-path returned no data, falling back to Gemini")
+        return None
+
+    response.data = result["data"][:ASK_PAGE_SIZE]
+    response.row_count = len(result["data"])
+    response.source = "cube"
+    return response, result.get("annotation")
+
+async def run_batch_item(item: BatchItem) -> Dict[str, Any]:
+    """Execute one /batch item and return its result fields."""
+    if item.type == "metric":
+        if not CUBE_AVAILABLE:
+            raise RuntimeError("Cube client not available")
+        if item.metric not in METRIC_QUERIES:
+            raise ValueError(f"Unknown metric: {item.metric}")
+        result = await run_cube_query(**METRIC_QUERIES[item.metric](**(item.params or {})))
+        if result is None:
+            raise RuntimeError("Cube query failed")
+        rows = result.get("data", [])
+        return {"data": rows, "row_count": len(rows), "source": "cube"}
+
+    if item.type == "cube":
+        if not CUBE_AVAILABLE:
+            raise RuntimeError("Cube client not available")
+        q = item.cube_query
+        result = await run_cube_query(
+            measures=q.measures,
+            dimensions=q.dimensions,
+            filters=q.filters,
+            time_dimensions=q.time_dimensions,
+            order=q.order,
+            limit=q.limit
+        )
+        if result is None:
+            raise RuntimeError("Cube query failed")
+        rows = result.get("data", [])
+        return {"data": rows, "row_count": len(rows), "source": "cube"}
+
+    if item.type == "sql":
+        sql, rewrite = plan_sql(item.sql)
+        guarded = await guard_sql(sql)
+        result = await execute_query(guarded.sql, max_rows=item.max_rows or ASK_PAGE_SIZE)
+        return {
+            "data": result.rows,
+            "row_count": result.row_count,
+            "next_cursor": result.next_cursor,
+            "source": "bigquery",
+            "guard": guarded.summary(),
+            "rewrite": rewrite
+        }
+
+    response, _ = await answer_question(NLQRequest(query=item.query))
+    record_answer(response.route, response.source)
+    result = response.model_dump()
+    if result.get("error") and not result.get("data"):
+        raise RuntimeError(result["error"])
+    return result
+
+async def timed_batch_item(item: BatchItem) -> Dict[str, Any]:
+    """Run a /batch item under its timeout, turning failures into a status."""
+    timeout = item.timeout_seconds or BATCH_ITEM_TIMEOUT_SECONDS
+    started = time.perf_counter()
+    outcome: Dict[str, Any] = {"id": item.id, "type": item.type}
+    try:
+        outcome.update(await asyncio.wait_for(run_batch_item(item), timeout))
+        outcome["status"] = "ok"
+    except asyncio.TimeoutError:
+        outcome.update(status="timeout", error=f"Timed out after {timeout:g}s")
+    except HTTPException as e:
+        outcome.update(status="error", error=str(e.detail))
+    except Exception as e:
+        outcome.update(status="error", error=str(e))
+    outcome["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    if outcome["status"] != "ok":
+        logger.warning(f"Batch item {item.id} {outcome['status']}: {outcome['error']}")
+    return outcome
+
+def validate_batch_item(item: BatchItem) -> Optional[str]:
+    """Return a validation error for a /batch item, or None if it is runnable."""
+    required = {"metric": "metric", "cube": "cube_query", "sql": "sql", "ask": "query"}
+    if item.type not in required:
+        return f"item {item.id}: type must be one of {', '.join(required)}"
+    if not getattr(item, required[item.type]):
+        return f"item {item.id}: '{required[item.type]}' is required for type '{item.type}'"
+    if item.type == "sql" and "SELECT" not in item.sql.upper():
+        return f"item {item.id}: only SELECT statements can be executed"
+    return None
+
+def cube_result_response(result: Dict[str, Any], accept: Optional[str]):
+    """Return a raw Cube result as JSON or, if the client asked for it, Arrow/Parquet."""
+    fmt = negotiate_format(accept)
+    if fmt == "json":
+        return result
+    metadata = {k: v for k, v in result.items() if k != "data"}
+    return columnar_response(fmt, result.get("data", []), metadata, result.get("annotation"))
 
 # ============================================================================
 # Health & Status Endpoints
 # ============================================================================
 
 @app.get("/")
-def health_check():
+async def health_check():
     """API health check with component status."""
-    cube_status = "connected" if (CUBE_AVAILABLE and check_cube_health()) else "not_available"
+    cube_status = "connected" if (CUBE_AVAILABLE and await check_cube_health_async()) else "not_available"
     return {
         "status": "ok", 
         "service": "Retail Semantic Layer API",
@@ -186,12 +833,18 @@ def health_check():
         "components": {
             "gemini": {
                 "status": "connected" if llm_client else "not_initialized",
-                "model": "gemini-2.5-flash"
+                "model": MODEL_NAME
             },
             "bigquery": {
                 "status": "connected" if bq_client else "not_initialized",
                 "dataset": BQ_DATASET
             },
+            "duckdb": {
+                "status": "serving" if duckdb_backend else "disabled",
+                "mode": QUERY_BACKEND,
+                "tables": len(duckdb_backend.tables) if duckdb_backend else 0,
+                "snapshot": duckdb_backend.snapshot.stats() if duckdb_backend and duckdb_backend.snapshot else None
+            },
             "cube": {
                 "status": cube_status,
                 "url": os.environ.get("CUBE_API_URL", "http://localhost:4000/cubejs-api/v1")
@@ -199,11 +852,69 @@ def health_check():
         }
     }
 
+@app.get("/stats")
+async def get_stats():
+    """Cache statistics (hit rate, size, evictions) for the NLQ pipeline."""
+    return {
+        "llm_cache": {
+            "enabled": translation_cache is not None,
+            "model": MODEL_NAME,
+            **(translation_cache.stats() if translation_cache else {})
+        },
+        "prompt_retrieval": {
+            "enabled": schema_retriever is not None,
+            **(schema_retriever.stats() if schema_retriever else {})
+        },
+        "result_cache": {
+            "enabled": result_cache is not None,
+            **(result_cache.stats() if result_cache else {})
+        },
+        "sql_guard": {
+            "enabled": sql_guard is not None,
+            **(sql_guard.stats() if sql_guard else {})
+        },
+        "query_planner": {
+            "enabled": query_planner is not None,
+            **(query_planner.stats() if query_planner else {})
+        },
+        "cube_schema": {
+            "enabled": cube_schema is not None,
+            **(cube_schema.stats() if cube_schema else {})
+        },
+        "intent_fastpath": {
+            "enabled": intent_matcher is not None,
+            **(intent_matcher.stats() if intent_matcher else {})
+        },
+        "singleflight": {
+            "cube": cube_flights.stats(),
+            "bigquery": bq_flights.stats()
+        },
+        "route_hedging": {
+            "mode": ROUTE_HEDGING,
+            "delay_ms": ROUTE_HEDGE_DELAY_MS,
+            **route_hedger.stats()
+        },
+        "concurrency": {
+            name: {"limit": BACKEND_LIMITS[name], "available": sem._value}
+            for name, sem in backend_semaphores.items()
+        },
+        "latency": telemetry_stats()
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint: per-stage latency histograms and answer counters."""
+    if not PROMETHEUS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="prometheus_client is not installed")
+    body, content_type = metrics_payload()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/schema")
-def get_schema():
+async def get_schema():
     """Return available tables and their descriptions."""
     return {
-        "tables": SCHEMA_SUMMARY
+        "tables": SCHEMA_SUMMARY,
+        "rollups": query_planner.describe() if query_planner else {}
     }
 
 # ============================================================================
@@ -211,23 +922,77 @@ def get_schema():
 # ============================================================================
 
 @app.post("/ask", response_model=NLQResponse)
-def ask_question(request: NLQRequest):
+async def ask_question(request: NLQRequest, accept: Optional[str] = Header(None)):
     """
     Translate natural language to query and execute via smart routing.
-    Routes to Cube for known metrics, BigQuery for complex/ad-hoc queries.
+    Common metric questions are matched locally and answered from Cube
+    without calling Gemini; otherwise Gemini routes to Cube for known
+    metrics and BigQuery for complex/ad-hoc queries.
+
+    Send ``Accept: application/vnd.apache.arrow.stream`` (or Parquet) to get
+    the rows as a columnar body with the other fields in schema metadata.
+    """
+    fmt = negotiate_format(accept)
+    response, cube_annotation = await answer_question(request)
+    if request.execute:
+        record_answer(response.route, response.source)
+    with stage("serialize", format=fmt):
+        if fmt == "json":
+            return JSONResponse(response.model_dump(mode="json"))
+        metadata = response.model_dump(exclude={"data"})
+        return columnar_response(fmt, response.data or [], metadata, cube_annotation)
+
+async def answer_question(
+    request: NLQRequest,
+    on_event: Optional[Callable[[str, Any], None]] = None
+) -> Tuple[NLQResponse, Optional[dict]]:
+    """
+    Route and run one question; returns the response and Cube's annotation, if any.
+
+    While Gemini streams its answer, the Cube query starts as soon as `route`
+    and `cube_query` are complete, overlapping the rest of the generation.
+    on_event receives generate_sql's progress events.
     """
+    cube_annotation = None
+    fields: Dict[str, Any] = {}
+    early_cube: Optional[asyncio.Future] = None
+
+    def respond(response: NLQResponse):
+        return response, cube_annotation
+
+    def on_llm_event(kind: str, payload: Any):
+        nonlocal early_cube
+        if on_event:
+            on_event(kind, payload)
+        if kind != "field":
+            return
+        fields[payload[0]] = payload[1]
+        if (
+            early_cube is None and request.execute and CUBE_AVAILABLE
+            and fields.get("route") == "cube" and isinstance(fields.get("cube_query"), dict)
+        ):
+            logger.info("Starting Cube query while Gemini finishes its answer")
+            early_cube = asyncio.ensure_future(run_cube_query(**cube_query_kwargs(fields["cube_query"], ASK_PAGE_SIZE)))
+            early_cube.add_done_callback(lambda task: task.cancelled() or task.exception())
+
     try:
-        llm_result = generate_sql(request.query)
+        fast_path = await answer_from_intent(request)
+        if fast_path is not None:
+            response, cube_annotation = fast_path
+            logger.info(f"✅ Answered via intent fast-path: {response.intent}")
+            return respond(response)
+
+        llm_result = await generate_sql(request.query, on_event=on_llm_event)
         
         if llm_result.get("intent") == "error":
-            return NLQResponse(
+            return respond(NLQResponse(
                 original_query=request.query,
                 intent="error",
                 route="error",
                 explanation=llm_result.get("explanation", ""),
                 error="LLM Generation Failed",
                 source="gemini"
-            )
+            ))
 
         route = llm_result.get("route", "bigquery")
         
@@ -243,47 +1008,36 @@ def ask_question(request: NLQRequest):
         )
         
         if not request.execute:
-            return response
+            return respond(response)
         
         # Smart routing: Execute via Cube or BigQuery
         if route == "cube" and CUBE_AVAILABLE and response.cube_query:
-            try:
-                cube_q = response.cube_query
-                result = query_cube(
-                    measures=cube_q.get("measures", []),
-                    dimensions=cube_q.get("dimensions", []),
-                    filters=cube_q.get("filters", []),
-                    time_dimensions=cube_q.get("timeDimensions", []),
-                    limit=100
-                )
-                if result and result.get("data"):
-                    response.data = result["data"][:100]
-                    response.row_count = len(result["data"])
-                    response.source = "cube"
-                    logger.info(f"✅ Cube query successful: {response.row_count} rows")
-                else:
-                    # Fallback to BigQuery if Cube fails
-                    logger.warning("Cube query returned no data, falling back to BigQuery")
-                    response.error = "Cube query returned no data"
-            except Exception as e:
-                logger.error(f"Cube execution failed: {e}, falling back to BigQuery")
-                response.error = f"Cube failed: {str(e)}"
-                response.source = "cube_failed"
+            cube_annotation = await answer_from_cube_route(response, started=early_cube)
         
-        elif route == "bigquery" and response.sql and "SELECT" in response.sql.upper():
+        elif route == "bigquery" and response.sql:
+            response.sql, response.rewrite = plan_sql(response.sql)
+            try:
+                guarded = await guard_sql(response.sql)
+            except SQLRejected as e:
+                logger.warning(f"SQL guard rejected query: {e}")
+                response.error = f"Query rejected: {e}"
+                response.source = "guard_rejected"
+                return respond(response)
+            apply_guard(response, guarded)
             try:
-                data, count = execute_query(response.sql)
-                response.data = data[:100]
-                response.row_count = count
+                result = await execute_query(response.sql, max_rows=ASK_PAGE_SIZE)
+                response.data = result.rows
+                response.row_count = result.row_count
+                response.next_cursor = result.next_cursor
                 response.source = "bigquery"
-                logger.info(f"✅ BigQuery successful: {count} rows")
+                logger.info(f"✅ BigQuery successful: {result.row_count} rows")
             except Exception as e:
                 response.error = f"Query execution failed: {str(e)}"
                 response.source = "bigquery_failed"
                 logger.error(f"BigQuery error: {e}")
                 logger.error(f"Failed SQL: {response.sql}")
         
-        return response
+        return respond(response)
         
     except json.JSONDecodeError as e:
         logger.error(f"Failed to parse LLM response: {e}")
@@ -291,58 +1045,300 @@ def ask_question(request: NLQRequest):
     except Exception as e:
         logger.error(f"NLQ processing error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if early_cube is not None and not early_cube.done():
+            # Gemini's final answer did not use the Cube query after all
+            early_cube.cancel()
 
 @app.post("/sql-only")
-def get_sql_only(request: NLQRequest):
+async def get_sql_only(request: NLQRequest):
     """Generate SQL without executing - useful for review."""
     request.execute = False
-    return ask_question(request)
+    return await ask_question(request, accept=None)
+
+@app.post("/ask/events")
+async def ask_question_events(request: NLQRequest):
+    """
+    Answer a question as Server-Sent Events.
+
+    `field` events carry each part of Gemini's answer (intent, route,
+    cube_query, sql, ...) as soon as it is complete, `explanation` events
+    stream the explanation text while the query may already be running, and
+    a final `answer` event carries the full /ask response (or `error`).
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def on_event(kind: str, payload: Any):
+        if kind == "explanation":
+            queue.put_nowait(("explanation", {"delta": payload}))
+        elif payload[0] != "explanation":
+            queue.put_nowait(("field", {"name": payload[0], "value": payload[1]}))
+
+    async def events():
+        task = asyncio.ensure_future(answer_question(request, on_event=on_event))
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (item := await queue.get()) is not None:
+                yield sse_event(*item)
+            try:
+                response, _ = task.result()
+            except HTTPException as e:
+                yield sse_event("error", {"detail": e.detail})
+                return
+            if request.execute:
+                record_answer(response.route, response.source)
+            with stage("serialize", format="sse"):
+                answer = sse_event("answer", response.model_dump(mode="json"))
+            yield answer
+        finally:
+            # the client disconnected before the answer was ready
+            task.cancel()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type=SSE_MEDIA_TYPE, headers=headers)
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: NLQStreamRequest):
+    """
+    Translate a question and stream the full answer as NDJSON or Arrow IPC.
+
+    BigQuery results are pulled page by page, so memory stays bounded by
+    page_size and the first rows arrive as soon as the first page is read.
+    """
+    if request.format not in ("ndjson", "arrow"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'arrow'")
+    if request.format == "arrow" and not ARROW_AVAILABLE:
+        raise HTTPException(status_code=406, detail="Arrow output requires pyarrow")
+
+    llm_result = await generate_sql(request.query)
+    if llm_result.get("intent") == "error":
+        raise HTTPException(status_code=502, detail=llm_result.get("explanation", "LLM Generation Failed"))
+
+    route = llm_result.get("route", "bigquery")
+    media_type = ARROW_STREAM_MEDIA_TYPE if request.format == "arrow" else NDJSON_MEDIA_TYPE
+    headers = {
+        "X-NLQ-Intent": str(llm_result.get("intent", "")),
+        "X-NLQ-Route": route,
+    }
+
+    if route == "cube" and CUBE_AVAILABLE and llm_result.get("cube_query"):
+        try:
+            result = await run_cube_query(**cube_query_kwargs(llm_result["cube_query"], request.max_rows or 10000))
+        except CubeQueryInvalid as e:
+            logger.warning(f"Invalid Cube query from Gemini: {e}")
+            result = None
+        if result is not None:
+            rows = result.get("data", [])
+            headers["X-Total-Rows"] = str(len(rows))
+            encoded = arrow_rows(rows) if request.format == "arrow" else ndjson_rows(rows)
+            return StreamingResponse(encoded, media_type=media_type, headers=headers)
+        if ROUTE_HEDGING == "off" or not llm_result.get("sql"):
+            raise HTTPException(status_code=503, detail="Cube query failed")
+        logger.warning("Cube query failed, streaming the equivalent SQL instead")
+        headers["X-NLQ-Fallback"] = "bigquery"
+
+    sql = llm_result.get("sql")
+    if not sql:
+        raise HTTPException(status_code=422, detail="No executable SQL was generated")
+    sql, rewrite = plan_sql(sql)
+    if rewrite:
+        headers["X-Query-Rewrite"] = f"{rewrite['from_table']}->{rewrite['to_table']}"
+    try:
+        guarded = await guard_sql(sql)
+    except SQLRejected as e:
+        raise HTTPException(status_code=422, detail=f"Query rejected: {e}")
+    sql = guarded.sql
+    if guarded.window_days is not None:
+        headers["X-NLQ-Window-Days"] = str(guarded.window_days)
+    if guarded.sampled_percent is not None:
+        headers["X-NLQ-Sampled-Percent"] = f"{guarded.sampled_percent:g}"
+    headers["X-NLQ-Table"] = str(llm_result.get("table") or "")
+
+    if runs_locally(sql):
+        # in-process results are already materialized; stream them row by row
+        result = await execute_query(sql, max_rows=request.max_rows)
+        headers["X-Total-Rows"] = str(result.row_count)
+        encoded = arrow_rows(result.rows) if request.format == "arrow" else ndjson_rows(result.rows)
+        return StreamingResponse(encoded, media_type=media_type, headers=headers)
+
+    if not bq_client:
+        raise HTTPException(status_code=503, detail="BigQuery client not initialized")
+
+    logger.info(f"Streaming SQL: {sql}")
+    async with backend_semaphores["bigquery"]:
+        query_job = await run_bigquery_job(sql)
+    row_iterator = await asyncio.to_thread(query_job.result, page_size=request.page_size)
+    headers["X-Total-Rows"] = str(row_iterator.total_rows)
+    headers["X-Job-Id"] = query_job.job_id
+
+    encoder = arrow_stream if request.format == "arrow" else ndjson_stream
+    return StreamingResponse(encoder(row_iterator, request.max_rows), media_type=media_type, headers=headers)
+
+@app.post("/batch")
+async def batch(request: BatchRequest):
+    """
+    Run many metric, Cube, SQL and NLQ requests concurrently.
+
+    Each item has its own timeout, so one slow query only fails itself. By
+    default results stream back as NDJSON, one line per item in completion
+    order; with ``stream: false`` a single JSON body lists them in request
+    order. Either way the total time is that of the slowest item.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="items must not be empty")
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_ITEMS} items per batch")
+    if len({item.id for item in request.items}) != len(request.items):
+        raise HTTPException(status_code=400, detail="item ids must be unique")
+    for item in request.items:
+        error = validate_batch_item(item)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+
+    if not request.stream:
+        results = await asyncio.gather(*(timed_batch_item(item) for item in request.items))
+        return {"results": results}
+
+    tasks = [asyncio.ensure_future(timed_batch_item(item)) for item in request.items]
+
+    async def results_as_completed():
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield (json.dumps(await finished, default=str) + "\n").encode("utf-8")
+        finally:
+            # client went away: stop work nobody will read
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results_as_completed(), media_type=NDJSON_MEDIA_TYPE)
+
+@app.get("/query/page")
+async def query_page(cursor: str):
+    """Fetch the next page of a previous BigQuery answer using its next_cursor."""
+    if not bq_client:
+        raise HTTPException(status_code=503, detail="BigQuery client not initialized")
+    try:
+        async with backend_semaphores["bigquery"]:
+            return await asyncio.to_thread(read_page, bq_client, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except CursorExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+
+# ============================================================================
+# Sketch Metric Endpoints
+# ============================================================================
+
+@app.get("/metrics/unique-customers")
+async def unique_customers(start_date: str, end_date: str, grain: Optional[str] = None):
+    """
+    Unique and new customers between two dates (inclusive), optionally per grain.
+
+    Merges the daily HyperLogLog++ sketches stored in fct_daily_revenue when
+    the marts are built with `approx_distinct: true`, so any range is
+    answered from one row per day instead of rescanning fct_orders. Counts
+    are approximate (~0.5% relative error).
+    """
+    try:
+        start = datetime.date.fromisoformat(start_date)
+        end = datetime.date.fromisoformat(end_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start_date and end_date must be YYYY-MM-DD")
+    if start > end:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+    if grain is not None and grain not in SKETCH_GRAINS:
+        raise HTTPException(status_code=400, detail=f"grain must be one of {', '.join(SKETCH_GRAINS)}")
+    if QUERY_BACKEND == "duckdb" or not bq_client:
+        # the sketches are BigQuery HLL++ bytes; DuckDB cannot merge them
+        raise HTTPException(status_code=503, detail="Sketch metrics need the BigQuery backend")
+
+    period = f"DATE_TRUNC(order_date, {grain.upper()}) AS period_start, " if grain else ""
+    sql = (
+        f"SELECT {period}"
+        f"HLL_COUNT.MERGE(customer_sketch) AS unique_customers, "
+        f"HLL_COUNT.MERGE(new_customer_sketch) AS new_customers, "
+        f"COUNT(*) AS days_with_orders "
+        f"FROM `{GCP_PROJECT_ID}.{BQ_DATASET}.fct_daily_revenue` "
+        f"WHERE order_date BETWEEN DATE '{start.isoformat()}' AND DATE '{end.isoformat()}'"
+        + (" GROUP BY period_start ORDER BY period_start" if grain else "")
+    )
+    try:
+        result = await execute_query(sql)
+    except Exception as e:
+        logger.error(f"Sketch merge failed (is approx_distinct enabled?): {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "grain": grain,
+        "approximate": True,
+        "data": result.rows,
+        "sql": sql
+    }
 
 # ============================================================================
 # Cube Endpoints
 # ============================================================================
 
 @app.get("/cube/health")
-def cube_health():
+async def cube_health():
     """Check Cube server health."""
     if not CUBE_AVAILABLE:
         return {"status": "unavailable", "message": "Cube client not installed"}
     
-    healthy = check_cube_health()
+    healthy = await check_cube_health_async()
     return {
         "status": "healthy" if healthy else "unhealthy",
         "url": os.environ.get("CUBE_API_URL", "http://localhost:4000/cubejs-api/v1")
     }
 
 @app.get("/cube/meta")
-def cube_meta():
+async def cube_meta():
     """Get Cube metadata (available cubes, measures, dimensions)."""
     if not CUBE_AVAILABLE:
         raise HTTPException(status_code=503, detail="Cube client not available")
     
-    meta = get_cube_meta()
+    # served from the copy the schema index refreshes in the background
+    meta = cube_schema.meta if cube_schema else None
+    if meta is None:
+        async with backend_semaphores["cube"]:
+            meta = await get_cube_meta_async()
+        if meta is not None and cube_schema:
+            cube_schema.update_meta(meta)
     if meta is None:
         raise HTTPException(status_code=503, detail="Failed to connect to Cube server")
     return meta
 
 @app.post("/cube/query", response_model=CubeQueryResponse)
-def cube_query(request: CubeQueryRequest):
-    """Execute a raw Cube query."""
+async def cube_query(request: CubeQueryRequest, accept: Optional[str] = Header(None)):
+    """Execute a raw Cube query (JSON, or Arrow/Parquet via the Accept header)."""
     if not CUBE_AVAILABLE:
         raise HTTPException(status_code=503, detail="Cube client not available")
     
-    result = query_cube(
-        measures=request.measures,
-        dimensions=request.dimensions,
-        filters=request.filters,
-        time_dimensions=request.time_dimensions,
-        order=request.order,
-        limit=request.limit
-    )
+    try:
+        result = await run_cube_query(
+            measures=request.measures,
+            dimensions=request.dimensions,
+            filters=request.filters,
+            time_dimensions=request.time_dimensions,
+            order=request.order,
+            limit=request.limit
+        )
+    except CubeQueryInvalid as e:
+        raise HTTPException(status_code=400, detail={"message": "Invalid Cube query", "problems": e.problems})
     
     if result is None:
         raise HTTPException(status_code=503, detail="Cube query failed")
     
+    fmt = negotiate_format(accept)
+    if fmt != "json":
+        metadata = {
+            "row_count": len(result.get("data", [])),
+            "query": result.get("query", {}),
+            "error": result.get("error")
+        }
+        return columnar_response(fmt, result.get("data", []), metadata, result.get("annotation"))
+    
     return CubeQueryResponse(
         data=result.get("data", []),
         row_count=len(result.get("data", [])),
@@ -351,57 +1347,73 @@ def cube_query(request: CubeQueryRequest):
     )
 
 # Pre-built Cube metric endpoints
+async def run_metric_query(name: str, *args) -> Dict[str, Any]:
+    """Run a METRIC_QUERIES entry; 400 if its parameters make an invalid query, 503 if Cube fails."""
+    try:
+        result = await run_cube_query(**METRIC_QUERIES[name](*args))
+    except CubeQueryInvalid as e:
+        raise HTTPException(status_code=400, detail={"message": "Invalid Cube query", "problems": e.problems})
+    if result is None:
+        raise HTTPException(status_code=503, detail="Cube query failed")
+    return result
+
 @app.get("/cube/metrics/revenue/daily")
-def cube_daily_revenue(days: int = 30):
+async def cube_daily_revenue(days: int = 30, accept: Optional[str] = Header(None)):
     """Get daily revenue metrics from Cube."""
     if not CUBE_AVAILABLE:
         raise HTTPException(status_code=503, detail="Cube client not available")
     
-    result = get_total_revenue_by_date(days)
-    if result is None:
-        raise HTTPException(status_code=503, detail="Cube query failed")
-    return result
+    result = await run_metric_query("revenue_daily", days)
+    return cube_result_response(result, accept)
 
 @app.get("/cube/metrics/revenue/by-country")
-def cube_revenue_by_country():
+async def cube_revenue_by_country(accept: Optional[str] = Header(None)):
     """Get revenue by country from Cube."""
     if not CUBE_AVAILABLE:
         raise HTTPException(status_code=503, detail="Cube client not available")
     
-    result = get_revenue_by_country()
-    if result is None:
-        raise HTTPException(status_code=503, detail="Cube query failed")
-    return result
+    result = await run_metric_query("revenue_by_country")
+    return cube_result_response(result, accept)
 
 @app.get("/cube/metrics/orders")
-def cube_order_metrics():
+async def cube_order_metrics(accept: Optional[str] = Header(None)):
     """Get high-level order metrics from Cube."""
     if not CUBE_AVAILABLE:
         raise HTTPException(status_code=503, detail="Cube client not available")
     
-    result = get_order_metrics()
-    if result is None:
-        raise HTTPException(status_code=503, detail="Cube query failed")
-    return result
+    result = await run_metric_query("order_metrics")
+    return cube_result_response(result, accept)
 
 @app.get("/cube/metrics/orders/by-status")
-def cube_orders_by_status():
+async def cube_orders_by_status(accept: Optional[str] = Header(None)):
     """Get orders grouped by status from Cube."""
     if not CUBE_AVAILABLE:
         raise HTTPException(status_code=503, detail="Cube client not available")
     
-    result = get_orders_by_status()
-    if result is None:
-        raise HTTPException(status_code=503, detail="Cube query failed")
-    return result
+    result = await run_metric_query("orders_by_status")
+    return cube_result_response(result, accept)
+
+@app.get("/cube/metrics/customers/unique")
+async def cube_unique_customers(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    granularity: Optional[str] = None,
+    accept: Optional[str] = Header(None)
+):
+    """Get approximate unique customers (last 30 days by default) from Cube's HLL rollups."""
+    if not CUBE_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Cube client not available")
+
+    if granularity is not None and granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(GRANULARITIES)}")
+    result = await run_metric_query("unique_customers", start_date, end_date, granularity)
+    return cube_result_response(result, accept)
 
 @app.get("/cube/metrics/users")
-def cube_user_metrics():
+async def cube_user_metrics(accept: Optional[str] = Header(None)):
     """Get user metrics from Cube."""
     if not CUBE_AVAILABLE:
         raise HTTPException(status_code=503, detail="Cube client not available")
     
-    result = get_user_metrics()
-    if result is None:
-        raise HTTPException(status_code=503, detail="Cube query failed")
-    return result
+    result = await run_metric_query("user_metrics")
+    return cube_result_response(result, accept)
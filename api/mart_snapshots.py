@@ -0,0 +1,483 @@
+"""
+Local Parquet snapshots of the dbt marts.
+
+The exporter pulls every model documented in a ``models/marts/*/_*schema.yml``
+file out of BigQuery into ``<table>.parquet`` (unpartitioned models) or
+``<table>/<partition>.parquet`` files, following the model's dbt
+``partition_by`` config. A manifest records each partition's row count,
+last modification time, warehouse fingerprint and file checksum. Later
+exports read the partition metadata from INFORMATION_SCHEMA.PARTITIONS
+(no table data is scanned), fingerprint only the partitions modified since,
+and re-download those whose fingerprint changed.
+
+The reader memory-maps the snapshot files listed in the manifest and keeps
+the decoded Arrow tables, so the DuckDB backend answers repeated dashboard
+and /ask queries without touching the disk or the warehouse again.
+
+Usage (from the api/ directory):
+    python mart_snapshots.py export
+    python mart_snapshots.py export --select fct_daily_revenue fct_rfm_scores
+    python mart_snapshots.py export --full-refresh
+    python mart_snapshots.py verify
+"""
+
+import os
+import re
+import sys
+import glob
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Any
+
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    YAML_AVAILABLE = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = os.environ.get(
+    "DUCKDB_MARTS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "exports", "marts")
+)
+MARTS_MODEL_DIR = os.environ.get(
+    "MARTS_MODEL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models", "marts")
+)
+MANIFEST_NAME = "_manifest.json"
+
+# Day-partitioned models are exported per month so snapshots stay a few hundred files
+_EXPORT_GRANULARITY = {"hour": "month", "day": "month", "month": "month", "year": "year"}
+
+_PARTITION_BY_RE = re.compile(r"partition_by\s*=\s*\{([^}]*)\}")
+_DICT_ITEM_RE = re.compile(r"['\"](\w+)['\"]\s*:\s*['\"](\w+)['\"]")
+_NULL_PARTITION = "null"
+
+
+@dataclass
+class MartModel:
+    """A documented mart and how its snapshot is partitioned."""
+    name: str
+    group: str
+    description: str = ""
+    partition_field: Optional[str] = None
+    partition_type: Optional[str] = None  # dbt data_type: date or timestamp
+    granularity: Optional[str] = None
+
+
+# ============================================================================
+# Model discovery
+# ============================================================================
+
+def _partition_config(sql_path: str) -> Dict[str, str]:
+    try:
+        with open(sql_path) as f:
+            match = _PARTITION_BY_RE.search(f.read())
+    except OSError:
+        return {}
+    return dict(_DICT_ITEM_RE.findall(match.group(1))) if match else {}
+
+
+def discover_models(models_dir: str = MARTS_MODEL_DIR) -> List[MartModel]:
+    """Return the marts documented in the _schema.yml files under models_dir."""
+    if not YAML_AVAILABLE:
+        raise RuntimeError("PyYAML is required to read the dbt schema files")
+
+    models = []
+    for path in sorted(glob.glob(os.path.join(models_dir, "*", "_*schema.yml"))):
+        group = os.path.basename(os.path.dirname(path))
+        with open(path) as f:
+            schema = yaml.safe_load(f) or {}
+        for entry in schema.get("models", []):
+            name = entry["name"]
+            config = _partition_config(os.path.join(os.path.dirname(path), f"{name}.sql"))
+            field = config.get("field")
+            models.append(MartModel(
+                name=name,
+                group=group,
+                description=" ".join(str(entry.get("description", "")).split()),
+                partition_field=field,
+                partition_type=config.get("data_type", "date") if field else None,
+                granularity=_EXPORT_GRANULARITY.get(config.get("granularity", "day"), "month") if field else None,
+            ))
+    return models
+
+
+# ============================================================================
+# Manifest
+# ============================================================================
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(snapshot_dir: str = SNAPSHOT_DIR) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(snapshot_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except OSError:
+        return None
+    except ValueError as e:
+        logger.warning(f"Ignoring unreadable snapshot manifest: {e}")
+        return None
+
+
+def write_manifest(manifest: Dict[str, Any], snapshot_dir: str = SNAPSHOT_DIR) -> None:
+    path = os.path.join(snapshot_dir, MANIFEST_NAME)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def verify_snapshot(snapshot_dir: str = SNAPSHOT_DIR, models: Optional[List[str]] = None) -> List[str]:
+    """Check every manifest file exists with its recorded checksum and row count; return problems."""
+    manifest = load_manifest(snapshot_dir)
+    if manifest is None:
+        return [f"No {MANIFEST_NAME} in {snapshot_dir}"]
+
+    problems = []
+    for name, entry in manifest.get("models", {}).items():
+        if models and name not in models:
+            continue
+        for key, part in entry.get("partitions", {}).items():
+            path = os.path.join(snapshot_dir, part["file"])
+            if not os.path.exists(path):
+                problems.append(f"{name}[{key}]: missing {part['file']}")
+                continue
+            if file_sha256(path) != part["sha256"]:
+                problems.append(f"{name}[{key}]: checksum mismatch")
+            elif ARROW_AVAILABLE and pq.ParquetFile(path).metadata.num_rows != part["row_count"]:
+                problems.append(f"{name}[{key}]: row count mismatch")
+    return problems
+
+
+# ============================================================================
+# Exporter
+# ============================================================================
+
+class MartExporter:
+    """
+    Exports marts from BigQuery to Parquet, one file per partition.
+
+    Partitions whose row count and last modification time in
+    INFORMATION_SCHEMA.PARTITIONS match the manifest are kept as they are.
+    The rest are fingerprinted in the warehouse (row count plus an
+    order-independent XOR of row fingerprints) with a scan restricted to
+    them, and only those whose fingerprint differs are downloaded again.
+    Without partition metadata every partition is fingerprinted.
+    """
+
+    def __init__(self, client, project: str, dataset: str, snapshot_dir: str = SNAPSHOT_DIR):
+        if not ARROW_AVAILABLE:
+            raise RuntimeError("pyarrow is required to write snapshots")
+        self.client = client
+        self.project = project
+        self.dataset = dataset
+        self.snapshot_dir = snapshot_dir
+
+    def _table(self, model: MartModel) -> str:
+        return f"`{self.project}.{self.dataset}.{model.name}`"
+
+    def _partition_key(self, model: MartModel) -> str:
+        if not model.partition_field:
+            return "'all'"
+        return (
+            f"IFNULL(FORMAT_DATE('%F', DATE_TRUNC(DATE({model.partition_field}), "
+            f"{model.granularity.upper()})), '{_NULL_PARTITION}')"
+        )
+
+    def _partition_filter(self, model: MartModel, key: str) -> str:
+        # a range on the raw column, unlike a predicate on _partition_key, lets BigQuery prune partitions
+        field = model.partition_field
+        if key == _NULL_PARTITION:
+            return f"{field} IS NULL"
+        start, end = f"DATE '{key}'", f"DATE_ADD(DATE '{key}', INTERVAL 1 {model.granularity.upper()})"
+        if model.partition_type in ("timestamp", "datetime"):
+            cast = model.partition_type.upper()
+            start, end = f"{cast}({start})", f"{cast}({end})"
+        return f"{field} >= {start} AND {field} < {end}"
+
+    def _file(self, model: MartModel, key: str) -> str:
+        if not model.partition_field:
+            return f"{model.name}.parquet"
+        return os.path.join(model.name, f"{key}.parquet")
+
+    def _export_key(self, model: MartModel, partition_id: str) -> str:
+        # warehouse partition ids are YYYYMMDD[HH], YYYYMM or YYYY; exports go per month or year
+        if partition_id == "__NULL__":
+            return _NULL_PARTITION
+        month = partition_id[4:6] if model.granularity == "month" and len(partition_id) >= 6 else "01"
+        return f"{partition_id[:4]}-{month}-01"
+
+    def partition_stats(self, model: MartModel) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Row count and last modification (epoch ms) of every export partition,
+        from table metadata. Returns None when the metadata is unavailable or
+        does not map onto export partitions (e.g. rows still in the streaming
+        buffer), in which case every partition has to be fingerprinted.
+        """
+        sql = (
+            f"SELECT partition_id, total_rows, UNIX_MILLIS(last_modified_time) AS last_modified "
+            f"FROM `{self.project}.{self.dataset}.INFORMATION_SCHEMA.PARTITIONS` "
+            f"WHERE table_name = '{model.name}'"
+        )
+        try:
+            rows = list(self.client.query(sql).result())
+        except Exception as e:
+            logger.warning(f"{model.name}: partition metadata unavailable, fingerprinting all partitions: {e}")
+            return None
+        if not rows:
+            return None
+
+        stats: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            partition_id = row["partition_id"]
+            if partition_id == "__UNPARTITIONED__" or bool(partition_id) != bool(model.partition_field):
+                return None
+            if not row["total_rows"]:
+                continue
+            key = self._export_key(model, partition_id) if model.partition_field else "all"
+            entry = stats.setdefault(key, {"row_count": 0, "last_modified": 0})
+            entry["row_count"] += row["total_rows"]
+            entry["last_modified"] = max(entry["last_modified"], row["last_modified"])
+        return stats
+
+    def partition_fingerprints(self, model: MartModel, keys: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Row count and content fingerprint of the given partitions (default: all), computed in BigQuery."""
+        sql = (
+            f"SELECT {self._partition_key(model)} AS partition_key, COUNT(*) AS row_count, "
+            f"BIT_XOR(FARM_FINGERPRINT(TO_JSON_STRING(t))) AS fingerprint "
+            f"FROM {self._table(model)} AS t"
+        )
+        if keys is not None and model.partition_field:
+            sql += " WHERE " + " OR ".join(f"({self._partition_filter(model, key)})" for key in sorted(keys))
+        sql += " GROUP BY partition_key"
+        return {
+            row["partition_key"]: {"row_count": row["row_count"], "fingerprint": str(row["fingerprint"])}
+            for row in self.client.query(sql).result()
+        }
+
+    def _download(self, model: MartModel, key: str, path: str) -> None:
+        sql = f"SELECT * FROM {self._table(model)}"
+        if model.partition_field:
+            sql += f" WHERE {self._partition_filter(model, key)}"
+        table = self.client.query(sql).to_arrow()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, path)
+
+    def export_model(self, model: MartModel, previous: Optional[Dict[str, Any]], full_refresh: bool = False) -> Dict[str, Any]:
+        """Bring one model's snapshot up to date; return its manifest entry."""
+        old_parts = (previous or {}).get("partitions", {}) if not full_refresh else {}
+        if previous and previous.get("partition_field") != model.partition_field:
+            old_parts = {}
+
+        metadata = self.partition_stats(model)
+        parts, changed = {}, None
+        if metadata is not None:
+            changed = []
+            for key, meta in metadata.items():
+                old = old_parts.get(key)
+                if (old and old.get("last_modified") == meta["last_modified"]
+                        and old["row_count"] == meta["row_count"]
+                        and os.path.exists(os.path.join(self.snapshot_dir, old["file"]))):
+                    parts[key] = old
+                else:
+                    changed.append(key)
+        fingerprints = self.partition_fingerprints(model, changed) if changed is None or changed else {}
+
+        downloaded = 0
+        for key, stats in sorted(fingerprints.items()):
+            rel = self._file(model, key)
+            path = os.path.join(self.snapshot_dir, rel)
+            old = old_parts.get(key)
+            last_modified = (metadata or {}).get(key, {}).get("last_modified")
+            if old and old["fingerprint"] == stats["fingerprint"] and os.path.exists(path):
+                parts[key] = {**old, "last_modified": last_modified}
+                continue
+            self._download(model, key, path)
+            downloaded += 1
+            parts[key] = {
+                "file": rel,
+                "row_count": stats["row_count"],
+                "fingerprint": stats["fingerprint"],
+                "sha256": file_sha256(path),
+                "last_modified": last_modified,
+                "exported_at": time.time(),
+            }
+
+        # drop files of partitions that no longer exist (or moved with a layout change)
+        for key, part in (previous or {}).get("partitions", {}).items():
+            if parts.get(key, {}).get("file") != part["file"]:
+                try:
+                    os.remove(os.path.join(self.snapshot_dir, part["file"]))
+                except OSError:
+                    pass
+
+        logger.info(
+            f"{model.name}: {len(fingerprints)}/{len(parts)} partitions fingerprinted, {downloaded} exported"
+        )
+        return {
+            "group": model.group,
+            "description": model.description,
+            "partition_field": model.partition_field,
+            "granularity": model.granularity,
+            "row_count": sum(p["row_count"] for p in parts.values()),
+            "partitions": parts,
+        }
+
+    def export(self, models: List[MartModel], full_refresh: bool = False) -> Dict[str, Any]:
+        """Export the given models and rewrite the manifest after each one."""
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        manifest = load_manifest(self.snapshot_dir) or {}
+        manifest.update({"project": self.project, "dataset": self.dataset})
+        manifest.setdefault("models", {})
+
+        for model in models:
+            try:
+                entry = self.export_model(model, manifest["models"].get(model.name), full_refresh)
+            except Exception as e:
+                # e.g. a model disabled by a dbt var was never built
+                logger.warning(f"Skipping {model.name}: {e}")
+                continue
+            manifest["models"][model.name] = entry
+            manifest["generated_at"] = time.time()
+            write_manifest(manifest, self.snapshot_dir)
+        return manifest
+
+
+# ============================================================================
+# Reader
+# ============================================================================
+
+class SnapshotReader:
+    """
+    Serves snapshot tables listed in the manifest as Arrow tables.
+
+    Files are read through memory maps and each table is decoded once; the
+    cached tables are dropped as soon as a new manifest is written, so the
+    next read picks up the fresh export.
+    """
+
+    def __init__(self, snapshot_dir: str = SNAPSHOT_DIR):
+        if not ARROW_AVAILABLE:
+            raise RuntimeError("pyarrow is required to read snapshots")
+        self.snapshot_dir = snapshot_dir
+        self._manifest_path = os.path.join(snapshot_dir, MANIFEST_NAME)
+        self._manifest: Dict[str, Any] = {}
+        self._mtime: Optional[float] = None
+        self._tables: Dict[str, "pa.Table"] = {}
+        self._lock = threading.Lock()
+        self.reload_if_changed()
+
+    def reload_if_changed(self) -> bool:
+        """Re-read the manifest if it changed on disk; return True when it did."""
+        try:
+            mtime = os.path.getmtime(self._manifest_path)
+        except OSError:
+            mtime = None
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            self._manifest = load_manifest(self.snapshot_dir) or {}
+            self._mtime = mtime
+            self._tables = {}
+        logger.info(f"Snapshot manifest loaded: {len(self.tables)} tables in {self.snapshot_dir}")
+        return True
+
+    @property
+    def tables(self) -> List[str]:
+        return list(self._manifest.get("models", {}))
+
+    @property
+    def generated_at(self) -> Optional[float]:
+        return self._manifest.get("generated_at")
+
+    def table(self, name: str) -> "pa.Table":
+        """Return the snapshot of a model as one Arrow table (decoded on first use)."""
+        with self._lock:
+            cached = self._tables.get(name)
+            entry = self._manifest.get("models", {}).get(name)
+        if cached is not None:
+            return cached
+        if entry is None:
+            raise KeyError(f"No snapshot for {name}")
+
+        pieces = [
+            pq.read_table(os.path.join(self.snapshot_dir, part["file"]), memory_map=True)
+            for _, part in sorted(entry["partitions"].items())
+        ]
+        table = pa.concat_tables(pieces, promote_options="default") if len(pieces) > 1 else pieces[0]
+        with self._lock:
+            self._tables[name] = table
+        return table
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tables": len(self._manifest.get("models", {})),
+                "loaded": len(self._tables),
+                "loaded_bytes": sum(t.nbytes for t in self._tables.values()),
+                "generated_at": self._manifest.get("generated_at"),
+            }
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["export", "verify"])
+    parser.add_argument("--select", nargs="+", help="Models to export/verify (default: all documented marts)")
+    parser.add_argument("--full-refresh", action="store_true", help="Re-download every partition")
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR)
+    parser.add_argument("--models-dir", default=MARTS_MODEL_DIR)
+    parser.add_argument("--project", default=os.environ.get("GCP_PROJECT_ID", "semantic-layer-484020"))
+    parser.add_argument("--dataset", default=os.environ.get("BQ_DATASET", "retail_marts_dev"))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "verify":
+        problems = verify_snapshot(args.snapshot_dir, args.select)
+        for problem in problems:
+            print(problem)
+        sys.exit(1 if problems else 0)
+
+    models = discover_models(args.models_dir)
+    if args.select:
+        unknown = set(args.select) - {m.name for m in models}
+        if unknown:
+            parser.error(f"not documented in any marts schema file: {', '.join(sorted(unknown))}")
+        models = [m for m in models if m.name in args.select]
+
+    from google.cloud import bigquery
+    exporter = MartExporter(bigquery.Client(project=args.project), args.project, args.dataset, args.snapshot_dir)
+    manifest = exporter.export(models, full_refresh=args.full_refresh)
+    for name in sorted(m.name for m in models):
+        entry = manifest["models"].get(name)
+        if entry:
+            print(f"{name:<40} {entry['row_count']:>10} rows  {len(entry['partitions']):>4} files")
+
+
+if __name__ == "__main__":
+    main()
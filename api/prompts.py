@@ -1,4 +1,16 @@
-SYSTEM_PROMPT = """
+"""
+Prompt building blocks for NLQ translation.
+
+SYSTEM_PROMPT is the full prompt: role, every Cube, every table and all
+worked examples. schema_retrieval.py assembles smaller per-question prompts
+from the same sections with build_prompt(), keeping only the cubes, tables
+and examples relevant to the question.
+"""
+
+import json
+from typing import Dict, List, Optional, Any
+
+PROMPT_ROLE = """
 You are an expert analytics engineer. Your goal is to translate natural language questions into the BEST execution path - either a Cube semantic layer query OR a raw BigQuery SQL query.
 
 ### ROLE
@@ -6,76 +18,74 @@ You are an expert analytics engineer. Your goal is to translate natural language
 - You MUST first check if the query can be answered using Cube metrics (preferred for caching/governance).
 - Only use raw SQL for complex/ad-hoc queries that Cube cannot handle.
 - You understand retail business terminology (CLV, AOV, RFM, etc.).
+"""
 
-### CUBE METRICS (PREFERRED - Use when possible)
-Available Cube metrics provide governed, cached, consistent data:
-
-**Orders Cube** (orders.*)
-- Measures: orders.count (Total Orders), orders.total_revenue (Total Revenue), orders.avg_order_value (AOV)
+# Curated descriptions per cube; cubes without one are described from the Cube YAML
+CUBE_DOCS: Dict[str, str] = {
+    "orders": """**Orders Cube** (orders.*)
+- Measures: orders.count (Total Orders), orders.total_revenue (Total Revenue), orders.avg_order_value (AOV), orders.unique_customers (Unique Customers)
 - Dimensions: orders.status, orders.country, orders.order_date
-- Use for: Revenue totals, order counts, AOV, revenue by country/status
-
-**Revenue Daily Cube** (revenue_daily.*)
+- Use for: Revenue totals, order counts, AOV, unique customers, revenue by country/status""",
+    "revenue_daily": """**Revenue Daily Cube** (revenue_daily.*)
 - Measures: revenue_daily.total_revenue, revenue_daily.total_orders, revenue_daily.avg_daily_order_value
 - Dimensions: revenue_daily.date
-- Use for: Daily revenue trends, time-series analysis
-
-**Users Cube** (users.*)
+- Use for: Daily revenue trends, time-series analysis""",
+    "users": """**Users Cube** (users.*)
 - Measures: users.count (Total Users), users.total_orders_placed
 - Dimensions: users.country, users.city, users.first_order_date
-- Use for: User counts, user geography
+- Use for: User counts, user geography""",
+}
 
+ROUTING_RULES = """
 ### ROUTING DECISION
 1. **Use Cube** if the query involves:
    - Simple aggregations (total revenue, order count, AOV, user count)
    - Time-series by day (daily revenue trends)
    - Grouping by country, status, or city
-   
+
 2. **Use Raw SQL** if the query involves:
    - RFM segments, customer cohorts, retention
    - Product performance, categories, brands
    - Complex joins or calculations not in Cube
    - Specific lists of records (e.g., "list top 10 products")
+"""
 
-### SCHEMA CONTEXT
-
-#### DIMENSION TABLES
-- `dim_date`: Calendar reference (date_key, month_name, is_weekend, etc.)
-- `dim_users`: User attributes (demographics, location, traffic_source, cohorts)
-- `dim_products`: Product catalog (brand, category, department, cost, price, margin)
-- `dim_distribution_centers`: location info
-- `fct_daily_revenue`: order_date (DATE), total_orders, total_items, total_revenue, total_profit, unique_customers, avg_order_value, return_rate. Grain: Date.
-- `fct_category_performance`: category, department, order_month (TIMESTAMP), total_units_sold, total_revenue, total_profit, order_count, return_rate.
-- `fct_brand_performance`: brand, order_month (TIMESTAMP), total_units_sold, total_revenue, total_profit, order_count.
-
-#### FACT TABLES (METRICS)
-1. **Customers**
-   - `fct_customer_orders`: user_id, total_revenue, total_orders, avg_order_value, first_order_date, last_order_date, tenure_months, is_repeat_customer. Grain: User.
-   - `fct_rfm_scores`: user_id, recency_days, frequency, monetary, recency_score, frequency_score, monetary_score, rfm_code, rfm_segment (Champions, Loyal Customers, Potential Loyalists, Recent Customers, Promising, Needs Attention, Can't Lose, At Risk, Lost). Grain: User.
-
-2. **Products**
-   - `fct_product_performance`: product_id, product_name, category, brand, total_units_sold, total_revenue, total_profit, return_rate. Grain: Product.
-   - `fct_category_performance`: category, department, order_month, total_units_sold, total_revenue, total_profit, order_count, return_rate.
-   - `fct_brand_performance`: brand, order_month, total_units_sold, total_revenue, total_profit, order_count.
-
-3. **Revenue**
-   - `fct_daily_revenue`: order_date (DATE), total_orders, total_items, total_revenue, total_profit, unique_customers, avg_order_value, return_rate. Grain: Date.
-   - `fct_monthly_revenue`: order_month (TIMESTAMP), total_orders, total_revenue, total_profit, prev_month_revenue, prev_year_revenue, mom_growth_pct, yoy_growth_pct, cumulative_revenue_ytd. Grain: Month.
-
-4. **Operations**
-   - `fct_fulfillment`: Order-level shipping times.
-   - `fct_fulfillment_summary`: Monthly SLA stats (% shipped same day).
-   - `fct_returns`: Product return rates and reasons.
-   - `fct_order_status`: Funnel (Processing -> Complete).
-
-5. **Web Analytics**
-   - `fct_sessions`: Session metrics (duration, events).
-   - `fct_web_funnel`: Conversation funnels by source.
-   - `fct_traffic_source_performance`: ROI by channel.
+# Section headings of the schema context, in prompt order
+SCHEMA_SECTIONS = {
+    "core": "Core Dimensions",
+    "customers": "Customers",
+    "products": "Products",
+    "revenue": "Revenue",
+    "operations": "Operations",
+    "web": "Web Analytics",
+}
 
+# Curated one-line descriptions per table; tables without one are described from the dbt schema files
+TABLE_DOCS: Dict[str, str] = {
+    "dim_date": "Calendar reference (date_key, month_name, is_weekend, etc.)",
+    "dim_users": "User attributes (demographics, location, traffic_source, cohorts)",
+    "dim_products": "Product catalog (brand, category, department, cost, price, margin)",
+    "dim_distribution_centers": "location info",
+    "fct_customer_orders": "user_id, total_revenue, total_orders, avg_order_value, first_order_date, last_order_date, tenure_months, is_repeat_customer. Grain: User.",
+    "fct_rfm_scores": "user_id, recency_days, frequency, monetary, recency_score, frequency_score, monetary_score, rfm_code, rfm_segment (Champions, Loyal Customers, Potential Loyalists, Recent Customers, Promising, Needs Attention, Can't Lose, At Risk, Lost). Grain: User.",
+    "fct_product_performance": "product_id, product_name, category, brand, total_units_sold, total_revenue, total_profit, return_rate. Grain: Product.",
+    "fct_category_performance": "category, department, order_month (TIMESTAMP), total_units_sold, total_revenue, total_profit, order_count, return_rate.",
+    "fct_brand_performance": "brand, order_month (TIMESTAMP), total_units_sold, total_revenue, total_profit, order_count.",
+    "fct_daily_revenue": "order_date (DATE), total_orders, total_items, total_revenue, total_profit, unique_customers, avg_order_value, return_rate. Grain: Date.",
+    "fct_monthly_revenue": "order_month (TIMESTAMP), total_orders, total_revenue, total_profit, prev_month_revenue, prev_year_revenue, mom_growth_pct, yoy_growth_pct, cumulative_revenue_ytd. Grain: Month.",
+    "fct_fulfillment": "Order-level shipping times.",
+    "fct_fulfillment_summary": "Monthly SLA stats (% shipped same day).",
+    "fct_returns": "Product return rates and reasons.",
+    "fct_order_status": "Funnel (Processing -> Complete).",
+    "fct_sessions": "Session metrics (duration, events).",
+    "fct_web_funnel": "Conversation funnels by source.",
+    "fct_traffic_source_performance": "ROI by channel.",
+}
+
+PROMPT_RULES = """
 ### RULES
 1. **Table Selection**: Use `semantic-layer-484020.retail_marts_dev.<table_name>`.
-2. **Date Logic**: 
+2. **Date Logic**:
    - "Last month" = `DATE_TRUNC(DATE_SUB(CURRENT_DATE(), INTERVAL 1 MONTH), MONTH)`
    - "YTD" = `EXTRACT(YEAR FROM date_col) = EXTRACT(YEAR FROM CURRENT_DATE())`
    - **CRITICAL**: When comparing a `TIMESTAMP` column (like `order_month`) with a `DATE` (like `CURRENT_DATE`), you MUST cast the TIMESTAMP to DATE: `DATE(order_month) = CURRENT_DATE()`.
@@ -98,95 +108,115 @@ Available Cube metrics provide governed, cached, consistent data:
     "table": "main_table_used (only if route=bigquery)",
     "explanation": "why this logic and why this route"
 }
+"""
 
-### EXAMPLES
-
-Input: "What is our total revenue?"
-Output:
-{
-    "intent": "total_revenue",
-    "route": "cube",
-    "cube_query": {
-        "measures": ["orders.total_revenue"],
-        "dimensions": [],
-        "timeDimensions": [],
-        "filters": []
-    },
-    "sql": null,
-    "table": null,
-    "explanation": "Simple aggregation - using Cube for governed, cached metric."
-}
-
-Input: "Show me daily revenue for the last 30 days"
-Output:
-{
-    "intent": "daily_revenue_trend",
-    "route": "cube",
-    "cube_query": {
-        "measures": ["orders.total_revenue", "orders.count"],
-        "dimensions": [],
-        "timeDimensions": [{"dimension": "orders.order_date", "granularity": "day", "dateRange": "last 30 days"}],
-        "filters": []
-    },
-    "sql": null,
-    "table": null,
-    "explanation": "Time-series query - using Cube for daily granularity with caching."
-}
-
-Input: "What is revenue by country?"
-Output:
-{
-    "intent": "revenue_by_geography",
-    "route": "cube",
-    "cube_query": {
-        "measures": ["orders.total_revenue"],
-        "dimensions": ["orders.country"],
-        "timeDimensions": [],
-        "filters": []
-    },
-    "sql": null,
-    "table": null,
-    "explanation": "Grouped aggregation by dimension - Cube handles this efficiently."
-}
-
-Input: "Which products have the highest return rate?"
-Output:
-{
-    "intent": "analyze_product_returns",
-    "route": "bigquery",
-    "cube_query": null,
-    "sql": "SELECT product_name, return_rate, total_units_sold FROM `semantic-layer-484020.retail_marts_dev.fct_product_performance` WHERE total_units_sold > 10 ORDER BY return_rate DESC LIMIT 10",
-    "table": "fct_product_performance",
-    "explanation": "Product-level analysis not available in Cube - using raw SQL."
-}
-
-Input: "Which customers are in the Champions segment?"
-Output:
-{
-    "intent": "segmentation_list",
-    "route": "bigquery",
-    "cube_query": null,
-    "sql": "SELECT user_id, recency_days, frequency, monetary, rfm_segment FROM `semantic-layer-484020.retail_marts_dev.fct_rfm_scores` WHERE rfm_segment = 'Champions' LIMIT 100",
-    "table": "fct_rfm_scores",
-    "explanation": "RFM segmentation not in Cube - using raw SQL for customer segments."
-}
-
-Input: "Show me monthly revenue growth"
-Output:
-{
-    "intent": "monthly_growth",
-    "route": "bigquery",
-    "cube_query": null,
-    "sql": "SELECT order_month, total_revenue, mom_growth_pct, yoy_growth_pct FROM `semantic-layer-484020.retail_marts_dev.fct_monthly_revenue` ORDER BY order_month DESC LIMIT 12",
-    "table": "fct_monthly_revenue",
-    "explanation": "Growth calculations (MoM, YoY) not in Cube - using pre-calculated SQL mart."
-}
+# Appended to the prompt when Cube answers may fall back to (or race) BigQuery
+DUAL_ROUTE_RULE = """
+### FALLBACK SQL
+When route is "cube", ALSO set "sql" and "table" to an equivalent BigQuery query over the marts above, returning the
+same measures and groupings. It runs if Cube fails or is slow, so it must be complete and valid on its own.
 """
 
+# Worked examples: (question, expected output)
+EXAMPLES: List[tuple] = [
+    ("What is our total revenue?", {
+        "intent": "total_revenue",
+        "route": "cube",
+        "cube_query": {"measures": ["orders.total_revenue"], "dimensions": [], "timeDimensions": [], "filters": []},
+        "sql": None,
+        "table": None,
+        "explanation": "Simple aggregation - using Cube for governed, cached metric."
+    }),
+    ("Show me daily revenue for the last 30 days", {
+        "intent": "daily_revenue_trend",
+        "route": "cube",
+        "cube_query": {
+            "measures": ["orders.total_revenue", "orders.count"],
+            "dimensions": [],
+            "timeDimensions": [{"dimension": "orders.order_date", "granularity": "day", "dateRange": "last 30 days"}],
+            "filters": []
+        },
+        "sql": None,
+        "table": None,
+        "explanation": "Time-series query - using Cube for daily granularity with caching."
+    }),
+    ("What is revenue by country?", {
+        "intent": "revenue_by_geography",
+        "route": "cube",
+        "cube_query": {"measures": ["orders.total_revenue"], "dimensions": ["orders.country"], "timeDimensions": [], "filters": []},
+        "sql": None,
+        "table": None,
+        "explanation": "Grouped aggregation by dimension - Cube handles this efficiently."
+    }),
+    ("Which products have the highest return rate?", {
+        "intent": "analyze_product_returns",
+        "route": "bigquery",
+        "cube_query": None,
+        "sql": "SELECT product_name, return_rate, total_units_sold FROM `semantic-layer-484020.retail_marts_dev.fct_product_performance` WHERE total_units_sold > 10 ORDER BY return_rate DESC LIMIT 10",
+        "table": "fct_product_performance",
+        "explanation": "Product-level analysis not available in Cube - using raw SQL."
+    }),
+    ("Which customers are in the Champions segment?", {
+        "intent": "segmentation_list",
+        "route": "bigquery",
+        "cube_query": None,
+        "sql": "SELECT user_id, recency_days, frequency, monetary, rfm_segment FROM `semantic-layer-484020.retail_marts_dev.fct_rfm_scores` WHERE rfm_segment = 'Champions' LIMIT 100",
+        "table": "fct_rfm_scores",
+        "explanation": "RFM segmentation not in Cube - using raw SQL for customer segments."
+    }),
+    ("Show me monthly revenue growth", {
+        "intent": "monthly_growth",
+        "route": "bigquery",
+        "cube_query": None,
+        "sql": "SELECT order_month, total_revenue, mom_growth_pct, yoy_growth_pct FROM `semantic-layer-484020.retail_marts_dev.fct_monthly_revenue` ORDER BY order_month DESC LIMIT 12",
+        "table": "fct_monthly_revenue",
+        "explanation": "Growth calculations (MoM, YoY) not in Cube - using pre-calculated SQL mart."
+    }),
+]
+
+# Every table described in SYSTEM_PROMPT; also the SQL guard's allow-list
 SCHEMA_SUMMARY = {
+    "core": ["dim_users", "dim_products", "dim_date", "dim_distribution_centers"],
     "customers": ["fct_customer_orders", "fct_rfm_scores", "fct_customer_retention"],
-    "products": ["fct_product_performance", "fct_product_affinity", "fct_category_performance"],
+    "products": ["fct_product_performance", "fct_product_affinity", "fct_category_performance", "fct_brand_performance"],
     "revenue": ["fct_daily_revenue", "fct_monthly_revenue", "fct_geography_revenue"],
-    "operations": ["fct_fulfillment_summary", "fct_returns"],
-    "web": ["fct_web_funnel", "fct_traffic_source_performance"]
+    "operations": ["fct_fulfillment", "fct_fulfillment_summary", "fct_order_status", "fct_returns"],
+    "web": ["fct_web_funnel", "fct_traffic_source_performance", "fct_sessions"]
 }
+
+
+def format_example(question: str, output: Dict[str, Any]) -> str:
+    return f'Input: "{question}"\nOutput:\n{json.dumps(output, indent=4)}'
+
+
+def build_prompt(
+    cube_docs: Dict[str, str],
+    table_docs: Dict[str, str],
+    examples: List[tuple],
+    sections: Optional[Dict[str, List[str]]] = None
+) -> str:
+    """Assemble a system prompt from the given cubes, tables and examples."""
+    sections = sections or SCHEMA_SUMMARY
+    parts = [PROMPT_ROLE]
+    if cube_docs:
+        parts.append(
+            "### CUBE METRICS (PREFERRED - Use when possible)\n"
+            "Available Cube metrics provide governed, cached, consistent data:\n\n"
+            + "\n\n".join(cube_docs.values())
+        )
+    parts.append(ROUTING_RULES)
+
+    schema = []
+    for section, tables in sections.items():
+        lines = [f"- `{t}`: {table_docs[t]}" for t in tables if t in table_docs]
+        if lines:
+            schema.append(f"#### {SCHEMA_SECTIONS.get(section, section.title())}\n" + "\n".join(lines))
+    if schema:
+        parts.append("### SCHEMA CONTEXT\n\n" + "\n\n".join(schema))
+    parts.append(PROMPT_RULES)
+    if examples:
+        parts.append("### EXAMPLES\n\n" + "\n\n".join(format_example(q, o) for q, o in examples))
+    return "\n".join(part.strip("\n") + "\n" for part in parts)
+
+
+SYSTEM_PROMPT = build_prompt(CUBE_DOCS, TABLE_DOCS, EXAMPLES)
@@ -0,0 +1,360 @@
+"""
+Semantic query planner: moves aggregate queries onto pre-aggregated marts.
+
+The catalog comes from the `meta` blocks of the dbt schema files: a mart
+declares which finer table it rolls up (`rollup_of`), which source
+dimensions it keeps (optionally only at a truncated time grain) and which
+source aggregates it can reproduce. A single-table aggregate query whose
+every column and aggregate is covered is rewritten onto the coarsest mart
+that can answer it, e.g. `SUM(total_revenue) ... FROM fct_orders GROUP BY
+DATE_TRUNC(order_date, MONTH)` onto fct_monthly_revenue. Anything the
+planner does not fully understand is left untouched.
+"""
+
+import os
+import re
+import glob
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Tuple, Any
+
+from sql_utils import canonicalize_sql, mask_literals, table_refs, tokenize_sql
+from mart_snapshots import MARTS_MODEL_DIR
+
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    YAML_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+QUERY_PLANNER_ENABLED = os.environ.get("QUERY_PLANNER_ENABLED", "true").lower() == "true"
+
+# Date parts a truncated dimension can still answer, by the grain it is stored at
+_GRAIN_PARTS = {
+    "day": {"day", "week", "isoweek", "month", "quarter", "year"},
+    "month": {"month", "quarter", "year"},
+    "quarter": {"quarter", "year"},
+    "year": {"year"},
+}
+_GRAIN_RANK = {None: 0, "day": 1, "month": 2, "quarter": 3, "year": 4}
+
+_AGGREGATE_RE = re.compile(r"\b(sum|count|countif|count_if|avg|min|max|any_value)\s*\(", re.IGNORECASE)
+_IDENT_RE = re.compile(r"(?<![\w.])([A-Za-z_]\w*)(?:\.([A-Za-z_]\w*))?")
+_TRUNC_RE = re.compile(r"\b(?:date|datetime|timestamp)_trunc\s*\(\s*$", re.IGNORECASE)
+_EXTRACT_RE = re.compile(r"\bextract\s*\(\s*(\w+)\s+from\s+$", re.IGNORECASE)
+_CLAUSE_RE = re.compile(
+    r"\b(select|from|where|group\s+by|having|qualify|window|order\s+by|limit)\b",
+    re.IGNORECASE
+)
+_UNSUPPORTED_RE = re.compile(r"\b(join|union|intersect|except|over|distinct|with|unnest|pivot|tablesample)\b", re.IGNORECASE)
+_KEYWORDS = {
+    "and", "or", "not", "in", "is", "null", "between", "like", "case", "when", "then", "else",
+    "end", "as", "asc", "desc", "nulls", "first", "last", "true", "false", "interval", "from",
+    "date", "datetime", "timestamp", "time", "cast", "safe_cast", "extract", "current_date",
+    "current_timestamp", "int64", "float64", "numeric", "bignumeric", "string", "bool", "bytes",
+    "year", "quarter", "month", "week", "isoweek", "isoyear", "day", "dayofweek", "dayofyear",
+    "hour", "minute", "second", "monday", "sunday",
+}
+
+
+class _Ineligible(Exception):
+    pass
+
+
+@dataclass
+class Rollup:
+    """How a mart reproduces aggregates over one finer source table."""
+    mart: str
+    source: str
+    dimensions: Dict[str, Dict[str, Any]]  # source column -> {column, truncated_to}
+    measures: Dict[str, str]  # normalized source aggregate -> mart expression
+    grain: List[str] = field(default_factory=list)
+
+    @property
+    def rank(self) -> int:
+        return max((_GRAIN_RANK.get(d.get("truncated_to"), 0) for d in self.dimensions.values()), default=0)
+
+
+@dataclass
+class Rewrite:
+    sql: str
+    original_sql: str
+    from_table: str
+    to_table: str
+
+    def summary(self) -> Dict[str, Any]:
+        return {"from_table": self.from_table, "to_table": self.to_table, "original_sql": self.original_sql}
+
+
+def normalize_aggregate(text: str) -> str:
+    """Canonical form used to match aggregates: lower case, no whitespace, string literals kept verbatim."""
+    return "".join(
+        token if kind == "string" else re.sub(r"\s+", "", token).lower()
+        for kind, token in tokenize_sql(text)
+    )
+
+
+def load_catalog(models_dir: str = MARTS_MODEL_DIR) -> Dict[str, List[Rollup]]:
+    """Read `meta.rollup_of` from the marts' schema files; returns rollups by source table."""
+    if not YAML_AVAILABLE:
+        raise RuntimeError("PyYAML is required to read the dbt schema files")
+    catalog: Dict[str, List[Rollup]] = {}
+    for path in sorted(glob.glob(os.path.join(models_dir, "*", "_*schema.yml"))):
+        with open(path) as f:
+            schema = yaml.safe_load(f) or {}
+        for model in schema.get("models", []):
+            meta = model.get("meta") or {}
+            for source, spec in (meta.get("rollup_of") or {}).items():
+                catalog.setdefault(source.lower(), []).append(Rollup(
+                    mart=model["name"].lower(),
+                    source=source.lower(),
+                    dimensions={k.lower(): v for k, v in (spec.get("dimensions") or {}).items()},
+                    measures={normalize_aggregate(k): v for k, v in (spec.get("measures") or {}).items()},
+                    grain=list(meta.get("grain") or []),
+                ))
+    for rollups in catalog.values():
+        # coarsest mart first; fewer rows to scan
+        rollups.sort(key=lambda r: -r.rank)
+    return catalog
+
+
+# ============================================================================
+# Parsing
+# ============================================================================
+
+def _matching_paren(masked: str, open_index: int) -> int:
+    depth = 0
+    for i in range(open_index, len(masked)):
+        if masked[i] == "(":
+            depth += 1
+        elif masked[i] == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+    raise _Ineligible("unbalanced parentheses")
+
+
+def _split_top_level(text: str, masked: str) -> List[str]:
+    items, depth, start = [], 0, 0
+    for i, char in enumerate(masked):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append(text[start:i].strip())
+            start = i + 1
+    items.append(text[start:].strip())
+    return items
+
+
+def _split_alias(item: str) -> Tuple[str, str, Optional[str]]:
+    """Split a select item into (expression, alias suffix, alias); `AS` is optional."""
+    match = re.search(r"(?:\s+as)?\s+([A-Za-z_]\w*)\s*$", mask_literals(item), re.IGNORECASE)
+    if not match or match.group(1).lower() in _KEYWORDS or not item[:match.start()].strip():
+        return item, "", None
+    return item[:match.start()], item[match.start():], match.group(1).lower()
+
+
+def _clauses(sql: str) -> Dict[str, str]:
+    """Split a flat SELECT into its clauses; raise _Ineligible for anything else."""
+    masked = mask_literals(sql)
+    if _UNSUPPORTED_RE.search(masked) or re.search(r"\(\s*select\b", masked, re.IGNORECASE):
+        raise _Ineligible("not a single-table aggregate")
+    positions = []
+    for match in _CLAUSE_RE.finditer(masked):
+        depth = masked.count("(", 0, match.start()) - masked.count(")", 0, match.start())
+        if depth == 0:
+            positions.append((re.sub(r"\s+", " ", match.group(1).lower()), match.start(), match.end()))
+    names = [p[0] for p in positions]
+    if not names or names[0] != "select" or len(set(names)) != len(names) or {"qualify", "window"} & set(names):
+        raise _Ineligible("unsupported clause layout")
+    clauses = {}
+    for index, (name, _, end) in enumerate(positions):
+        stop = positions[index + 1][1] if index + 1 < len(positions) else len(sql)
+        clauses[name] = sql[end:stop].strip()
+    return clauses
+
+
+# ============================================================================
+# Planner
+# ============================================================================
+
+class QueryPlanner:
+    """Rewrites eligible aggregate queries onto the coarsest mart in the catalog."""
+
+    def __init__(self, catalog: Dict[str, List[Rollup]]):
+        self.catalog = catalog
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {"planned": 0, "rewritten": 0}
+        self._by_target: Dict[str, int] = {}
+
+    def _rewrite_expr(self, expr: str, rollup: Rollup, table_alias: Optional[str], aliases: set) -> Tuple[str, bool]:
+        """Rewrite one expression; return (expression, contains an aggregate)."""
+        masked = mask_literals(expr)
+
+        # aggregates first: every call must be a catalogued measure
+        replacements = []
+        position = 0
+        while True:
+            match = _AGGREGATE_RE.search(masked, position)
+            if not match:
+                break
+            end = _matching_paren(masked, match.end() - 1) + 1
+            call = expr[match.start():end]
+            if table_alias:
+                call = re.sub(rf"(?<![\w.]){re.escape(table_alias)}\.", "", call)
+            mart_expr = rollup.measures.get(normalize_aggregate(call))
+            if mart_expr is None:
+                raise _Ineligible(f"no measure for {call}")
+            replacements.append((match.start(), end, mart_expr))
+            position = end
+        aggregated = bool(replacements)
+
+        # then columns outside the aggregates: every one must be a catalogued dimension
+        spans = [(s, e) for s, e, _ in replacements]
+        for match in _IDENT_RE.finditer(masked):
+            if any(s <= match.start() < e for s, e in spans):
+                continue
+            qualifier, column = (match.group(1), match.group(2)) if match.group(2) else (None, match.group(1))
+            lowered = column.lower()
+            if masked[match.end():].lstrip().startswith("("):
+                continue  # function name
+            if qualifier is None and (lowered in _KEYWORDS or lowered in aliases):
+                continue
+            if qualifier is not None and (table_alias is None or qualifier.lower() != table_alias.lower()):
+                raise _Ineligible(f"unknown qualifier {qualifier}")
+            dimension = rollup.dimensions.get(lowered)
+            if dimension is None:
+                raise _Ineligible(f"no dimension for {column}")
+            truncated_to = dimension.get("truncated_to")
+            if truncated_to:
+                before = masked[:match.start()]
+                extract = _EXTRACT_RE.search(before)
+                if extract:
+                    part = extract.group(1).lower()
+                else:
+                    trunc = _TRUNC_RE.search(before)
+                    after = re.match(r"\s*,\s*(\w+)\s*\)", masked[match.end():])
+                    part = after.group(1).lower() if trunc and after else None
+                if part not in _GRAIN_PARTS[truncated_to]:
+                    raise _Ineligible(f"{column} is only available per {truncated_to}")
+            replacements.append((match.start(), match.end(), dimension["column"]))
+
+        for start, end, text in sorted(replacements, reverse=True):
+            expr = expr[:start] + text + expr[end:]
+        return expr, aggregated
+
+    def _rewrite(self, sql: str, rollup: Rollup, clauses: Dict[str, str], ref: str, table_alias: Optional[str]) -> str:
+        select_items = _split_top_level(clauses["select"], mask_literals(clauses["select"]))
+        aliases = {alias for _, _, alias in map(_split_alias, select_items) if alias}
+        if any(item == "*" or item.endswith(".*") for item in select_items):
+            raise _Ineligible("SELECT *")
+
+        has_aggregate = False
+        items = []
+        for item in select_items:
+            body, suffix, alias = _split_alias(item)
+            rewritten, aggregated = self._rewrite_expr(body, rollup, table_alias, set())
+            has_aggregate |= aggregated
+            if not alias and not aggregated and re.fullmatch(r"\s*(?:\w+\.)?\w+\s*", body) and rewritten.strip() != body.split(".")[-1].strip():
+                # keep the output column name when a bare column is renamed
+                suffix = f" AS {body.split('.')[-1].strip()}"
+            items.append(rewritten + suffix)
+        if not has_aggregate and "group by" not in clauses:
+            raise _Ineligible("not an aggregate query")
+
+        parts = [f"SELECT {', '.join(items)}", f"FROM {ref}" + (f" {table_alias}" if table_alias else "")]
+        if "where" in clauses:
+            parts.append("WHERE " + self._rewrite_expr(clauses["where"], rollup, table_alias, set())[0])
+        if "group by" in clauses:
+            parts.append("GROUP BY " + self._rewrite_list(clauses["group by"], rollup, table_alias, aliases))
+        if "having" in clauses:
+            parts.append("HAVING " + self._rewrite_expr(clauses["having"], rollup, table_alias, aliases)[0])
+        if "order by" in clauses:
+            parts.append("ORDER BY " + self._rewrite_list(clauses["order by"], rollup, table_alias, aliases))
+        if "limit" in clauses:
+            parts.append(f"LIMIT {clauses['limit']}")
+        return " ".join(parts)
+
+    def _rewrite_list(self, text: str, rollup: Rollup, table_alias: Optional[str], aliases: set) -> str:
+        """Rewrite a GROUP BY / ORDER BY list; positions and output aliases pass through."""
+        rewritten = []
+        for entry in _split_top_level(text, mask_literals(text)):
+            direction = re.search(r"\s+(asc|desc)(\s+nulls\s+(first|last))?\s*$", entry, re.IGNORECASE)
+            body, suffix = (entry[:direction.start()], entry[direction.start():]) if direction else (entry, "")
+            if body.strip().isdigit():
+                rewritten.append(entry)
+            else:
+                rewritten.append(self._rewrite_expr(body, rollup, table_alias, aliases)[0] + suffix)
+        return ", ".join(rewritten)
+
+    def plan(self, sql: str) -> Optional[Rewrite]:
+        """Return the rewrite onto a coarser mart, or None to run the query as written."""
+        with self._lock:
+            self._stats["planned"] += 1
+        sql = canonicalize_sql(sql)
+        refs = table_refs(sql)
+        if len(refs) != 1:
+            return None
+        ref = refs[0][0]
+        source = ref.strip("`").split(".")[-1].lower()
+        rollups = self.catalog.get(source)
+        if not rollups:
+            return None
+        try:
+            clauses = _clauses(sql)
+        except _Ineligible:
+            return None
+
+        from_match = re.fullmatch(r"(`[^`]+`|[\w.\-]+)(?:\s+(?:as\s+)?([A-Za-z_]\w*))?", clauses.get("from", ""), re.IGNORECASE)
+        if not from_match:
+            return None
+        table_alias = from_match.group(2)
+
+        for rollup in rollups:
+            target_ref = re.sub(r"[A-Za-z_]\w*(`?)$", lambda m: rollup.mart + m.group(1), ref)
+            try:
+                rewritten = self._rewrite(sql, rollup, clauses, target_ref, table_alias)
+            except _Ineligible as e:
+                logger.debug(f"{rollup.mart} cannot answer the query: {e}")
+                continue
+            logger.info(f"Query planner: {source} -> {rollup.mart}")
+            with self._lock:
+                self._stats["rewritten"] += 1
+                self._by_target[rollup.mart] = self._by_target.get(rollup.mart, 0) + 1
+            return Rewrite(sql=rewritten, original_sql=sql, from_table=source, to_table=rollup.mart)
+        return None
+
+    def describe(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Catalog summary: for each source table, the marts that can answer its aggregates."""
+        return {
+            source: [
+                {"mart": r.mart, "grain": r.grain, "dimensions": sorted(r.dimensions), "measures": sorted(r.measures)}
+                for r in rollups
+            ]
+            for source, rollups in self.catalog.items()
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "by_target": dict(self._by_target)}
+
+
+def build_query_planner() -> Optional[QueryPlanner]:
+    """Planner over the dbt marts catalog, or None when disabled or unreadable."""
+    if not QUERY_PLANNER_ENABLED:
+        return None
+    try:
+        catalog = load_catalog()
+    except Exception as e:
+        logger.warning(f"Query planner disabled: {e}")
+        return None
+    if not catalog:
+        logger.warning("Query planner disabled: no meta.rollup_of entries found")
+        return None
+    logger.info(f"Query planner catalog: {sum(len(r) for r in catalog.values())} rollups over {len(catalog)} tables")
+    return QueryPlanner(catalog)
@@ -0,0 +1,241 @@
+"""
+Per-question schema retrieval for the NLQ prompt.
+
+Sending SYSTEM_PROMPT on every call means paying for every cube, every
+table and every worked example even when the question touches one mart.
+The retriever indexes the prompt sections (prompts.py) together with the
+dbt schema files and the Cube YAML model, scores each cube, table and
+example against the question with TF-IDF cosine similarity and assembles
+a prompt from only the best matches. Role, routing rules and output
+format are always included. Questions that match nothing fall back to the
+full prompt.
+"""
+
+import os
+import glob
+import math
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any, Tuple
+
+from intent_matcher import tokenize, load_member_titles, CUBE_MODEL_DIR, YAML_AVAILABLE
+from mart_snapshots import MARTS_MODEL_DIR
+from prompts import CUBE_DOCS, TABLE_DOCS, EXAMPLES, SCHEMA_SUMMARY, SYSTEM_PROMPT, build_prompt
+
+if YAML_AVAILABLE:
+    import yaml
+
+logger = logging.getLogger(__name__)
+
+PROMPT_RETRIEVAL_ENABLED = os.environ.get("PROMPT_RETRIEVAL_ENABLED", "true").lower() == "true"
+PROMPT_MAX_TABLES = int(os.environ.get("PROMPT_MAX_TABLES", "4"))
+PROMPT_MAX_CUBES = int(os.environ.get("PROMPT_MAX_CUBES", "2"))
+PROMPT_MAX_EXAMPLES = int(os.environ.get("PROMPT_MAX_EXAMPLES", "2"))
+PROMPT_MIN_SCORE = float(os.environ.get("PROMPT_MIN_SCORE", "0.05"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough Gemini token count (~4 characters per token) for logging and stats."""
+    return max(1, len(text) // 4)
+
+
+def load_table_metadata(models_dir: str = MARTS_MODEL_DIR) -> Dict[str, Dict[str, Any]]:
+    """Read model descriptions and documented columns from the marts' schema files."""
+    tables: Dict[str, Dict[str, Any]] = {}
+    if not YAML_AVAILABLE:
+        return tables
+    for path in sorted(glob.glob(os.path.join(models_dir, "*", "_*schema.yml"))):
+        try:
+            with open(path) as f:
+                schema = yaml.safe_load(f) or {}
+        except (OSError, yaml.YAMLError) as e:
+            logger.warning(f"Could not read dbt schema {path}: {e}")
+            continue
+        for model in schema.get("models", []):
+            tables[model["name"]] = {
+                "description": model.get("description", ""),
+                "columns": [(c["name"], c.get("description", "")) for c in model.get("columns", [])],
+            }
+    return tables
+
+
+@dataclass
+class PromptSelection:
+    prompt: str
+    tokens: int
+    cubes: List[str] = field(default_factory=list)
+    tables: List[str] = field(default_factory=list)
+    examples: List[str] = field(default_factory=list)
+    fallback: bool = False
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "tokens": self.tokens,
+            "cubes": self.cubes,
+            "tables": self.tables,
+            "examples": len(self.examples),
+            "fallback": self.fallback,
+        }
+
+
+class SchemaRetriever:
+    """Scores cubes, tables and examples against a question and builds a compact prompt."""
+
+    def __init__(
+        self,
+        cube_docs: Dict[str, str],
+        table_docs: Dict[str, str],
+        examples: List[tuple],
+        search_text: Dict[Tuple[str, str], str],
+        max_tables: int = PROMPT_MAX_TABLES,
+        max_cubes: int = PROMPT_MAX_CUBES,
+        max_examples: int = PROMPT_MAX_EXAMPLES,
+        min_score: float = PROMPT_MIN_SCORE
+    ):
+        self.cube_docs = cube_docs
+        self.table_docs = table_docs
+        self.examples = examples
+        self.limits = {"cube": max_cubes, "table": max_tables, "example": max_examples}
+        self.min_score = min_score
+        self.full_tokens = estimate_tokens(SYSTEM_PROMPT)
+
+        # one document per (kind, key); search_text adds the YAML-derived vocabulary
+        documents = [(("cube", name), doc) for name, doc in cube_docs.items()]
+        documents += [(("table", name), f"{name.replace('_', ' ')} {doc}") for name, doc in table_docs.items()]
+        documents += [
+            (("example", question), f"{question} {output.get('table') or ''} {' '.join(_cube_members(output))}")
+            for question, output in examples
+        ]
+        tokenized = [(key, tokenize(f"{text} {search_text.get(key, '')}")) for key, text in documents]
+        doc_freq: Dict[str, int] = {}
+        for _, tokens in tokenized:
+            for token in set(tokens):
+                doc_freq[token] = doc_freq.get(token, 0) + 1
+        self._idf = {
+            token: math.log((1 + len(tokenized)) / (1 + df)) + 1
+            for token, df in doc_freq.items()
+        }
+        self._docs = [(key, self._vector(tokens)) for key, tokens in tokenized if tokens]
+
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "fallbacks": 0, "prompt_tokens": 0, "gemini_prompt_tokens": 0, "gemini_calls": 0}
+
+    def _vector(self, tokens: List[str]) -> Dict[str, float]:
+        weights: Dict[str, float] = {}
+        for token in tokens:
+            weights[token] = weights.get(token, 0.0) + self._idf.get(token, 0.0)
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        return {t: w / norm for t, w in weights.items()} if norm else {}
+
+    def rank(self, question: str) -> Dict[str, List[Tuple[str, float]]]:
+        """Matching documents per kind, best first."""
+        vector = self._vector(tokenize(question))
+        ranked: Dict[str, List[Tuple[str, float]]] = {"cube": [], "table": [], "example": []}
+        for (kind, key), doc in self._docs:
+            score = sum(w * doc.get(t, 0.0) for t, w in vector.items())
+            if score >= self.min_score:
+                ranked[kind].append((key, score))
+        for matches in ranked.values():
+            matches.sort(key=lambda item: item[1], reverse=True)
+        return ranked
+
+    def select(self, question: str) -> PromptSelection:
+        """Build the prompt for one question."""
+        ranked = self.rank(question)
+        chosen = {kind: [key for key, _ in matches[:self.limits[kind]]] for kind, matches in ranked.items()}
+        if not chosen["cube"] and not chosen["table"]:
+            selection = PromptSelection(prompt=SYSTEM_PROMPT, tokens=self.full_tokens, fallback=True)
+        else:
+            prompt = build_prompt(
+                {name: self.cube_docs[name] for name in chosen["cube"]},
+                {name: self.table_docs[name] for name in chosen["table"]},
+                [example for example in self.examples if example[0] in chosen["example"]]
+            )
+            selection = PromptSelection(
+                prompt=prompt,
+                tokens=estimate_tokens(prompt),
+                cubes=chosen["cube"],
+                tables=chosen["table"],
+                examples=chosen["example"]
+            )
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["fallbacks"] += selection.fallback
+            self._stats["prompt_tokens"] += selection.tokens
+        logger.info(
+            f"Prompt: ~{selection.tokens} tokens ({selection.tokens / self.full_tokens:.0%} of full), "
+            f"cubes={selection.cubes}, tables={selection.tables}, examples={len(selection.examples)}"
+            + (" [fallback]" if selection.fallback else "")
+        )
+        return selection
+
+    def record_usage(self, prompt_tokens: int):
+        """Count the prompt tokens Gemini actually billed for a call."""
+        with self._lock:
+            self._stats["gemini_calls"] += 1
+            self._stats["gemini_prompt_tokens"] += prompt_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+        requests = s["requests"]
+        avg = s["prompt_tokens"] / requests if requests else 0.0
+        return {
+            "documents": len(self._docs),
+            "requests": requests,
+            "fallbacks": s["fallbacks"],
+            "full_prompt_tokens": self.full_tokens,
+            "avg_prompt_tokens": round(avg, 1),
+            "avg_reduction": round(1 - avg / self.full_tokens, 4) if requests else 0.0,
+            "avg_gemini_prompt_tokens": round(s["gemini_prompt_tokens"] / s["gemini_calls"], 1) if s["gemini_calls"] else None,
+        }
+
+
+def _cube_members(output: Dict[str, Any]) -> List[str]:
+    query = output.get("cube_query") or {}
+    members = list(query.get("measures", [])) + list(query.get("dimensions", []))
+    members += [td.get("dimension", "") for td in query.get("timeDimensions", [])]
+    return [m.replace(".", " ") for m in members]
+
+
+def build_schema_retriever() -> Optional[SchemaRetriever]:
+    """Index prompts.py plus the dbt and Cube YAML, or None when retrieval is disabled."""
+    if not PROMPT_RETRIEVAL_ENABLED:
+        logger.info("Prompt retrieval disabled; sending the full system prompt")
+        return None
+
+    search_text: Dict[Tuple[str, str], str] = {}
+    cube_docs = dict(CUBE_DOCS)
+    members: Dict[str, List[str]] = {}
+    for member, title in load_member_titles(CUBE_MODEL_DIR).items():
+        cube, name = member.split(".", 1)
+        members.setdefault(cube, []).append(f"{member} ({title})" if title != name.replace("_", " ") else member)
+        search_text[("cube", cube)] = f"{search_text.get(('cube', cube), '')} {name.replace('_', ' ')} {title}"
+    for cube, names in members.items():
+        # cubes in the YAML model without a curated description
+        cube_docs.setdefault(cube, f"**{cube.replace('_', ' ').title()} Cube** ({cube}.*)\n- Members: {', '.join(names)}")
+
+    table_docs = {}
+    metadata = load_table_metadata()
+    for table in (t for tables in SCHEMA_SUMMARY.values() for t in tables):
+        meta = metadata.get(table, {})
+        columns = meta.get("columns", [])
+        if table in TABLE_DOCS:
+            table_docs[table] = TABLE_DOCS[table]
+        elif meta:
+            # marts without a curated line are described from their schema file
+            documented = ", ".join(name for name, _ in columns)
+            table_docs[table] = meta["description"] + (f". Columns include: {documented}." if documented else "")
+        else:
+            continue
+        search_text[("table", table)] = " ".join(
+            [meta.get("description", "")] + [f"{name} {description}" for name, description in columns]
+        )
+
+    retriever = SchemaRetriever(cube_docs, table_docs, EXAMPLES, search_text)
+    logger.info(
+        f"Prompt retrieval ready: {len(cube_docs)} cubes, {len(table_docs)} tables, {len(EXAMPLES)} examples; "
+        f"full prompt ~{retriever.full_tokens} tokens"
+    )
+    return retriever
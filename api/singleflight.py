@@ -0,0 +1,89 @@
+"""
+Request coalescing ("single-flight") for backend calls.
+
+When many dashboard sessions ask the same question at the same moment, only
+the first caller hits Cube or BigQuery; everyone else awaits the same
+in-flight future and receives its result. A call is only cancelled once
+every caller waiting for it has given up.
+"""
+
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+def cube_query_key(query: Dict[str, Any]) -> str:
+    """Stable key for a Cube query object (key order and empty clauses ignored)."""
+    normalized = {k: v for k, v in query.items() if v not in (None, [], {})}
+    payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"), default=str)
+    return "cube:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls that share a key.
+
+    Tracks how many flights were started, how many callers joined an existing
+    flight, and the largest number of waiters a single flight coalesced.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[str, int] = {}
+        self._callers: Dict[asyncio.Future, int] = {}
+        self.flights = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            self._waiters[key] = 0
+            self.flights += 1
+            task.add_done_callback(lambda t, key=key: self._finish(key, t))
+        else:
+            self.coalesced += 1
+            self._waiters[key] += 1
+        self._callers[task] = self._callers.get(task, 0) + 1
+        try:
+            # shield so one caller giving up does not cancel a call others still wait for
+            return await asyncio.shield(task)
+        finally:
+            self._callers[task] -= 1
+            if not self._callers[task]:
+                del self._callers[task]
+                if not task.done():
+                    # the last caller gave up (e.g. a hedged attempt that lost): stop the backend call
+                    if self._inflight.get(key) is task:
+                        del self._inflight[key]
+                        self._waiters.pop(key, None)
+                    task.cancel()
+
+    def _finish(self, key: str, task: asyncio.Future) -> None:
+        # a cancelled flight was already replaced; leave the new one alone
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            waiters = self._waiters.pop(key, 0)
+            self.max_waiters = max(self.max_waiters, waiters)
+            if waiters:
+                logger.info(f"{self.name} single-flight coalesced {waiters} waiters")
+        if not task.cancelled():
+            # mark the exception retrieved so failures with no waiters are not logged twice
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.flights + self.coalesced
+        return {
+            "in_flight": len(self._inflight),
+            "flights": self.flights,
+            "coalesced_waiters": self.coalesced,
+            "max_waiters_per_flight": self.max_waiters,
+            "coalesce_rate": round(self.coalesced / calls, 4) if calls else 0.0,
+        }
@@ -0,0 +1,345 @@
+"""
+Pre-execution guard for LLM-generated and client-supplied SQL.
+
+Every statement is checked before it reaches BigQuery:
+
+1. Parse: a single read-only SELECT/WITH statement, nothing else.
+2. Allow-list: only the mart tables in SCHEMA_SUMMARY, in the configured
+   project and dataset (CTE names are fine).
+3. Estimate: bytes processed from a BigQuery dry run (or a local stand-in,
+   e.g. the snapshot size for the DuckDB backend).
+4. Budget: a missing or oversized top-level LIMIT is capped; a query over
+   SQL_MAX_BYTES_SCANNED gets a trailing-window filter pushed down on the
+   partitioned marts (flagged on the answer, as totals then cover only that
+   window) and, if still too expensive, is downgraded to a
+   TABLESAMPLE of its table (single-table queries without aggregates,
+   whose answer is flagged as sampled) or rejected.
+
+Execution additionally sets maximum_bytes_billed so a bad estimate can never
+turn into a runaway job.
+"""
+
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Callable, Iterable, Tuple
+
+from sql_utils import canonicalize_sql, mask_literals, table_refs, cte_names
+
+logger = logging.getLogger(__name__)
+
+SQL_GUARD_ENABLED = os.environ.get("SQL_GUARD_ENABLED", "true").lower() == "true"
+SQL_MAX_BYTES_SCANNED = int(os.environ.get("SQL_MAX_BYTES_SCANNED", str(10 * 1024 ** 3)))
+SQL_MAX_ROWS = int(os.environ.get("SQL_MAX_ROWS", "10000"))
+# "sample" downgrades over-budget single-table, non-aggregate queries to a TABLESAMPLE; "reject" refuses them
+SQL_OVER_BUDGET = os.environ.get("SQL_OVER_BUDGET", "sample").lower()
+SQL_PUSHDOWN_DAYS = int(os.environ.get("SQL_PUSHDOWN_DAYS", "365"))
+SQL_MIN_SAMPLE_PERCENT = float(os.environ.get("SQL_MIN_SAMPLE_PERCENT", "1"))
+SQL_JOB_TIMEOUT_SECONDS = float(os.environ.get("SQL_JOB_TIMEOUT_SECONDS", "120"))
+SQL_GUARD_CACHE_TTL_SECONDS = float(os.environ.get("SQL_GUARD_CACHE_TTL_SECONDS", "300"))
+
+# DML/DDL keywords; qualified names and calls such as HLL_COUNT.MERGE(...) are not statements
+_FORBIDDEN_RE = re.compile(
+    r"(?<![\w.])(insert|update|delete|merge|create|drop|alter|truncate|grant|revoke|"
+    r"export|load|call|declare|set|execute|begin|commit|rollback)\b(?!\s*\()",
+    re.IGNORECASE
+)
+# Aggregates whose results a TABLESAMPLE would silently scale down or skew
+_AGGREGATE_RE = re.compile(
+    r"(?<![\w.])(count|countif|sum|avg|min|max|stddev\w*|variance|var_\w+|approx_\w+|"
+    r"array_agg|string_agg|logical_and|logical_or|any_value)\s*\(|\bhll_count\.\w+\s*\(",
+    re.IGNORECASE
+)
+_LIMIT_RE = re.compile(r"\blimit\s+(\d+)(\s+offset\s+\d+)?", re.IGNORECASE)
+_ALIAS_AFTER_RE = re.compile(r"\s+(?:as\s+)?([A-Za-z_]\w*)", re.IGNORECASE)
+_CLAUSE_KEYWORDS = {
+    "where", "group", "order", "having", "limit", "qualify", "window", "join", "inner",
+    "left", "right", "full", "cross", "on", "using", "union", "intersect", "except",
+    "tablesample", "for", "pivot", "unpivot",
+}
+
+
+class SQLRejected(Exception):
+    """The statement may not run; the message says why."""
+
+
+def check_read_only(sql: str) -> None:
+    """Raise SQLRejected unless sql is a single SELECT/WITH statement without DML or DDL."""
+    masked = mask_literals(canonicalize_sql(sql))
+    if not masked.strip():
+        raise SQLRejected("Empty statement")
+    if ";" in masked:
+        raise SQLRejected("Only a single statement is allowed")
+    if not re.match(r"\s*\(*\s*(select|with)\b", masked, re.IGNORECASE):
+        raise SQLRejected("Only SELECT queries are allowed")
+    forbidden = _FORBIDDEN_RE.search(masked)
+    if forbidden:
+        raise SQLRejected(f"Statement contains forbidden keyword {forbidden.group(1).upper()}")
+
+
+@dataclass
+class PartitionSpec:
+    field: str
+    data_type: str = "date"  # "date" or "timestamp"
+
+
+@dataclass
+class GuardResult:
+    """The statement to run plus what the guard did to it."""
+    sql: str
+    original_sql: str
+    bytes_estimated: Optional[int] = None
+    actions: List[str] = field(default_factory=list)
+    sampled_percent: Optional[float] = None
+    window_days: Optional[int] = None  # trailing window pushed into partitioned marts
+
+    @property
+    def note(self) -> Optional[str]:
+        """Caveat to show with the answer when it was not computed over all rows."""
+        caveats = []
+        if self.window_days is not None:
+            caveats.append(f"restricted to the last {self.window_days} days")
+        if self.sampled_percent is not None:
+            caveats.append(f"based on a {self.sampled_percent:g}% sample of the table")
+        if not caveats:
+            return None
+        return (f"Answer is {' and '.join(caveats)} because the full query was over the scan budget; "
+                f"it does not cover all data.")
+
+    def summary(self) -> Dict:
+        return {
+            "bytes_estimated": self.bytes_estimated,
+            "actions": self.actions,
+            "sampled_percent": self.sampled_percent,
+            "window_days": self.window_days,
+            "rewritten": bool(self.actions),
+            "note": self.note,
+        }
+
+
+# ============================================================================
+# Rewrites
+# ============================================================================
+
+def _depth_at(masked: str, position: int) -> int:
+    return masked.count("(", 0, position) - masked.count(")", 0, position)
+
+
+def enforce_limit(sql: str, max_rows: int) -> Tuple[str, Optional[str]]:
+    """Cap the top-level LIMIT at max_rows (appending one if missing); return (sql, action)."""
+    sql = canonicalize_sql(sql)
+    masked = mask_literals(sql)
+    top_level = [m for m in _LIMIT_RE.finditer(masked) if _depth_at(masked, m.start()) == 0]
+    if not top_level:
+        return f"{sql} LIMIT {max_rows}", f"limit:{max_rows}"
+    match = top_level[-1]
+    if int(match.group(1)) <= max_rows:
+        return sql, None
+    return sql[:match.start(1)] + str(max_rows) + sql[match.end(1):], f"limit:{max_rows}"
+
+
+def _has_alias(masked: str, end: int) -> bool:
+    match = _ALIAS_AFTER_RE.match(masked, end)
+    return bool(match) and match.group(1).lower() not in _CLAUSE_KEYWORDS
+
+
+def wrap_tables(sql: str, wrap: Callable[[str], Optional[str]]) -> Tuple[str, List[str]]:
+    """
+    Replace table references with derived tables.
+
+    wrap(bare_name) returns the body to select from (e.g. with a filter or a
+    TABLESAMPLE) or None to keep the reference. The derived table is aliased
+    to the bare name unless the query already gave it an alias, so column
+    references keep resolving.
+    """
+    masked = mask_literals(sql)
+    changed = []
+    for ref, start, end in reversed(table_refs(sql)):
+        name = ref.strip("`").split(".")[-1].lower()
+        body = wrap(name)
+        if body is None:
+            continue
+        alias = "" if _has_alias(masked, end) else f" AS {name}"
+        sql = f"{sql[:start]}(SELECT * FROM {ref}{body}){alias}{sql[end:]}"
+        changed.append(name)
+    return sql, changed
+
+
+def _window_filter(spec: PartitionSpec, days: int) -> str:
+    bound = f"DATE_SUB(CURRENT_DATE(), INTERVAL {days} DAY)"
+    if spec.data_type == "timestamp":
+        bound = f"TIMESTAMP({bound})"
+    return f" WHERE {spec.field} >= {bound}"
+
+
+# ============================================================================
+# Guard
+# ============================================================================
+
+class SQLGuard:
+    """
+    Validates, estimates and (if needed) rewrites a statement before it runs.
+
+    `estimate(sql)` returns (bytes_processed, referenced_tables or None); a
+    BigQuery dry run reports the tables it actually resolved, which closes
+    any gap left by the regex-based allow-list check. Verdicts are cached
+    per canonical SQL for SQL_GUARD_CACHE_TTL_SECONDS.
+    """
+
+    def __init__(
+        self,
+        allowed_tables: Iterable[str],
+        project: str,
+        dataset: str,
+        estimate: Callable[[str], Tuple[Optional[int], Optional[List[str]]]],
+        partitions: Optional[Dict[str, PartitionSpec]] = None,
+        max_bytes: int = SQL_MAX_BYTES_SCANNED,
+        max_rows: int = SQL_MAX_ROWS,
+        over_budget: str = SQL_OVER_BUDGET,
+        pushdown_days: int = SQL_PUSHDOWN_DAYS,
+        cache_ttl: float = SQL_GUARD_CACHE_TTL_SECONDS,
+        cache_entries: int = 512,
+    ):
+        self.allowed_tables = {t.lower() for t in allowed_tables}
+        self.project = project.lower()
+        self.dataset = dataset.lower()
+        self.estimate = estimate
+        self.partitions = partitions or {}
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.over_budget = over_budget
+        self.pushdown_days = pushdown_days
+        self.cache_ttl = cache_ttl
+        self.cache_entries = cache_entries
+        self._cache: "OrderedDict[str, Tuple[float, GuardResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"checked": 0, "rejected": 0, "rewritten": 0, "sampled": 0, "cache_hits": 0}
+
+    # -- stage 1 and 2 -------------------------------------------------------
+
+    def validate(self, sql: str) -> None:
+        """Raise SQLRejected unless sql is one read-only statement over allow-listed marts."""
+        check_read_only(sql)
+        ctes = set(cte_names(sql))
+        refs = [ref for ref, _, _ in table_refs(sql)]
+        if not refs:
+            raise SQLRejected("Query does not read any table")
+        self.check_tables(refs, ctes)
+
+    def check_tables(self, refs: Iterable[str], ctes: Iterable[str] = ()) -> None:
+        ctes = set(ctes)
+        for ref in refs:
+            parts = ref.strip("`").lower().split(".")
+            name = parts[-1]
+            if len(parts) == 1 and name in ctes:
+                continue
+            if name not in self.allowed_tables:
+                raise SQLRejected(f"Table {name} is not an allow-listed mart")
+            if len(parts) >= 2 and parts[-2] != self.dataset:
+                raise SQLRejected(f"Dataset {parts[-2]} is not allowed")
+            if len(parts) == 3 and parts[0] != self.project:
+                raise SQLRejected(f"Project {parts[0]} is not allowed")
+
+    # -- stage 3 -------------------------------------------------------------
+
+    def _estimate(self, sql: str) -> Optional[int]:
+        bytes_processed, resolved = self.estimate(sql)
+        if resolved:
+            self.check_tables(resolved)
+        return bytes_processed
+
+    # -- stage 4 -------------------------------------------------------------
+
+    def check(self, sql: str) -> GuardResult:
+        """Run every stage; return the statement to execute or raise SQLRejected."""
+        key = canonicalize_sql(sql)
+        now = time.monotonic()
+        with self._lock:
+            self._stats["checked"] += 1
+            cached = self._cache.get(key)
+            if cached and now - cached[0] < self.cache_ttl:
+                self._cache.move_to_end(key)
+                self._stats["cache_hits"] += 1
+                return cached[1]
+
+        try:
+            result = self._check(sql)
+        except SQLRejected:
+            with self._lock:
+                self._stats["rejected"] += 1
+            raise
+
+        with self._lock:
+            if result.actions:
+                self._stats["rewritten"] += 1
+            if result.sampled_percent is not None:
+                self._stats["sampled"] += 1
+            self._cache[key] = (now, result)
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    def _check(self, sql: str) -> GuardResult:
+        self.validate(sql)
+        limited, action = enforce_limit(sql, self.max_rows)
+        result = GuardResult(sql=limited, original_sql=sql, actions=[action] if action else [])
+        result.bytes_estimated = self._estimate(result.sql)
+        if result.bytes_estimated is None or result.bytes_estimated <= self.max_bytes:
+            return result
+
+        # push a trailing-window filter into partitioned marts the query does not filter itself
+        masked = mask_literals(result.sql).lower()
+
+        def pushdown(name: str) -> Optional[str]:
+            spec = self.partitions.get(name)
+            # leave tables alone when the query already filters on the partition column
+            if spec is None or re.search(rf"\bwhere\b.*\b{re.escape(spec.field.lower())}\b", masked, re.DOTALL):
+                return None
+            return _window_filter(spec, self.pushdown_days)
+
+        pushed_sql, pushed = wrap_tables(result.sql, pushdown)
+        if pushed:
+            estimate = self._estimate(pushed_sql)
+            result.sql = pushed_sql
+            result.bytes_estimated = estimate
+            result.window_days = self.pushdown_days
+            result.actions += [f"partition_filter:{name}:{self.pushdown_days}d" for name in pushed]
+            if estimate is None or estimate <= self.max_bytes:
+                return result
+
+        tables = {ref.strip("`").split(".")[-1].lower() for ref, _, _ in table_refs(result.sql)}
+        tables -= set(cte_names(result.sql))
+        over_budget = (f"Query would scan {result.bytes_estimated:,} bytes, "
+                       f"over the {self.max_bytes:,} byte budget")
+        if self.over_budget != "sample" or len(tables) != 1:
+            raise SQLRejected(over_budget)
+        if _AGGREGATE_RE.search(mask_literals(result.sql)):
+            # a sample would return a fraction of the true totals
+            raise SQLRejected(f"{over_budget}; aggregates cannot be answered from a sample, add a date filter")
+
+        percent = max(SQL_MIN_SAMPLE_PERCENT, min(99.0, 100.0 * self.max_bytes / result.bytes_estimated))
+        percent = float(f"{percent:.2g}")
+        table = next(iter(tables))
+        sampled_sql, _ = wrap_tables(
+            result.sql,
+            lambda name: f" TABLESAMPLE SYSTEM ({percent:g} PERCENT)" if name == table else None
+        )
+        # dry runs do not account for sampling; maximum_bytes_billed backs this estimate up
+        result.sql = sampled_sql
+        result.bytes_estimated = int(result.bytes_estimated * percent / 100)
+        result.sampled_percent = percent
+        result.actions.append(f"sample:{table}:{percent:g}%")
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                **self._stats,
+                "max_bytes": self.max_bytes,
+                "max_rows": self.max_rows,
+                "over_budget": self.over_budget,
+            }
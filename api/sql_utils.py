@@ -0,0 +1,136 @@
+"""
+Lightweight SQL helpers for the Retail Semantic Layer API.
+
+These are intentionally small, dependency-free utilities that understand just
+enough BigQuery SQL to build cache keys and find the tables a query reads.
+"""
+
+import re
+from typing import List, Iterator, Tuple
+
+# Matches string literals, backtick identifiers, comments and everything else
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+    | (?P<ident>`[^`]*`)
+    | (?P<comment>--[^\n]*|\#[^\n]*|/\*.*?\*/)
+    | (?P<space>\s+)
+    | (?P<other>[^'"`\s\-#/]+|[\-#/])
+    """,
+    re.VERBOSE | re.DOTALL
+)
+
+_REF = r"`[^`]+`|[A-Za-z_][\w\-]*(?:\.[A-Za-z_][\w\-]*)*"
+_ALIAS = r"(?:\s+(?:as\s+)?[A-Za-z_]\w*)?"
+
+# FROM/JOIN followed by one table reference or a comma-separated list of them
+_TABLE_REF_RE = re.compile(
+    rf"\b(?:from|join)\s+((?:{_REF}){_ALIAS}(?:\s*,\s*(?:{_REF}){_ALIAS})*)",
+    re.IGNORECASE
+)
+_SINGLE_REF_RE = re.compile(rf"\s*({_REF})", re.IGNORECASE)
+
+# FROM inside EXTRACT(part FROM x), TRIM(... FROM x) and SUBSTRING(x FROM n) is not a table
+_NOT_TABLE_FROM_RE = re.compile(r"\b(?:extract|trim|substring)\s*\([^()]*$", re.IGNORECASE)
+_CTE_RE = re.compile(r"(?:\bwith\s+(?:recursive\s+)?|,)\s*([A-Za-z_]\w*)\s+as\s*\(", re.IGNORECASE)
+_NOT_TABLES = {"unnest"}
+
+
+def tokenize_sql(sql: str) -> Iterator[Tuple[str, str]]:
+    """Yield (kind, text) tokens; kind is string, ident, comment, space or other."""
+    for match in _TOKEN_RE.finditer(sql):
+        yield match.lastgroup, match.group()
+
+
+def canonicalize_sql(sql: str) -> str:
+    """
+    Normalize SQL text for use as a cache key.
+
+    Comments are dropped, runs of whitespace outside literals collapse to a
+    single space, and trailing semicolons are removed. Literals and quoted
+    identifiers are kept verbatim so different queries never collide.
+    """
+    parts = []
+    for match in _TOKEN_RE.finditer(sql):
+        if match.lastgroup in ("comment", "space"):
+            if parts and parts[-1] != " ":
+                parts.append(" ")
+        else:
+            parts.append(match.group())
+    canonical = "".join(parts).strip()
+    while canonical.endswith(";"):
+        canonical = canonical[:-1].rstrip()
+    return canonical
+
+
+def mask_literals(sql: str) -> str:
+    """Blank out string literals and comments without changing character offsets."""
+    parts = []
+    for match in _TOKEN_RE.finditer(sql):
+        text = match.group()
+        if match.lastgroup == "string":
+            parts.append(text[0] + " " * (len(text) - 2) + text[-1])
+        elif match.lastgroup == "comment":
+            parts.append(" " * len(text))
+        else:
+            parts.append(text)
+    return "".join(parts)
+
+
+def strip_literals(sql: str) -> str:
+    """Replace string literals and comments with placeholders, keeping identifiers."""
+    parts = []
+    for match in _TOKEN_RE.finditer(sql):
+        kind = match.lastgroup
+        if kind == "string":
+            parts.append("''")
+        elif kind == "comment":
+            parts.append(" ")
+        else:
+            parts.append(match.group())
+    return "".join(parts)
+
+
+def table_refs(sql: str) -> List[Tuple[str, int, int]]:
+    """
+    Return (reference, start, end) for every table read in a FROM/JOIN clause.
+
+    References are returned as written (`project.dataset.table`, dataset.table
+    or table) with their offsets in `sql`; comma-separated FROM lists are
+    covered, UNNEST and the FROM of EXTRACT/TRIM/SUBSTRING are not tables.
+    """
+    masked = mask_literals(sql)
+    refs = []
+    for match in _TABLE_REF_RE.finditer(masked):
+        if _NOT_TABLE_FROM_RE.search(masked, 0, match.start()):
+            continue
+        position = match.start(1)
+        for item in match.group(1).split(","):
+            ref = _SINGLE_REF_RE.match(item)
+            start = position + ref.start(1)
+            name = ref.group(1)
+            if name.lower() not in _NOT_TABLES:
+                refs.append((sql[start:start + len(name)], start, start + len(name)))
+            position += len(item) + 1
+    return refs
+
+
+def cte_names(sql: str) -> List[str]:
+    """Return the lower-cased names defined in WITH clauses."""
+    return [name.lower() for name in _CTE_RE.findall(strip_literals(sql))]
+
+
+def referenced_tables(sql: str) -> List[str]:
+    """
+    Return the bare table names referenced in FROM/JOIN clauses.
+
+    `project.dataset.fct_daily_revenue` and fct_daily_revenue both resolve to
+    "fct_daily_revenue". CTE names are returned too; callers match them
+    against known models so they are harmless.
+    """
+    tables = []
+    for ref, _, _ in table_refs(sql):
+        name = ref.strip("`").split(".")[-1].lower()
+        if name and name not in tables:
+            tables.append(name)
+    return tables
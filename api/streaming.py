@@ -0,0 +1,227 @@
+"""
+Streaming and paginated delivery of BigQuery results.
+
+Rows are pulled from the BigQuery RowIterator one page at a time, so memory
+stays bounded by the page size no matter how large the answer is. Results can
+be streamed as NDJSON or Arrow IPC, and truncated answers carry an opaque
+cursor that clients hand back to fetch the next page. Cursors are signed
+with QUERY_CURSOR_SECRET so clients can only page through jobs this server
+ran, and their page size is capped at QUERY_MAX_PAGE_SIZE.
+"""
+
+import io
+import os
+import hmac
+import json
+import base64
+import asyncio
+import hashlib
+import logging
+import secrets
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Any, AsyncIterator, Iterator
+
+from columnar import ARROW_AVAILABLE, ARROW_STREAM_MEDIA_TYPE, rows_to_table, table_to_ipc
+
+if ARROW_AVAILABLE:
+    import pyarrow as pa
+
+try:
+    from google.api_core.exceptions import NotFound
+except ImportError:
+    class NotFound(Exception):
+        pass
+
+logger = logging.getLogger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+
+# Largest page a cursor or stream may request, whatever the client asks for
+QUERY_MAX_PAGE_SIZE = int(os.environ.get("QUERY_MAX_PAGE_SIZE", "10000"))
+
+# Without a configured secret, cursors only stay valid on the instance that issued them
+_CURSOR_SECRET = os.environ.get("QUERY_CURSOR_SECRET", "").encode("utf-8") or secrets.token_bytes(32)
+
+
+class CursorExpired(Exception):
+    """The job or cached result table behind a cursor no longer exists."""
+
+
+@dataclass
+class QueryResult:
+    """Rows returned to the caller plus enough state to page through the rest."""
+    rows: List[dict]
+    row_count: int
+    next_cursor: Optional[str] = None
+
+
+# ============================================================================
+# Cursors
+# ============================================================================
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode((text + "=" * (-len(text) % 4)).encode("ascii"))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_CURSOR_SECRET, payload.encode("ascii"), hashlib.sha256).digest())
+
+
+def encode_cursor(job_id: str, location: Optional[str], offset: int, page_size: int) -> str:
+    """Encode a signed, resumable position in a finished query job's result table."""
+    payload = _b64encode(json.dumps({"job": job_id, "loc": location, "off": offset, "size": page_size}).encode("utf-8"))
+    return f"{payload}.{_sign(payload)}"
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Decode a cursor produced by encode_cursor. Raises ValueError if malformed or not signed by us."""
+    try:
+        payload, signature = cursor.split(".")
+        if not hmac.compare_digest(signature, _sign(payload)):
+            raise ValueError("bad signature")
+        fields = json.loads(_b64decode(payload))
+        position = {
+            "job_id": str(fields["job"]),
+            "location": fields.get("loc"),
+            "offset": int(fields["off"]),
+            "page_size": min(int(fields["size"]), QUERY_MAX_PAGE_SIZE),
+        }
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if position["offset"] < 0 or position["page_size"] < 1:
+        raise ValueError("Invalid cursor: position out of range")
+    return position
+
+
+def next_cursor_for(query_job, offset: int, page_size: int, total_rows: int) -> Optional[str]:
+    """Return a cursor for the page starting at offset, or None when exhausted."""
+    if offset >= total_rows:
+        return None
+    return encode_cursor(query_job.job_id, query_job.location, offset, page_size)
+
+
+# ============================================================================
+# Page readers
+# ============================================================================
+
+def first_page(query_job, page_size: int) -> QueryResult:
+    """Fetch only the first page of a finished job instead of the full result."""
+    iterator = query_job.result(page_size=page_size)
+    page = next(iter(iterator.pages), [])
+    rows = [dict(row) for row in page]
+    total_rows = iterator.total_rows if iterator.total_rows is not None else len(rows)
+    return QueryResult(
+        rows=rows,
+        row_count=total_rows,
+        next_cursor=next_cursor_for(query_job, len(rows), page_size, total_rows)
+    )
+
+
+def read_page(bq_client, cursor: str) -> Dict[str, Any]:
+    """
+    Read the page a cursor points at from the job's destination table.
+
+    Raises ValueError for a malformed cursor and CursorExpired once BigQuery
+    has dropped the job or its temporary result table (after about a day).
+    """
+    position = decode_cursor(cursor)
+    try:
+        query_job = bq_client.get_job(position["job_id"], location=position["location"])
+        iterator = bq_client.list_rows(
+            query_job.destination,
+            start_index=position["offset"],
+            max_results=position["page_size"]
+        )
+        rows = [dict(row) for row in iterator]
+    except NotFound as e:
+        raise CursorExpired(f"Cursor expired, re-run the query: {e}")
+    total_rows = iterator.total_rows if iterator.total_rows is not None else position["offset"] + len(rows)
+    next_offset = position["offset"] + len(rows)
+    return {
+        "data": rows,
+        "row_count": len(rows),
+        "total_rows": total_rows,
+        "next_cursor": next_cursor_for(query_job, next_offset, position["page_size"], total_rows) if rows else None
+    }
+
+
+async def _iterate_in_thread(iterator: Iterator) -> AsyncIterator[Any]:
+    """Drive a blocking iterator from a worker thread, one item at a time."""
+    sentinel = object()
+    while True:
+        item = await asyncio.to_thread(next, iterator, sentinel)
+        if item is sentinel:
+            return
+        yield item
+
+
+# ============================================================================
+# Encoders
+# ============================================================================
+
+async def ndjson_stream(row_iterator, max_rows: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Yield one JSON document per row, flushing after every BigQuery page."""
+    sent = 0
+    async for page in _iterate_in_thread(iter(row_iterator.pages)):
+        lines = []
+        for row in page:
+            if max_rows is not None and sent >= max_rows:
+                break
+            lines.append(json.dumps(dict(row), default=str))
+            sent += 1
+        if lines:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+        if max_rows is not None and sent >= max_rows:
+            return
+
+
+def ndjson_rows(rows: List[dict]) -> Iterator[bytes]:
+    """Encode already-materialized rows (e.g. Cube results) as NDJSON."""
+    for row in rows:
+        yield (json.dumps(row, default=str) + "\n").encode("utf-8")
+
+
+def sse_event(event: str, data: Any) -> bytes:
+    """Encode one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n".encode("utf-8")
+
+
+def arrow_rows(rows: List[dict]) -> Iterator[bytes]:
+    """Encode already-materialized rows as a single-batch Arrow IPC stream."""
+    if not ARROW_AVAILABLE:
+        raise RuntimeError("pyarrow is not installed")
+    yield table_to_ipc(rows_to_table(rows))
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate(0)
+    return data
+
+
+async def arrow_stream(row_iterator, max_rows: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Yield an Arrow IPC stream, one record batch per BigQuery page."""
+    if not ARROW_AVAILABLE:
+        raise RuntimeError("pyarrow is not installed")
+    sink = io.BytesIO()
+    writer = None
+    sent = 0
+    async for batch in _iterate_in_thread(iter(row_iterator.to_arrow_iterable())):
+        if max_rows is not None and sent + batch.num_rows > max_rows:
+            batch = batch.slice(0, max_rows - sent)
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, batch.schema)
+        writer.write_batch(batch)
+        sent += batch.num_rows
+        yield _drain(sink)
+        if max_rows is not None and sent >= max_rows:
+            break
+    if writer is not None:
+        writer.close()
+        yield _drain(sink)
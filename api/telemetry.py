@@ -0,0 +1,164 @@
+"""
+Per-stage latency instrumentation for the NLQ pipeline.
+
+`stage("llm_generate")` times one step of a request. Each stage is
+recorded three ways:
+
+- a Prometheus histogram (`nlq_stage_duration_seconds{stage}`) exposed on
+  `/metrics` when prometheus_client is installed,
+- an OpenTelemetry span, exported over OTLP when the SDK is installed and
+  `OTEL_EXPORTER_OTLP_ENDPOINT` points at a collector (otherwise the
+  OpenTelemetry API records nothing),
+- an in-process summary (count, mean, max) reported by `/stats`.
+
+Spans follow the asyncio task and `asyncio.to_thread`, so the stages of
+one request nest under its HTTP request span.
+"""
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+try:
+    from opentelemetry import trace
+    OTEL_AVAILABLE = True
+except ImportError:
+    OTEL_AVAILABLE = False
+
+try:
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+    OTEL_SDK_AVAILABLE = True
+except ImportError:
+    OTEL_SDK_AVAILABLE = False
+
+TELEMETRY_ENABLED = os.environ.get("TELEMETRY_ENABLED", "true").lower() == "true"
+OTEL_SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "semantic-layer-api")
+OTEL_EXPORTER_OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT")
+
+# Seconds; spans LLM calls (seconds) down to cache hits (milliseconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+if PROMETHEUS_AVAILABLE:
+    STAGE_SECONDS = Histogram(
+        "nlq_stage_duration_seconds",
+        "Time spent in one stage of an API request",
+        ["stage"],
+        buckets=LATENCY_BUCKETS
+    )
+    REQUEST_SECONDS = Histogram(
+        "http_request_duration_seconds",
+        "HTTP request latency by route",
+        ["method", "route", "status"],
+        buckets=LATENCY_BUCKETS
+    )
+    ANSWERS = Counter(
+        "nlq_answers_total",
+        "Answered questions by planned route and actual execution source",
+        ["route", "source"]
+    )
+
+_tracer = trace.get_tracer(OTEL_SERVICE_NAME) if OTEL_AVAILABLE else None
+_lock = threading.Lock()
+_summary: Dict[str, list] = {}  # stage -> [count, total seconds, max seconds]
+_answers: Dict[Tuple[str, str], int] = {}
+
+
+def configure_tracing() -> bool:
+    """Install an OTLP exporter when a collector endpoint is configured; returns whether spans are exported."""
+    if not (TELEMETRY_ENABLED and OTEL_EXPORTER_OTLP_ENDPOINT):
+        return False
+    if not OTEL_SDK_AVAILABLE:
+        logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk/exporter are not installed")
+        return False
+    provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+    # the exporter reads OTEL_EXPORTER_OTLP_ENDPOINT / _HEADERS itself
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    logger.info(f"Exporting traces to {OTEL_EXPORTER_OTLP_ENDPOINT} as {OTEL_SERVICE_NAME}")
+    return True
+
+
+def _observe(name: str, seconds: float):
+    if PROMETHEUS_AVAILABLE:
+        STAGE_SECONDS.labels(stage=name).observe(seconds)
+    with _lock:
+        entry = _summary.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] = max(entry[2], seconds)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """An OpenTelemetry span without a latency metric (e.g. a whole HTTP request)."""
+    if not (TELEMETRY_ENABLED and _tracer):
+        yield None
+        return
+    with _tracer.start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+
+@contextmanager
+def stage(name: str, **attributes):
+    """Time one pipeline stage as a span plus a histogram observation."""
+    if not TELEMETRY_ENABLED:
+        yield None
+        return
+    start = time.perf_counter()
+    # the span records exceptions raised inside it and marks itself as failed
+    with span(name, **attributes) as current:
+        try:
+            yield current
+        finally:
+            _observe(name, time.perf_counter() - start)
+
+
+def record_request(method: str, route: str, status: int, seconds: float):
+    if TELEMETRY_ENABLED and PROMETHEUS_AVAILABLE:
+        REQUEST_SECONDS.labels(method=method, route=route, status=str(status)).observe(seconds)
+
+
+def record_answer(route: Optional[str], source: Optional[str]):
+    """Count how a question was answered: planned route vs. the source that served it."""
+    if not TELEMETRY_ENABLED:
+        return
+    key = (route or "unknown", source or "unknown")
+    if PROMETHEUS_AVAILABLE:
+        ANSWERS.labels(route=key[0], source=key[1]).inc()
+    with _lock:
+        _answers[key] = _answers.get(key, 0) + 1
+
+
+def metrics_payload() -> Tuple[bytes, str]:
+    """Prometheus exposition of the default registry; requires prometheus_client."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        stages = {
+            name: {"count": count, "mean_ms": round(total / count * 1000, 2), "max_ms": round(peak * 1000, 2)}
+            for name, (count, total, peak) in sorted(_summary.items())
+        }
+        answers = {f"{route}/{source}": count for (route, source), count in sorted(_answers.items())}
+    return {
+        "enabled": TELEMETRY_ENABLED,
+        "prometheus": PROMETHEUS_AVAILABLE,
+        "tracing": OTEL_AVAILABLE,
+        "stages": stages,
+        "answers": answers,
+    }
@@ -0,0 +1,42 @@
+import os
+import time
+
+from cache import DiskCache
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_entries=2)
+    cache.set("a", {"n": 1})
+    cache.set("b", {"n": 2})
+    assert cache.get("a") == {"n": 1}
+    cache.set("c", {"n": 3})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"n": 1}
+    assert sorted(os.listdir(tmp_path)) == ["a.json", "c.json"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_cache_respects_max_bytes(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=200)
+    for i in range(10):
+        cache.set(f"k{i}", "x" * 50)
+    assert cache.stats()["bytes"] <= 200
+    assert sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path)) <= 200
+    assert cache.get("k9") == "x" * 50
+
+
+def test_disk_cache_drops_expired_files_on_write(tmp_path):
+    cache = DiskCache(str(tmp_path), ttl_seconds=0.01)
+    cache.set("old", 1)
+    time.sleep(0.02)
+    cache.set("new", 2)
+    assert not (tmp_path / "old.json").exists()
+
+
+def test_disk_cache_limits_survive_restart(tmp_path):
+    cache = DiskCache(str(tmp_path), max_entries=5)
+    for i in range(5):
+        cache.set(f"k{i}", i)
+    reopened = DiskCache(str(tmp_path), max_entries=3)
+    assert reopened.stats()["size"] == 3
+    assert len(os.listdir(tmp_path)) == 3
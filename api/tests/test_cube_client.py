@@ -0,0 +1,39 @@
+import asyncio
+
+import httpx
+
+from cube_client import CubeClient
+
+
+def test_non_json_body_is_a_failed_query():
+    client = CubeClient(api_url="http://cube.test/cubejs-api/v1", max_retries=0)
+
+    async def load():
+        client._async_loop = asyncio.get_running_loop()
+        client._async_client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(200, text='{"data": [{"orders.co'))
+        )
+        try:
+            return await client.load_async({"measures": ["orders.count"]})
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(load()) is None
+
+
+def test_client_of_a_finished_loop_is_closed():
+    client = CubeClient(api_url="http://cube.test/cubejs-api/v1")
+
+    async def current_client():
+        return client.async_client
+
+    async def replace_client():
+        new = client.async_client
+        await asyncio.sleep(0)  # let the close task run
+        return new
+
+    old = asyncio.run(current_client())
+    new = asyncio.run(replace_client())
+    assert new is not old
+    assert old.is_closed
+    asyncio.run(new.aclose())
@@ -0,0 +1,89 @@
+import datetime
+
+import pytest
+
+from duckdb_backend import translate_bigquery_sql, DuckDBBackend, DUCKDB_AVAILABLE
+
+if DUCKDB_AVAILABLE:
+    import duckdb
+
+
+def run(sql: str):
+    connection = duckdb.connect()
+    connection.execute("CREATE TABLE orders AS SELECT TIMESTAMP '2024-03-15 10:30:00' AS created_at")
+    return connection.execute(translate_bigquery_sql(sql)).fetchone()
+
+
+def test_truncate_of_cast_is_not_rewritten_twice():
+    sql = translate_bigquery_sql("SELECT DATE_TRUNC(DATE(created_at), MONTH) FROM orders")
+    assert sql == "SELECT CAST(date_trunc('month', DATE(created_at)) AS DATE) FROM orders"
+
+
+def test_nested_calls_are_rewritten_inside_out():
+    sql = translate_bigquery_sql("SELECT DATE_TRUNC(DATE_SUB(CURRENT_DATE(), INTERVAL 1 MONTH), MONTH)")
+    assert sql == "SELECT CAST(date_trunc('month', CAST((CURRENT_DATE() - INTERVAL 1 MONTH) AS DATE)) AS DATE)"
+
+
+def test_same_function_nested_in_itself():
+    sql = translate_bigquery_sql("SELECT SAFE_DIVIDE(SAFE_DIVIDE(a, b), c)")
+    assert sql.count("CASE WHEN") == 2
+    assert "SAFE_DIVIDE" not in sql
+
+
+def test_unrecognized_call_keeps_rewritten_arguments():
+    sql = translate_bigquery_sql("SELECT DATE_TRUNC(COUNTIF(x > 1), MONTH, 'extra')")
+    assert sql == "SELECT DATE_TRUNC(count_if(x > 1), MONTH, 'extra')"
+
+
+def test_string_literals_are_untouched():
+    sql = translate_bigquery_sql("SELECT 'DATE_TRUNC(x, MONTH)' AS label")
+    assert sql == "SELECT 'DATE_TRUNC(x, MONTH)' AS label"
+
+
+@pytest.mark.skipif(not DUCKDB_AVAILABLE, reason="duckdb is not installed")
+def test_truncate_of_cast_runs():
+    assert run("SELECT DATE_TRUNC(DATE(created_at), MONTH) FROM orders") == (datetime.date(2024, 3, 1),)
+
+
+@pytest.mark.skipif(not DUCKDB_AVAILABLE, reason="duckdb is not installed")
+@pytest.mark.parametrize("part, expected", [
+    ("WEEK", datetime.date(2024, 6, 9)),  # Sunday
+    ("WEEK(SUNDAY)", datetime.date(2024, 6, 9)),
+    ("WEEK(MONDAY)", datetime.date(2024, 6, 10)),
+    ("ISOWEEK", datetime.date(2024, 6, 10)),
+    ("WEEK(SATURDAY)", datetime.date(2024, 6, 8)),
+])
+def test_week_truncation_matches_bigquery(part, expected):
+    # 2024-06-12 is a Wednesday
+    assert run(f"SELECT DATE_TRUNC(DATE '2024-06-12', {part})") == (expected,)
+
+
+@pytest.mark.skipif(not DUCKDB_AVAILABLE, reason="duckdb is not installed")
+def test_week_truncation_of_a_sunday_timestamp():
+    result = run("SELECT TIMESTAMP_TRUNC(TIMESTAMP '2024-06-16 10:00:00', WEEK)")
+    assert result == (datetime.datetime(2024, 6, 16),)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    pa = pytest.importorskip("pyarrow")
+    pq.write_table(pa.table({"order_id": list(range(25))}), tmp_path / "fct_orders.parquet")
+    backend = DuckDBBackend(marts_dir=str(tmp_path), mmap_snapshots=False)
+    yield backend
+    backend.close()
+
+
+@pytest.mark.skipif(not DUCKDB_AVAILABLE, reason="duckdb not installed")
+def test_execute_returns_one_page_and_the_total(backend):
+    result = backend.execute("SELECT order_id FROM fct_orders ORDER BY order_id", max_rows=10)
+    assert [row["order_id"] for row in result.rows] == list(range(10))
+    assert result.row_count == 25
+
+
+@pytest.mark.skipif(not DUCKDB_AVAILABLE, reason="duckdb not installed")
+@pytest.mark.parametrize("max_rows, expected", [(25, 25), (100, 25), (None, 25)])
+def test_execute_without_more_rows(backend, max_rows, expected):
+    result = backend.execute("SELECT order_id FROM fct_orders", max_rows=max_rows)
+    assert len(result.rows) == expected
+    assert result.row_count == 25
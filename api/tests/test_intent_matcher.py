@@ -0,0 +1,21 @@
+import pytest
+
+from intent_matcher import IntentMatcher
+
+
+@pytest.fixture
+def matcher():
+    queries = {intent: (lambda intent=intent: {"measures": [intent]}) for intent in ("total_revenue", "average_order_value")}
+    return IntentMatcher(queries, phrasings={})
+
+
+@pytest.mark.parametrize("question, intent", [
+    ("What's our total revenue?", "total_revenue"),
+    ("whats the total sales", "total_revenue"),
+    ("What is our average order value?", "average_order_value"),
+    ("What's the AOV", "average_order_value"),
+])
+def test_rules_match_contractions(matcher, question, intent):
+    match = matcher.match(question)
+    assert match.intent == intent
+    assert match.method == "rule"
@@ -0,0 +1,182 @@
+import os
+import re
+import time
+
+import pytest
+
+mart_snapshots = pytest.importorskip("mart_snapshots")
+pa = pytest.importorskip("pyarrow")
+
+from mart_snapshots import MartExporter, MartModel, SnapshotReader, load_manifest, verify_snapshot
+
+
+@pytest.fixture
+def exporter(tmp_path):
+    return MartExporter(client=None, project="proj", dataset="marts", snapshot_dir=str(tmp_path))
+
+
+def test_date_partition_filter_is_a_raw_column_range(exporter):
+    model = MartModel("fct_orders", "revenue", partition_field="order_date",
+                      partition_type="date", granularity="month")
+    assert exporter._partition_filter(model, "2024-06-01") == (
+        "order_date >= DATE '2024-06-01' AND order_date < DATE_ADD(DATE '2024-06-01', INTERVAL 1 MONTH)"
+    )
+
+
+def test_timestamp_partition_filter_casts_bounds(exporter):
+    model = MartModel("fct_sessions", "web", partition_field="session_start_at",
+                      partition_type="timestamp", granularity="year")
+    assert exporter._partition_filter(model, "2024-01-01") == (
+        "session_start_at >= TIMESTAMP(DATE '2024-01-01') "
+        "AND session_start_at < TIMESTAMP(DATE_ADD(DATE '2024-01-01', INTERVAL 1 YEAR))"
+    )
+
+
+def test_null_partition_filter(exporter):
+    model = MartModel("fct_orders", "revenue", partition_field="order_date",
+                      partition_type="date", granularity="month")
+    assert exporter._partition_filter(model, "null") == "order_date IS NULL"
+
+
+# ============================================================================
+# Export with a fake BigQuery client
+# ============================================================================
+
+ORDERS = MartModel("fct_orders", "revenue", partition_field="order_date",
+                   partition_type="date", granularity="month")
+
+
+class FakeJob:
+    def __init__(self, rows=None, table=None):
+        self.rows, self.table = rows, table
+
+    def result(self):
+        return self.rows
+
+    def to_arrow(self):
+        return self.table
+
+
+class FakeWarehouse:
+    """Serves metadata, fingerprint and download queries for one month-partitioned table."""
+
+    def __init__(self):
+        # export key -> (rows, last_modified, fingerprint)
+        self.partitions = {
+            "2024-05-01": ([1, 2], 1000, "11"),
+            "2024-06-01": ([3, 4, 5], 2000, "22"),
+        }
+        self.queries = []
+        self.metadata_available = True
+
+    def query(self, sql):
+        self.queries.append(sql)
+        if "INFORMATION_SCHEMA.PARTITIONS" in sql:
+            if not self.metadata_available:
+                raise RuntimeError("Access Denied")
+            return FakeJob(rows=[
+                # day partitions of a month roll up into its export key
+                {"partition_id": key.replace("-", "")[:6] + day, "total_rows": count,
+                 "last_modified": last_modified + offset}
+                for key, (rows, last_modified, _) in self.partitions.items()
+                for day, count, offset in (("01", len(rows) - 1, 0), ("15", 1, -5))
+            ])
+        keys = re.findall(r">= DATE '([\d-]+)'", sql) or list(self.partitions)
+        if "FARM_FINGERPRINT" in sql:
+            return FakeJob(rows=[
+                {"partition_key": key, "row_count": len(self.partitions[key][0]), "fingerprint": self.partitions[key][2]}
+                for key in keys
+            ])
+        return FakeJob(table=pa.table({"order_id": self.partitions[keys[0]][0]}))
+
+    def fingerprint_queries(self):
+        return [sql for sql in self.queries if "FARM_FINGERPRINT" in sql]
+
+    def downloads(self):
+        return [sql for sql in self.queries if sql.startswith("SELECT *")]
+
+
+@pytest.fixture
+def warehouse():
+    return FakeWarehouse()
+
+
+def export(warehouse, snapshot_dir, **kwargs):
+    exporter = MartExporter(client=warehouse, project="proj", dataset="marts", snapshot_dir=str(snapshot_dir))
+    warehouse.queries.clear()
+    return exporter.export([ORDERS], **kwargs)
+
+
+def test_first_export_writes_files_manifest_and_checksums(warehouse, tmp_path):
+    manifest = export(warehouse, tmp_path)
+    entry = manifest["models"]["fct_orders"]
+    assert entry["row_count"] == 5
+    assert sorted(entry["partitions"]) == ["2024-05-01", "2024-06-01"]
+    part = entry["partitions"]["2024-06-01"]
+    assert part["file"] == os.path.join("fct_orders", "2024-06-01.parquet")
+    assert part["last_modified"] == 2000
+    assert len(part["sha256"]) == 64
+    assert load_manifest(str(tmp_path)) == manifest
+    assert verify_snapshot(str(tmp_path)) == []
+
+
+def test_unchanged_partitions_are_not_scanned(warehouse, tmp_path):
+    export(warehouse, tmp_path)
+    export(warehouse, tmp_path)
+    assert warehouse.fingerprint_queries() == []
+    assert warehouse.downloads() == []
+
+
+def test_only_modified_partitions_are_fingerprinted_and_downloaded(warehouse, tmp_path):
+    export(warehouse, tmp_path)
+    warehouse.partitions["2024-06-01"] = ([3, 4, 5, 6], 3000, "33")
+    manifest = export(warehouse, tmp_path)
+    [fingerprint_sql] = warehouse.fingerprint_queries()
+    assert "DATE '2024-06-01'" in fingerprint_sql and "DATE '2024-05-01'" not in fingerprint_sql
+    assert len(warehouse.downloads()) == 1
+    assert manifest["models"]["fct_orders"]["partitions"]["2024-06-01"]["row_count"] == 4
+    assert verify_snapshot(str(tmp_path)) == []
+
+
+def test_touched_but_identical_partition_is_not_downloaded(warehouse, tmp_path):
+    export(warehouse, tmp_path)
+    rows, _, fingerprint = warehouse.partitions["2024-05-01"]
+    warehouse.partitions["2024-05-01"] = (rows, 5000, fingerprint)
+    manifest = export(warehouse, tmp_path)
+    assert len(warehouse.fingerprint_queries()) == 1
+    assert warehouse.downloads() == []
+    assert manifest["models"]["fct_orders"]["partitions"]["2024-05-01"]["last_modified"] == 5000
+
+
+def test_without_metadata_every_partition_is_fingerprinted(warehouse, tmp_path):
+    export(warehouse, tmp_path)
+    warehouse.metadata_available = False
+    export(warehouse, tmp_path)
+    [fingerprint_sql] = warehouse.fingerprint_queries()
+    assert "WHERE" not in fingerprint_sql
+    assert warehouse.downloads() == []
+
+
+def test_verify_snapshot_reports_missing_and_corrupt_files(warehouse, tmp_path):
+    export(warehouse, tmp_path)
+    os.remove(tmp_path / "fct_orders" / "2024-05-01.parquet")
+    with open(tmp_path / "fct_orders" / "2024-06-01.parquet", "ab") as f:
+        f.write(b"x")
+    problems = verify_snapshot(str(tmp_path))
+    assert any("2024-05-01" in p and "missing" in p for p in problems)
+    assert any("2024-06-01" in p and "checksum" in p for p in problems)
+
+
+def test_snapshot_reader_reloads_after_export(warehouse, tmp_path):
+    export(warehouse, tmp_path)
+    reader = SnapshotReader(str(tmp_path))
+    assert reader.table("fct_orders").num_rows == 5
+    assert reader.reload_if_changed() is False
+
+    warehouse.partitions["2024-06-01"] = ([3, 4, 5, 6], 3000, "33")
+    export(warehouse, tmp_path)
+    manifest_path = tmp_path / "_manifest.json"
+    later = time.time() + 10
+    os.utime(manifest_path, (later, later))
+    assert reader.reload_if_changed() is True
+    assert reader.table("fct_orders").num_rows == 6
@@ -0,0 +1,84 @@
+import pytest
+
+from query_planner import QueryPlanner, load_catalog, normalize_aggregate, YAML_AVAILABLE
+
+ORDERS = "`semantic-layer-484020.retail_marts_dev.fct_orders`"
+PRODUCTS = "`semantic-layer-484020.retail_marts_dev.fct_product_performance`"
+
+pytestmark = pytest.mark.skipif(not YAML_AVAILABLE, reason="PyYAML is not installed")
+
+
+@pytest.fixture(scope="module")
+def planner():
+    return QueryPlanner(load_catalog())
+
+
+def test_normalize_keeps_literal_case():
+    assert normalize_aggregate("COUNTIF( order_status = 'Returned' )") == "countif(order_status='Returned')"
+    assert normalize_aggregate("countif(order_status = 'returned')") != normalize_aggregate("countif(order_status = 'Returned')")
+
+
+def test_literal_matching_the_mart_is_rewritten(planner):
+    rewrite = planner.plan(f"SELECT COUNTIF(order_status = 'Returned') AS returned FROM {ORDERS}")
+    assert rewrite is not None
+    assert "sum(orders_returned)" in rewrite.sql
+
+
+def test_literal_with_different_case_is_left_alone(planner):
+    # 'returned' matches no order on fct_orders; the mart's count would change the answer
+    assert planner.plan(f"SELECT COUNTIF(order_status = 'returned') FROM {ORDERS}") is None
+
+
+def test_month_truncation_moves_to_monthly_mart(planner):
+    rewrite = planner.plan(
+        f"SELECT DATE_TRUNC(order_date, MONTH) AS month, SUM(total_revenue) AS revenue FROM {ORDERS} GROUP BY 1 ORDER BY 1"
+    )
+    assert rewrite.from_table == "fct_orders"
+    assert rewrite.to_table == "fct_monthly_revenue"
+    assert "DATE_TRUNC(order_month, MONTH)" in rewrite.sql
+    assert "sum(total_revenue) AS revenue" in rewrite.sql
+    assert "fct_orders" not in rewrite.sql
+
+
+@pytest.mark.parametrize("sql", [
+    f"SELECT order_date, SUM(total_revenue) FROM {ORDERS} WHERE order_date >= '2024-01-01' GROUP BY 1",
+    f"SELECT SUM(total_revenue) FROM {ORDERS} WHERE order_date >= DATE_SUB(CURRENT_DATE(), INTERVAL 30 DAY)",
+])
+def test_bare_date_stays_on_daily_mart(planner, sql):
+    rewrite = planner.plan(sql)
+    assert rewrite.to_table == "fct_daily_revenue"
+    assert "WHERE order_date >=" in rewrite.sql
+
+
+@pytest.mark.parametrize("sql", [
+    f"SELECT SUM(total_revenue) FROM {ORDERS} WHERE user_id = 5",
+    f"SELECT COUNT(*) FROM {ORDERS} WHERE order_status = 'Complete'",
+    f"SELECT user_id, SUM(total_revenue) FROM {ORDERS} GROUP BY 1",
+])
+def test_non_dimension_columns_are_not_rewritten(planner, sql):
+    assert planner.plan(sql) is None
+
+
+def test_day_of_week_is_not_moved_to_monthly_mart(planner):
+    rewrite = planner.plan(
+        f"SELECT EXTRACT(DAYOFWEEK FROM order_date) AS dow, SUM(total_revenue) FROM {ORDERS} GROUP BY 1"
+    )
+    assert rewrite.to_table == "fct_daily_revenue"
+    assert "EXTRACT(DAYOFWEEK FROM order_date)" in rewrite.sql
+
+
+def test_avg_becomes_ratio_of_sums(planner):
+    rewrite = planner.plan(f"SELECT DATE_TRUNC(order_date, MONTH) AS m, AVG(total_revenue) FROM {ORDERS} GROUP BY 1")
+    assert rewrite.to_table == "fct_monthly_revenue"
+    assert "safe_divide(sum(total_revenue), sum(total_orders))" in rewrite.sql
+
+
+def test_product_query_moves_to_category_mart(planner):
+    rewrite = planner.plan(f"SELECT category, SUM(total_revenue) AS revenue FROM {PRODUCTS} GROUP BY 1")
+    assert rewrite.from_table == "fct_product_performance"
+    assert rewrite.to_table == "fct_category_performance"
+    assert "fct_category_performance" in rewrite.sql
+
+
+def test_product_grain_query_stays_on_product_mart(planner):
+    assert planner.plan(f"SELECT product_name, SUM(total_revenue) FROM {PRODUCTS} GROUP BY 1") is None
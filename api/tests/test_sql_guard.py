@@ -0,0 +1,75 @@
+import pytest
+
+from sql_guard import PartitionSpec, SQLGuard, SQLRejected, check_read_only
+
+
+def make_guard(bytes_estimated, partitions=None):
+    estimate = bytes_estimated if callable(bytes_estimated) else (lambda sql: bytes_estimated)
+    return SQLGuard(
+        allowed_tables=["fct_orders", "fct_sessions", "fct_daily_revenue"],
+        project="proj",
+        dataset="marts",
+        estimate=lambda sql: (estimate(sql), None),
+        partitions=partitions,
+        max_bytes=1_000,
+        over_budget="sample",
+        pushdown_days=365,
+    )
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT HLL_COUNT.MERGE(customers_sketch) FROM marts.fct_orders",
+    "SELECT HLL_COUNT.MERGE (customers_sketch) FROM marts.fct_orders",
+    "SELECT t.set, t.load FROM marts.fct_orders t",
+    "SELECT * FROM marts.fct_orders WHERE note = 'delete me'",
+])
+def test_read_only_queries_pass(sql):
+    check_read_only(sql)
+    make_guard(10).check(sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM marts.fct_orders WHERE true",
+    "MERGE marts.fct_orders USING x ON true WHEN MATCHED THEN DELETE",
+    "SELECT 1; DROP TABLE marts.fct_orders",
+    "WITH x AS (SELECT 1) INSERT INTO marts.fct_orders SELECT * FROM x",
+    "",
+])
+def test_writes_are_rejected(sql):
+    with pytest.raises(SQLRejected):
+        check_read_only(sql)
+
+
+def test_over_budget_rows_are_sampled_and_flagged():
+    result = make_guard(10_000).check("SELECT order_id FROM marts.fct_orders")
+    assert "TABLESAMPLE SYSTEM (10 PERCENT)" in result.sql
+    assert result.sampled_percent == 10
+    assert "10% sample" in result.summary()["note"]
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT SUM(revenue) FROM marts.fct_orders",
+    "SELECT count(*) FROM marts.fct_orders",
+    "SELECT status, COUNTIF(returned) FROM marts.fct_orders GROUP BY status",
+    "SELECT HLL_COUNT.MERGE(customers_sketch) FROM marts.fct_orders",
+])
+def test_over_budget_aggregates_are_rejected(sql):
+    with pytest.raises(SQLRejected, match="sample"):
+        make_guard(10_000).check(sql)
+
+
+def test_window_pushdown_is_flagged():
+    guard = make_guard(
+        lambda sql: 500 if "DATE_SUB" in sql else 10_000,
+        partitions={"fct_daily_revenue": PartitionSpec("revenue_date")},
+    )
+    result = guard.check("SELECT SUM(total_revenue) FROM marts.fct_daily_revenue")
+    assert "revenue_date >= DATE_SUB(CURRENT_DATE(), INTERVAL 365 DAY)" in result.sql
+    assert result.window_days == 365
+    assert "last 365 days" in result.summary()["note"]
+
+
+def test_unchanged_query_has_no_note():
+    result = make_guard(10).check("SELECT SUM(total_revenue) FROM marts.fct_daily_revenue")
+    assert result.window_days is None
+    assert result.note is None
@@ -0,0 +1,42 @@
+import base64
+import json
+
+import pytest
+
+from streaming import QUERY_MAX_PAGE_SIZE, CursorExpired, NotFound, decode_cursor, encode_cursor, read_page
+
+
+class ExpiredClient:
+    def get_job(self, job_id, location=None):
+        raise NotFound(f"Not found: Job {job_id}")
+
+
+def test_expired_cursor_raises_cursor_expired():
+    cursor = encode_cursor("job_1", "US", 100, 50)
+    with pytest.raises(CursorExpired, match="re-run the query"):
+        read_page(ExpiredClient(), cursor)
+
+
+def test_malformed_cursor_is_a_value_error():
+    with pytest.raises(ValueError):
+        read_page(ExpiredClient(), "not-a-cursor")
+
+
+def test_cursor_round_trips():
+    cursor = encode_cursor("job_1", "US", 100, 50)
+    assert decode_cursor(cursor) == {"job_id": "job_1", "location": "US", "offset": 100, "page_size": 50}
+
+
+def test_forged_cursor_is_rejected():
+    payload = base64.urlsafe_b64encode(
+        json.dumps({"job": "someone_elses_job", "loc": "US", "off": 0, "size": 50}).encode()
+    ).decode().rstrip("=")
+    signature = encode_cursor("job_1", "US", 0, 50).split(".")[1]
+    for cursor in (payload, f"{payload}.{signature}"):
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            decode_cursor(cursor)
+
+
+def test_cursor_page_size_is_capped():
+    cursor = encode_cursor("job_1", "US", 0, QUERY_MAX_PAGE_SIZE * 100)
+    assert decode_cursor(cursor)["page_size"] == QUERY_MAX_PAGE_SIZE
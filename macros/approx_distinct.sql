@@ -0,0 +1,33 @@
+{#
+    Distinct counts that switch to HyperLogLog++ when the `approx_distinct`
+    var is true.
+
+    Exact `count(distinct ...)` shuffles every value to one place; the
+    approximate version keeps a fixed-size sketch per group instead (about
+    0.5% relative error at the default precision). Models that store
+    `hll_sketch` columns can be re-aggregated over any range of rows with
+    hll_count.merge(), so weekly/monthly/YTD unique counts never rescan the
+    raw facts.
+
+    Usage:
+        {{ distinct_count('user_id') }} as unique_customers
+        {% if var('approx_distinct', false) %}
+        {{ hll_sketch('user_id') }} as customer_sketch,
+        {% endif %}
+#}
+{% macro distinct_count(column) %}
+    {%- if var('approx_distinct', false) -%}
+    approx_count_distinct({{ column }})
+    {%- else -%}
+    count(distinct {{ column }})
+    {%- endif -%}
+{% endmacro %}
+
+
+{#
+    HyperLogLog++ sketch of `column` (NULLs are ignored) at the
+    `hll_precision` var (10-24, default 15).
+#}
+{% macro hll_sketch(column) %}
+    hll_count.init({{ column }}, {{ var('hll_precision', 15) }})
+{%- endmacro %}
@@ -0,0 +1,44 @@
+{#
+    Lower bound of the rows an incremental run re-processes.
+
+    Returns the newest value of `column` already loaded in {{ this }} minus
+    the `incremental_lookback_days` var, so rows that changed late (e.g. an
+    order shipped, returned or cancelled days after it was placed) are picked
+    up again and merged over their previous version. Falls back to the start
+    of time when the column is empty or not yet populated, which makes the
+    run rebuild everything.
+
+    `lookback` overrides the window with any BigQuery interval, e.g. '6 hour'.
+
+    Usage:
+        where order_updated_at >= {{ incremental_lookback_cutoff('order_updated_at') }}
+#}
+{% macro incremental_lookback_cutoff(column, data_type='timestamp', lookback=none) %}
+    {%- set lookback = lookback or (var('incremental_lookback_days', 3) ~ ' day') -%}
+    {%- if data_type == 'date' -%}
+    (
+        select coalesce(date_sub(max({{ column }}), interval {{ lookback }}), date '1900-01-01')
+        from {{ this }}
+    )
+    {%- else -%}
+    (
+        select coalesce(timestamp_sub(max({{ column }}), interval {{ lookback }}), timestamp '1900-01-01')
+        from {{ this }}
+    )
+    {%- endif -%}
+{% endmacro %}
+
+
+{#
+    Timestamp of the latest change to an order: the most recent of its
+    created/shipped/delivered/returned timestamps. Used as the incremental
+    watermark for order-grain models.
+#}
+{% macro latest_order_change(prefix='') %}
+    greatest(
+        {{ prefix }}created_at,
+        coalesce({{ prefix }}shipped_at, {{ prefix }}created_at),
+        coalesce({{ prefix }}delivered_at, {{ prefix }}created_at),
+        coalesce({{ prefix }}returned_at, {{ prefix }}created_at)
+    )
+{% endmacro %}
@@ -0,0 +1,107 @@
+{#
+    Association rules (support, confidence, lift) for item pairs bought together.
+
+    `baskets` must be a CTE/relation with one row per distinct (order_id, item_id).
+    Apriori pruning: a pair can only reach `min_pair_orders` co-occurrences if
+    both items appear in at least that many orders, so infrequent items and
+    baskets left with fewer than two frequent items are dropped before the
+    self-join. The output is identical to pairing every item, but the join
+    only sees the small frequent subset.
+
+    Returns item_id_a, item_id_b (a < b), co_occurrence_count, item_a_order_count,
+    item_b_order_count, total_order_count, support, confidence_a_to_b,
+    confidence_b_to_a and lift.
+#}
+{% macro market_basket_rules(baskets, min_pair_orders, min_lift=none) %}
+
+    total_orders as (
+        select {{ distinct_count('order_id') }} as total_order_count from {{ baskets }}
+    ),
+
+    item_stats as (
+        select
+            item_id,
+            count(*) as item_order_count
+        from {{ baskets }}
+        group by 1
+    ),
+
+    frequent_items as (
+        select b.order_id, b.item_id
+        from {{ baskets }} b
+        join item_stats s on b.item_id = s.item_id
+        where s.item_order_count >= {{ min_pair_orders }}
+    ),
+
+    -- a basket with a single frequent item cannot produce a pair
+    frequent_baskets as (
+        select order_id, item_id
+        from frequent_items
+        qualify count(*) over (partition by order_id) >= 2
+    ),
+
+    pairs as (
+        select
+            a.item_id as item_id_a,
+            b.item_id as item_id_b,
+            count(*) as co_occurrence_count
+        from frequent_baskets a
+        join frequent_baskets b on a.order_id = b.order_id
+        where a.item_id < b.item_id
+        group by 1, 2
+        having count(*) >= {{ min_pair_orders }}
+    ),
+
+    rules as (
+        select
+            p.item_id_a,
+            p.item_id_b,
+            p.co_occurrence_count,
+
+            sa.item_order_count as item_a_order_count,
+            sb.item_order_count as item_b_order_count,
+            t.total_order_count,
+
+            -- Support: P(A and B)
+            safe_divide(p.co_occurrence_count, t.total_order_count) as support,
+
+            -- Confidence: P(B|A) = P(A and B) / P(A)
+            safe_divide(p.co_occurrence_count, sa.item_order_count) as confidence_a_to_b,
+
+            -- Confidence: P(A|B) = P(A and B) / P(B)
+            safe_divide(p.co_occurrence_count, sb.item_order_count) as confidence_b_to_a,
+
+            -- Lift: P(A and B) / (P(A) * P(B))
+            safe_divide(
+                safe_divide(p.co_occurrence_count, t.total_order_count),
+                (safe_divide(sa.item_order_count, t.total_order_count) * safe_divide(sb.item_order_count, t.total_order_count))
+            ) as lift
+
+        from pairs p
+        join item_stats sa on p.item_id_a = sa.item_id
+        join item_stats sb on p.item_id_b = sb.item_id
+        cross join total_orders t
+    ),
+
+    filtered_rules as (
+        select * from rules
+        {% if min_lift is not none %}
+        where lift >= {{ min_lift }}
+        {% endif %}
+    )
+
+{% endmacro %}
+
+
+{#
+    Filter on order_date limiting affinity models to the trailing
+    `affinity_window_days` days (all history when the var is not set).
+#}
+{% macro affinity_window_filter(date_column='order_date') %}
+    {%- set window_days = var('affinity_window_days', none) -%}
+    {%- if window_days is not none -%}
+    {{ date_column }} >= date_sub(current_date(), interval {{ window_days }} day)
+    {%- else -%}
+    true
+    {%- endif -%}
+{% endmacro %}
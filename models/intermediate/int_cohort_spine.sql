@@ -0,0 +1,35 @@
+-- One row per signup cohort and calendar month from the cohort's first month
+-- to today, with the cohort size. Retention denominators come from here, so
+-- the cohort marts only need rows for user-months with activity.
+with users as (
+    select
+        signup_cohort,
+        date(date_trunc(created_at, month)) as cohort_month
+    from {{ ref('dim_users') }}
+),
+
+cohorts as (
+    select
+        signup_cohort,
+        cohort_month,
+        count(*) as cohort_size
+    from users
+    group by 1, 2
+),
+
+months as (
+    select distinct
+        date_trunc(date_key, month) as activity_month
+    from {{ ref('dim_date') }}
+)
+
+select
+    c.signup_cohort,
+    c.cohort_month,
+    m.activity_month,
+    date_diff(m.activity_month, c.cohort_month, month) as months_since_signup,
+    c.cohort_size
+from cohorts c
+join months m
+  on m.activity_month >= c.cohort_month
+ and m.activity_month <= date_trunc(current_date, month)
@@ -1,8 +1,26 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key='order_item_id',
+        incremental_strategy='merge',
+        on_schema_change='append_new_columns',
+        partition_by={'field': 'order_date', 'data_type': 'date', 'granularity': 'month'},
+        cluster_by=['order_date', 'user_id']
+    )
+}}
+
 with order_items as (
     select * from {{ ref('stg_order_items') }}
 ),
 orders as (
-    select * from {{ ref('stg_orders') }}
+    select
+        *,
+        {{ latest_order_change() }} as order_updated_at
+    from {{ ref('stg_orders') }}
+    {% if is_incremental() %}
+    -- only orders placed or changed since the last run (minus the lookback window)
+    where {{ latest_order_change() }} >= {{ incremental_lookback_cutoff('order_updated_at') }}
+    {% endif %}
 ),
 products as (
     select * from {{ ref('stg_products') }}
@@ -25,6 +43,7 @@ select
     o.shipped_at as order_shipped_at,
     o.delivered_at as order_delivered_at,
     o.returned_at as order_returned_at,
+    o.order_updated_at,
     date(o.created_at) as order_date,
     
     -- Financials
@@ -49,3 +68,6 @@ from order_items oi
 left join orders o on oi.order_id = o.order_id
 left join products p on oi.product_id = p.product_id
 left join users u on oi.user_id = u.user_id
+{% if is_incremental() %}
+where o.order_id is not null
+{% endif %}
@@ -1,18 +1,44 @@
 {{
     config(
-        materialized='table'
+        materialized='incremental',
+        unique_key='order_id',
+        incremental_strategy='merge',
+        on_schema_change='append_new_columns',
+        partition_by={'field': 'order_date', 'data_type': 'date', 'granularity': 'month'},
+        cluster_by=['order_date', 'user_id']
     )
 }}
 
 with orders as (
 
-    select * from {{ ref('stg_orders') }}
+    select
+        *,
+        {{ latest_order_change() }} as order_updated_at
+    from {{ ref('stg_orders') }}
+    {% if is_incremental() %}
+    -- only orders placed or changed since the last run (minus the lookback window)
+    where {{ latest_order_change() }} >= {{ incremental_lookback_cutoff('order_updated_at') }}
+    {% endif %}
 
 ),
 
 order_items_enriched as (
 
     select * from {{ ref('int_order_items_enriched') }}
+    {% if is_incremental() %}
+    where order_id in (select order_id from orders)
+    {% endif %}
+
+),
+
+-- Each user's first order over full history, so incremental batches still flag it correctly
+first_orders as (
+
+    select
+        user_id,
+        array_agg(order_id order by created_at, order_id limit 1)[offset(0)] as first_order_id
+    from {{ ref('stg_orders') }}
+    group by user_id
 
 ),
 
@@ -47,17 +73,19 @@ final as (
         o.shipped_at,
         o.delivered_at,
         o.returned_at,
+        o.order_updated_at,
         o.item_count,
         coalesce(m.total_revenue, 0) as total_revenue,
         coalesce(m.total_profit, 0) as total_profit,
         coalesce(m.line_item_count, 0) as line_item_count,
         
         -- Business logic
-        row_number() over (partition by o.user_id order by o.created_at) = 1 as is_first_order
+        o.order_id = f.first_order_id as is_first_order
         
     from orders o
     left join order_metrics m on o.order_id = m.order_id
     left join users u on o.user_id = u.user_id
+    left join first_orders f on o.user_id = f.user_id
 
 )
 
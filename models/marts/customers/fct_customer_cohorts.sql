@@ -1,59 +1,94 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key=['user_id', 'activity_month'],
+        incremental_strategy='merge',
+        partition_by={'field': 'activity_month', 'data_type': 'date', 'granularity': 'month'},
+        cluster_by=['signup_cohort', 'user_id']
+    )
+}}
+
+-- Sparse cohort activity: one row per user and month in which the user
+-- ordered. Months without orders are implied; cohort sizes for retention
+-- denominators come from int_cohort_spine. Incremental runs re-process the
+-- newest loaded month (it may have been partial) and append later ones.
+
 with users as (
-    select * from {{ ref('dim_users') }}
+    select
+        user_id,
+        signup_cohort,
+        date(date_trunc(created_at, month)) as cohort_month
+    from {{ ref('dim_users') }}
 ),
 
 months as (
-    select distinct 
+    select distinct
         date_trunc(date_key, month) as activity_month
     from {{ ref('dim_date') }}
 ),
 
-user_months as (
-    select 
-        u.user_id,
-        u.signup_cohort,
-        m.activity_month
-    from users u
-    cross join months m
-    where m.activity_month >= date(date_trunc(u.created_at, month))
-      and m.activity_month <= date_trunc(current_date, month)
-),
-
 orders as (
     select 
         user_id, 
         date(date_trunc(order_created_at, month)) as order_month,
         count(*) as monthly_orders,
         sum(item_count) as monthly_items,
-        Coalesce(sum(total_revenue), 0) as monthly_revenue
+        coalesce(sum(total_revenue), 0) as monthly_revenue
     from {{ ref('fct_orders') }}
+    {% if is_incremental() %}
+    where order_date >= (select coalesce(max(activity_month), date '1900-01-01') from {{ this }})
+    {% endif %}
     group by 1, 2
 ),
 
-joined as (
+active as (
     select
-        um.user_id,
-        um.signup_cohort,
-        um.activity_month,
-        date_diff(um.activity_month, date(date_trunc(u.created_at, month)), month) as months_since_signup,
+        o.user_id,
+        u.signup_cohort,
+        o.order_month as activity_month,
+        date_diff(o.order_month, u.cohort_month, month) as months_since_signup,
         
-        coalesce(o.monthly_orders, 0) as orders_in_month,
-        coalesce(o.monthly_items, 0) as items_in_month,
-        coalesce(o.monthly_revenue, 0) as revenue_in_month,
+        o.monthly_orders as orders_in_month,
+        o.monthly_items as items_in_month,
+        o.monthly_revenue as revenue_in_month,
         
-        case when coalesce(o.monthly_orders, 0) > 0 then true else false end as is_active
+        true as is_active
         
-    from user_months um
-    join users u on um.user_id = u.user_id
-    left join orders o on um.user_id = o.user_id and um.activity_month = o.order_month
+    from orders o
+    join users u on o.user_id = u.user_id
+    -- same month range as the cohort spine: signup month through the current month
+    join months m on o.order_month = m.activity_month
+    where o.order_month >= u.cohort_month
+      and o.order_month <= date_trunc(current_date, month)
+),
+
+{% if is_incremental() %}
+-- running totals carried over from months already loaded
+prior as (
+    select
+        user_id,
+        array_agg(struct(cumulative_orders, cumulative_revenue) order by activity_month desc limit 1)[offset(0)] as totals
+    from {{ this }}
+    where activity_month < (select coalesce(max(activity_month), date '1900-01-01') from {{ this }})
+    group by 1
 ),
+{% endif %}
 
 cumulative as (
     select
-        *,
-        sum(orders_in_month) over (partition by user_id order by activity_month) as cumulative_orders,
-        sum(revenue_in_month) over (partition by user_id order by activity_month) as cumulative_revenue
-    from joined
+        a.*,
+        {% if is_incremental() %}
+        coalesce(p.totals.cumulative_orders, 0) +
+        {% endif %}
+        sum(a.orders_in_month) over (partition by a.user_id order by a.activity_month) as cumulative_orders,
+        {% if is_incremental() %}
+        coalesce(p.totals.cumulative_revenue, 0) +
+        {% endif %}
+        sum(a.revenue_in_month) over (partition by a.user_id order by a.activity_month) as cumulative_revenue
+    from active a
+    {% if is_incremental() %}
+    left join prior p on a.user_id = p.user_id
+    {% endif %}
 )
 
 select * from cumulative
@@ -1,19 +1,40 @@
-with cohorts as (
-    select * from {{ ref('fct_customer_cohorts') }}
+with spine as (
+    select * from {{ ref('int_cohort_spine') }}
 ),
 
-agg as (
+activity as (
     select
         signup_cohort,
         months_since_signup,
-        count(distinct user_id) as cohort_size,
-        count(distinct case when is_active then user_id end) as active_customers,
-        sum(revenue_in_month) as total_revenue,
-        sum(cumulative_revenue) as total_cumulative_revenue
-    from cohorts
+        {{ distinct_count('user_id') }} as active_customers,
+        {% if var('approx_distinct', false) %}
+        {{ hll_sketch('user_id') }} as active_customer_sketch,
+        {% endif %}
+        sum(revenue_in_month) as total_revenue
+    from {{ ref('fct_customer_cohorts') }}
     group by 1, 2
 ),
 
+agg as (
+    select
+        s.signup_cohort,
+        s.months_since_signup,
+        s.cohort_size,
+        coalesce(a.active_customers, 0) as active_customers,
+        {% if var('approx_distinct', false) %}
+        a.active_customer_sketch,
+        {% endif %}
+        coalesce(a.total_revenue, 0) as total_revenue,
+        -- sum of every member's running revenue = running sum of the cohort's monthly revenue
+        sum(coalesce(a.total_revenue, 0)) over (
+            partition by s.signup_cohort order by s.months_since_signup
+        ) as total_cumulative_revenue
+    from spine s
+    left join activity a
+      on s.signup_cohort = a.signup_cohort
+     and s.months_since_signup = a.months_since_signup
+),
+
 final as (
     select
         signup_cohort,
@@ -21,6 +42,10 @@ final as (
         cohort_size,
         active_customers,
         safe_divide(active_customers, cohort_size) as retention_rate,
+        {% if var('approx_distinct', false) %}
+        -- hll_count.merge over a range of months counts customers active in any of them
+        active_customer_sketch,
+        {% endif %}
         total_revenue,
         safe_divide(total_revenue, active_customers) as avg_revenue_per_active_customer,
         safe_divide(total_cumulative_revenue, cohort_size) as cumulative_revenue_per_customer
@@ -0,0 +1,25 @@
+with baskets as (
+    select distinct order_id, category as item_id
+    from {{ ref('int_order_items_enriched') }}
+    where {{ affinity_window_filter() }}
+      and category is not null
+),
+
+{{ market_basket_rules('baskets', var('affinity_min_category_pair_orders', 10), var('affinity_min_lift', none)) }}
+
+select
+    item_id_a as category_a,
+    item_id_b as category_b,
+    co_occurrence_count,
+
+    item_a_order_count as category_a_order_count,
+    item_b_order_count as category_b_order_count,
+    total_order_count,
+
+    support,
+    confidence_a_to_b,
+    confidence_b_to_a,
+    lift
+
+from filtered_rules
+order by lift desc
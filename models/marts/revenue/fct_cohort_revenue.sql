@@ -1,21 +1,36 @@
-with cohort_activity as (
-    select * from {{ ref('fct_customer_cohorts') }}
+with spine as (
+    select * from {{ ref('int_cohort_spine') }}
 ),
 
-agg as (
+activity as (
     select
         signup_cohort,
-        activity_month as order_month,
-        months_since_signup,
-        
-        count(distinct user_id) as total_cohort_users, -- This varies per month if filter is active? No spine has all users.
-        count(distinct case when is_active then user_id end) as active_customers,
+        activity_month,
+        count(distinct user_id) as active_customers,
         sum(orders_in_month) as total_orders,
-        sum(revenue_in_month) as total_revenue,
-        sum(cumulative_revenue) as cumulative_revenue_total
+        sum(revenue_in_month) as total_revenue
+    from {{ ref('fct_customer_cohorts') }}
+    group by 1, 2
+),
+
+agg as (
+    select
+        s.signup_cohort,
+        s.activity_month as order_month,
+        s.months_since_signup,
+        
+        s.cohort_size as total_cohort_users,
+        coalesce(a.active_customers, 0) as active_customers,
+        coalesce(a.total_orders, 0) as total_orders,
+        coalesce(a.total_revenue, 0) as total_revenue,
+        sum(coalesce(a.total_revenue, 0)) over (
+            partition by s.signup_cohort order by s.activity_month
+        ) as cumulative_revenue_total
         
-    from cohort_activity
-    group by 1, 2, 3
+    from spine s
+    left join activity a
+      on s.signup_cohort = a.signup_cohort
+     and s.activity_month = a.activity_month
 )
 
 select
@@ -1,5 +1,24 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key='order_date',
+        incremental_strategy='merge',
+        on_schema_change='append_new_columns',
+        partition_by={'field': 'order_date', 'data_type': 'date', 'granularity': 'month'},
+        cluster_by=['order_date']
+    )
+}}
+
 with orders as (
     select * from {{ ref('fct_orders') }}
+    {% if is_incremental() %}
+    -- recompute every day that has an order placed or changed since the last run
+    where order_date in (
+        select distinct order_date
+        from {{ ref('fct_orders') }}
+        where order_updated_at >= {{ incremental_lookback_cutoff('last_order_updated_at') }}
+    )
+    {% endif %}
 ),
 
 daily as (
@@ -11,11 +30,18 @@ daily as (
         sum(total_revenue) as total_revenue,
         sum(total_profit) as total_profit,
         
-        count(distinct user_id) as unique_customers,
-        count(distinct case when is_first_order then user_id end) as new_customers,
+        {{ distinct_count('user_id') }} as unique_customers,
+        {{ distinct_count('case when is_first_order then user_id end') }} as new_customers,
+        {% if var('approx_distinct', false) %}
+        -- mergeable across days: hll_count.merge(customer_sketch) over any date range
+        {{ hll_sketch('user_id') }} as customer_sketch,
+        {{ hll_sketch('case when is_first_order then user_id end') }} as new_customer_sketch,
+        {% endif %}
         
         countif(order_status = 'Returned') as orders_returned,
-        countif(order_status = 'Cancelled') as orders_cancelled
+        countif(order_status = 'Cancelled') as orders_cancelled,
+
+        max(order_updated_at) as last_order_updated_at
 
     from orders
     group by 1
@@ -1,3 +1,18 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key='order_month',
+        incremental_strategy='merge',
+        on_schema_change='append_new_columns',
+        partition_by={'field': 'order_month', 'data_type': 'date', 'granularity': 'year'},
+        cluster_by=['order_month']
+    )
+}}
+
+-- fct_daily_revenue holds one row per day, so the month/window math below is
+-- always computed over full history; incremental runs only merge the months
+-- whose values can have changed (the earliest changed month and later, since
+-- the running totals and lags shift too).
 with daily as (
     select * from {{ ref('fct_daily_revenue') }}
 ),
@@ -9,7 +24,13 @@ monthly as (
         sum(total_revenue) as total_revenue,
         sum(total_profit) as total_profit,
         sum(new_customers) as new_customers,
-        count(distinct order_date) as active_days
+        {% if var('approx_distinct', false) %}
+        -- unique customers merged from the daily sketches, no rescan of fct_orders
+        hll_count.merge(customer_sketch) as unique_customers,
+        hll_count.merge_partial(customer_sketch) as customer_sketch,
+        {% endif %}
+        count(distinct order_date) as active_days,
+        max(last_order_updated_at) as last_order_updated_at
     from daily
     group by 1
 ),
@@ -28,4 +49,11 @@ select
     safe_divide(total_revenue - prev_month_revenue, prev_month_revenue) as mom_growth_pct,
     safe_divide(total_revenue - prev_year_revenue, prev_year_revenue) as yoy_growth_pct
 from windowed
+{% if is_incremental() %}
+where order_month >= (
+    select coalesce(min(date_trunc(order_date, month)), date '9999-12-01')
+    from daily
+    where last_order_updated_at >= {{ incremental_lookback_cutoff('last_order_updated_at') }}
+)
+{% endif %}
 order by order_month desc
@@ -0,0 +1,33 @@
+{{
+    config(
+        enabled=var('approx_distinct', false)
+    )
+}}
+
+-- Unique and new customers per week, month and year, merged from the daily
+-- HyperLogLog++ sketches in fct_daily_revenue (approx_distinct mode only).
+-- The current year's row is year-to-date. Any other range can be answered the
+-- same way: hll_count.merge(customer_sketch) over the days in the range.
+with daily as (
+    select order_date, customer_sketch, new_customer_sketch
+    from {{ ref('fct_daily_revenue') }}
+),
+
+periods as (
+    select 'week' as period_grain, date_trunc(order_date, isoweek) as period_start, * from daily
+    union all
+    select 'month' as period_grain, date_trunc(order_date, month) as period_start, * from daily
+    union all
+    select 'year' as period_grain, date_trunc(order_date, year) as period_start, * from daily
+)
+
+select
+    period_grain,
+    period_start,
+    max(order_date) as period_last_order_date,
+    hll_count.merge(customer_sketch) as unique_customers,
+    hll_count.merge(new_customer_sketch) as new_customers,
+    hll_count.merge_partial(customer_sketch) as customer_sketch
+from periods
+group by 1, 2
+order by 1, 2 desc
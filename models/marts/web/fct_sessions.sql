@@ -1,5 +1,30 @@
+{{
+    config(
+        materialized='incremental',
+        unique_key='session_id',
+        incremental_strategy='merge',
+        partition_by={'field': 'session_start_at', 'data_type': 'timestamp', 'granularity': 'month'},
+        cluster_by=['session_id']
+    )
+}}
+
 with events as (
     select * from {{ ref('stg_events') }}
+    {% if is_incremental() %}
+    -- re-aggregate only sessions with events since the last run; the reopening
+    -- window catches sessions that were still active when it ran. Their earlier
+    -- events are at most session_max_length older, which bounds the scan so
+    -- BigQuery can prune stg_events partitions.
+    where created_at >= timestamp_sub(
+            {{ incremental_lookback_cutoff('session_end_at', lookback=var('session_reopen_window', '6 hour')) }},
+            interval {{ var('session_max_length', '1 day') }}
+        )
+      and session_id in (
+        select distinct session_id
+        from {{ ref('stg_events') }}
+        where created_at >= {{ incremental_lookback_cutoff('session_end_at', lookback=var('session_reopen_window', '6 hour')) }}
+    )
+    {% endif %}
 ),
 
 session_agg as (
@@ -1,9 +1,37 @@
+{{
+    config(
+        materialized='incremental',
+        incremental_strategy='insert_overwrite',
+        on_schema_change='append_new_columns',
+        partition_by={'field': 'event_month', 'data_type': 'timestamp', 'granularity': 'month'},
+        cluster_by=['traffic_source']
+    )
+}}
+
+-- Incremental runs rebuild only the months that have a session updated since
+-- the last run; insert_overwrite replaces those month partitions wholesale.
+{% if is_incremental() %}
+with changed_months as (
+    select distinct timestamp_trunc(session_start_at, month) as event_month
+    from {{ ref('fct_sessions') }}
+    where session_end_at >= {{ incremental_lookback_cutoff('last_session_end_at', lookback=var('session_reopen_window', '6 hour')) }}
+),
+
+sessions as (
+{% else %}
 with sessions as (
+{% endif %}
     select * from {{ ref('fct_sessions') }}
+    {% if is_incremental() %}
+    where timestamp_trunc(session_start_at, month) in (select event_month from changed_months)
+    {% endif %}
 ),
 
 orders as (
     select user_id, order_created_at, total_revenue from {{ ref('fct_orders') }}
+    {% if is_incremental() %}
+    where timestamp_trunc(order_created_at, month) in (select event_month from changed_months)
+    {% endif %}
 ),
 
 session_revenue as (
@@ -13,6 +41,7 @@ session_revenue as (
         s.session_start_at,
         s.total_events,
         s.has_purchase,
+        s.session_end_at,
         coalesce(o.total_revenue, 0) as attribution_revenue
     from sessions s
     left join orders o 
@@ -30,7 +59,8 @@ monthly as (
         countif(has_purchase) as conversions,
         sum(attribution_revenue) as revenue,
         countif(total_events = 1) as bounce_sessions,
-        avg(total_events) as avg_events_per_session
+        avg(total_events) as avg_events_per_session,
+        max(session_end_at) as last_session_end_at
 
     from session_revenue
     group by 1, 2
@@ -1,5 +1,24 @@
+{{
+    config(
+        materialized='incremental',
+        incremental_strategy='insert_overwrite',
+        on_schema_change='append_new_columns',
+        partition_by={'field': 'event_date', 'data_type': 'date', 'granularity': 'day'},
+        cluster_by=['traffic_source']
+    )
+}}
+
+-- Incremental runs rebuild only the days that have a session updated since
+-- the last run; insert_overwrite replaces those day partitions wholesale.
 with sessions as (
     select * from {{ ref('fct_sessions') }}
+    {% if is_incremental() %}
+    where date(session_start_at) in (
+        select distinct date(session_start_at)
+        from {{ ref('fct_sessions') }}
+        where session_end_at >= {{ incremental_lookback_cutoff('last_session_end_at', lookback=var('session_reopen_window', '6 hour')) }}
+    )
+    {% endif %}
 ),
 
 daily as (
@@ -11,7 +30,8 @@ daily as (
         countif(page_views > 0) as sessions_with_product_view,
         countif(has_cart) as sessions_with_cart,
         countif(has_purchase) as sessions_with_purchase,
-        avg(session_duration_seconds) as avg_session_duration
+        avg(session_duration_seconds) as avg_session_duration,
+        max(session_end_at) as last_session_end_at
 
     from sessions
     group by 1, 2
@@ -8,6 +8,7 @@ final as (
 
     select
         order_id,
+        user_id,
         order_date,
         user_country,
         order_status,
@@ -3,10 +3,17 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import time
+import json
 import requests
 import os
 from datetime import datetime, timedelta
 
+try:
+    import pyarrow as pa
+    ARROW_AVAILABLE = True
+except ImportError:
+    ARROW_AVAILABLE = False
+
 # Page Config
 st.set_page_config(
     page_title="Retail Semantic Layer Demo",
@@ -17,6 +24,10 @@ st.set_page_config(
 # API Configuration
 API_URL = os.environ.get("API_URL", "https://semantic-api-5592650460.us-central1.run.app")
 
+# Ask the API for Arrow IPC so result frames load column-wise instead of from per-row dicts
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+DATA_HEADERS = {"Accept": f"{ARROW_MEDIA_TYPE}, application/json;q=0.5"} if ARROW_AVAILABLE else {}
+
 # --- REALISTIC FALLBACK DATA ---
 def get_fallback_data():
     """Realistic fallback data that matches actual BigQuery data patterns."""
@@ -69,6 +80,22 @@ if "use_fallback" not in st.session_state:
     st.session_state.use_fallback = False
 
 # --- API HELPERS ---
+def decode_api_response(response):
+    """Decode an API response into a dict whose "data" entry is a DataFrame."""
+    if response.headers.get("content-type", "").startswith(ARROW_MEDIA_TYPE):
+        table = pa.ipc.open_stream(response.content).read_all()
+        metadata = (table.schema.metadata or {}).get(b"semantic_layer", b"{}")
+        result = json.loads(metadata)
+        result["data"] = table.to_pandas()
+        return result
+    result = response.json()
+    result["data"] = pd.DataFrame(result.get("data") or [])
+    return result
+
+def has_rows(result) -> bool:
+    """True when a decoded API result carries at least one row."""
+    return bool(result) and result.get("data") is not None and not result["data"].empty
+
 def check_api_health():
     """Check API health and component status."""
     try:
@@ -89,13 +116,38 @@ def check_api_health():
 def call_cube_metrics(endpoint: str):
     """Call Cube metric endpoints."""
     try:
-        response = requests.get(f"{API_URL}/cube/metrics/{endpoint}", timeout=30)
+        response = requests.get(f"{API_URL}/cube/metrics/{endpoint}", headers=DATA_HEADERS, timeout=30)
         if response.status_code == 200:
-            return response.json()
+            return decode_api_response(response)
     except Exception as e:
         st.warning(f"Cube endpoint error: {e}")
     return None
 
+def call_batch(items, timeout: int = 60):
+    """
+    Run several API requests concurrently through one /batch call.
+
+    Returns {item id: result} where each result's "data" is a DataFrame and
+    failed or timed-out items map to None. Returns {} if /batch is unavailable.
+    """
+    try:
+        response = requests.post(f"{API_URL}/batch", json={"items": items}, stream=True, timeout=timeout)
+        response.raise_for_status()
+        results = {}
+        for line in response.iter_lines():
+            if not line:
+                continue
+            result = json.loads(line)
+            if result.get("status") == "ok":
+                result["data"] = pd.DataFrame(result.get("data") or [])
+                results[result["id"]] = result
+            else:
+                results[result["id"]] = None
+        st.session_state.api_status = "connected"
+        return results
+    except Exception:
+        return {}
+
 def call_semantic_api_with_retry(query: str, max_retries: int = 2, show_status: bool = True):
     """Call the NLQ API with retry logic and graceful fallback."""
     for attempt in range(max_retries):
@@ -106,10 +158,11 @@ def call_semantic_api_with_retry(query: str, max_retries: int = 2, show_status:
             response = requests.post(
                 f"{API_URL}/ask",
                 json={"query": query, "execute": True},
+                headers=DATA_HEADERS,
                 timeout=45
             )
             response.raise_for_status()
-            data = response.json()
+            data = decode_api_response(response)
             
             if data.get("error") == "LLM Generation Failed":
                 if attempt < max_retries - 1:
@@ -139,10 +192,11 @@ def call_semantic_api(query: str):
         response = requests.post(
             f"{API_URL}/ask",
             json={"query": query, "execute": True},
+            headers=DATA_HEADERS,
             timeout=45
         )
         response.raise_for_status()
-        data = response.json()
+        data = decode_api_response(response)
         if data.get("error"):
             st.warning(f"API Warning: {data.get('error')}")
             if data.get("sql"):
@@ -202,10 +256,17 @@ def load_data(mode):
         df_rev = pd.DataFrame()
         df_cat = pd.DataFrame()
         
+        # Fetch Cube revenue and categories in one concurrent batch; without /batch each is
+        # fetched on its own below, and a failed category item is retried on its own
+        batch = call_batch([
+            {"id": "revenue", "type": "metric", "metric": "revenue_daily", "params": {"days": 30}},
+            {"id": "category", "type": "ask", "query": "What are the total sales by category for the last 30 days?"},
+        ])
+        
         # Try Cube first for daily revenue (if available)
-        cube_revenue = call_cube_metrics("revenue/daily")
-        if cube_revenue and cube_revenue.get("data"):
-            df_rev = pd.DataFrame(cube_revenue.get("data", []))
+        cube_revenue = batch.get("revenue") if batch else call_cube_metrics("revenue/daily")
+        if has_rows(cube_revenue):
+            df_rev = cube_revenue["data"]
             # Rename Cube columns to match expected format
             col_map = {
                 "revenue_daily.date": "order_date",
@@ -214,24 +275,24 @@ def load_data(mode):
             }
             df_rev = df_rev.rename(columns=col_map)
         
-        # Fallback to Gemini NLQ if Cube unavailable
+        # Fallback to Gemini NLQ only if Cube returned no rows
         if df_rev.empty:
             trend_resp = call_semantic_api_with_retry(
                 "Show me daily revenue for the last 30 days", 
                 max_retries=2,
                 show_status=False
             )
-            if trend_resp and trend_resp.get("data"):
-                df_rev = pd.DataFrame(trend_resp.get("data", []))
+            if has_rows(trend_resp):
+                df_rev = trend_resp["data"]
         
         # Category data via Gemini (no Cube endpoint for this)
-        cat_resp = call_semantic_api_with_retry(
+        cat_resp = batch.get("category") or call_semantic_api_with_retry(
             "What are the total sales by category for the last 30 days?",
             max_retries=2,
             show_status=False
         )
-        if cat_resp and cat_resp.get("data"):
-            df_cat = pd.DataFrame(cat_resp.get("data", []))
+        if has_rows(cat_resp):
+            df_cat = cat_resp["data"]
         
         # Graceful fallback if APIs fail
         if df_rev.empty or df_cat.empty:
@@ -345,6 +406,22 @@ with tab3:
     if connection_mode == "Demo (Sample Data)":
         st.info("Switch to 'Live (Semantic API)' mode to query Cube metrics.")
     else:
+        if st.button("Fetch All Metrics", key="cube_all", help="Run every metric below in one concurrent batch"):
+            with st.spinner("Querying Cube..."):
+                metrics = [
+                    ("orders", "order_metrics", "📦 Order Metrics"),
+                    ("status", "orders_by_status", "📊 Orders by Status"),
+                    ("users", "user_metrics", "👥 User Metrics"),
+                    ("geo", "revenue_by_country", "🌍 Revenue by Country"),
+                ]
+                results = call_batch([{"id": key, "type": "metric", "metric": metric} for key, metric, _ in metrics])
+                if not results:
+                    st.warning("Batch endpoint not available.")
+                for key, _, title in metrics:
+                    if has_rows(results.get(key)):
+                        st.markdown(f"**{title}** · {results[key]['elapsed_ms']:.0f} ms")
+                        st.dataframe(results[key]["data"], hide_index=True)
+        
         col1, col2 = st.columns(2)
         
         with col1:
@@ -352,8 +429,8 @@ with tab3:
             if st.button("Fetch Order Summary", key="cube_orders"):
                 with st.spinner("Querying Cube..."):
                     result = call_cube_metrics("orders")
-                    if result and result.get("data"):
-                        st.json(result.get("data"))
+                    if has_rows(result):
+                        st.dataframe(result["data"], hide_index=True)
                     else:
                         st.warning("Cube not available. Make sure Cube server is running.")
             
@@ -361,9 +438,8 @@ with tab3:
             if st.button("Fetch Orders by Status", key="cube_status"):
                 with st.spinner("Querying Cube..."):
                     result = call_cube_metrics("orders/by-status")
-                    if result and result.get("data"):
-                        df = pd.DataFrame(result.get("data"))
-                        st.dataframe(df, hide_index=True)
+                    if has_rows(result):
+                        st.dataframe(result["data"], hide_index=True)
                     else:
                         st.warning("Cube not available.")
         
@@ -372,8 +448,8 @@ with tab3:
             if st.button("Fetch User Summary", key="cube_users"):
                 with st.spinner("Querying Cube..."):
                     result = call_cube_metrics("users")
-                    if result and result.get("data"):
-                        st.json(result.get("data"))
+                    if has_rows(result):
+                        st.dataframe(result["data"], hide_index=True)
                     else:
                         st.warning("Cube not available.")
             
@@ -381,9 +457,8 @@ with tab3:
             if st.button("Fetch Revenue by Country", key="cube_geo"):
                 with st.spinner("Querying Cube..."):
                     result = call_cube_metrics("revenue/by-country")
-                    if result and result.get("data"):
-                        df = pd.DataFrame(result.get("data"))
-                        st.dataframe(df, hide_index=True)
+                    if has_rows(result):
+                        st.dataframe(result["data"], hide_index=True)
                     else:
                         st.warning("Cube not available.")
         
@@ -413,12 +488,13 @@ with tab3:
                                 "dimensions": dimensions if dimensions else None,
                                 "limit": 50
                             },
+                            headers=DATA_HEADERS,
                             timeout=30
                         )
                         if response.status_code == 200:
-                            result = response.json()
+                            result = decode_api_response(response)
                             st.success(f"✅ Found {result.get('row_count', 0)} rows")
-                            st.dataframe(pd.DataFrame(result.get("data", [])), hide_index=True)
+                            st.dataframe(result["data"], hide_index=True)
                         else:
                             st.error(f"Cube query failed: {response.text}")
                     except Exception as e:
@@ -498,8 +574,8 @@ with tab4:
                     with st.expander("🔧 Generated SQL", expanded=False):
                         st.code(result.get("sql", ""), language="sql")
                 
-                if result.get("data"):
+                if has_rows(result):
                     st.success(f"✅ Found {result.get('row_count', 0)} records via {source.upper()}")
-                    st.dataframe(pd.DataFrame(result.get("data")), use_container_width=True, hide_index=True)
+                    st.dataframe(result["data"], use_container_width=True, hide_index=True)
                 elif not result.get("error"):
                     st.info("Query executed but returned no results.")